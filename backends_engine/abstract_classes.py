@@ -15,25 +15,42 @@ class BaseMediaProcessor(ABC):
         """Calculate the duration of the media file."""
         pass
 
+    def stream_metadata(self):
+        """Return stream metadata (container, codecs, resolution, frame rate, bit rate) of the media file."""
+        return {}
+
     def validate_media(self, max_size_mb, min_duration, max_duration):
         file_size = self.calculate_file_size()
+        self.validate_file_size(file_size, max_size_mb)
+
         duration = self.calculate_duration()
+        self.validate_duration(duration, min_duration, max_duration)
+
+        return file_size, duration
 
+    @staticmethod
+    def validate_file_size(file_size, max_size_mb):
         if file_size > max_size_mb:
             raise ValidationError(f"File size exceeds the maximum limit of {max_size_mb} MB.")
 
+    @staticmethod
+    def validate_duration(duration, min_duration, max_duration):
         if not (min_duration <= duration <= max_duration):
             raise ValidationError(f"Media duration must be between {min_duration} and {max_duration} seconds.")
 
-        return file_size, duration
-
     @abstractmethod
-    def trim_media(self, start_time, end_time):
-        """Trim the media from start_time to end_time and return the trimmed media file path."""
+    def trim_media(self, start_time, end_time, mode=None, profile=None):
+        """Trim the media from start_time to end_time with the given mode and profile and return the file path."""
         pass
 
+    def trim_media_batch(self, time_ranges, mode=None, profile=None):
+        """Trim every (start_time, end_time) range and return the trimmed media file paths in the same order."""
+        return [
+            self.trim_media(start_time, end_time, mode=mode, profile=profile) for start_time, end_time in time_ranges
+        ]
+
     @abstractmethod
-    def merge_media(self, media_files):
+    def merge_media(self, media_files, profile=None):
         """Merge the given list of media files and return the merged media file path."""
         pass
 
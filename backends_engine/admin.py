@@ -1,6 +1,20 @@
 from django.contrib import admin
-from backends_engine.models import VideoUpload, TrimmedVideo, MergedVideo
+from backends_engine.models import (
+    MediaBlob,
+    VideoUpload,
+    TrimmedVideo,
+    MergedVideo,
+    ProcessingJob,
+    DerivedArtifact,
+    DerivationCacheStats,
+    UploadSession,
+)
 
+admin.site.register(MediaBlob)
 admin.site.register(VideoUpload)
 admin.site.register(TrimmedVideo)
 admin.site.register(MergedVideo)
+admin.site.register(ProcessingJob)
+admin.site.register(DerivedArtifact)
+admin.site.register(DerivationCacheStats)
+admin.site.register(UploadSession)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BackendsEngineConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "backends_engine"
+
+    def ready(self):
+        import backends_engine.signals  # noqa: F401
+        from backends_engine.metrics import registry
+
+        registry.start_flusher()
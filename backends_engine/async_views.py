@@ -0,0 +1,203 @@
+"""Async views for the I/O-bound endpoints, served natively when the app runs on ASGI.
+
+A slow client downloading a shared video or paging through a list only holds a coroutine, not a
+worker thread. Writes (uploads, trims, merges) still go through the DRF viewsets, which run in a
+thread pool, so encoding never blocks the event loop.
+"""
+
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+
+from backends_engine.authentication import StaticTokenAuthentication
+from backends_engine.file_delivery import serve_file
+from backends_engine.media_storage import StoredFilePin
+from backends_engine.models import MergedVideo
+from backends_engine.shared_links import cached_link, link_cache, resolve_link, revoke_link
+from backends_engine.utils import (
+    LinkGenerator,
+    success_false_response,
+    success_true_response,
+    validate_expiry_minutes,
+    validate_merged_video_request,
+)
+
+logger_debug = logging.getLogger("debug")
+logger_info = logging.getLogger("info")
+logger_error = logging.getLogger("error")
+
+COLLECTION_WRITE_ACTIONS = {"post": "create"}
+ITEM_WRITE_ACTIONS = {"put": "update", "patch": "partial_update", "delete": "destroy"}
+
+
+def csrf_exempt_async(view):
+    # Django 4.2's csrf_exempt wraps views in a sync function, which would hide the coroutine.
+    view.csrf_exempt = True
+    return view
+
+
+def request_data(request):
+    if request.content_type == "application/json":
+        return json.loads(request.body or b"{}")
+    return request.POST
+
+
+def _read_viewset(viewset_class, request, action, **kwargs):
+    """A viewset instance set up as DRF's dispatch would, for reusing its queryset, serializer and paginator."""
+    viewset = viewset_class(action=action, format_kwarg=None, kwargs=kwargs, args=())
+    viewset.request = Request(request)
+    return viewset
+
+
+def async_model_endpoints(viewset_class):
+    """Return async (collection, item) views for the list and detail routes of a DRF viewset.
+
+    GET is answered natively with the viewset's own queryset, serializer and pagination; other methods
+    are delegated to the viewset in a worker thread.
+    """
+    write_actions = [
+        {method: action for method, action in actions.items() if hasattr(viewset_class, action)}
+        for actions in (COLLECTION_WRITE_ACTIONS, ITEM_WRITE_ACTIONS)
+    ]
+    collection_writes, item_writes = [
+        sync_to_async(viewset_class.as_view(actions)) if actions else None for actions in write_actions
+    ]
+
+    @csrf_exempt_async
+    async def collection(request):
+        if request.method != "GET":
+            if collection_writes is None:
+                return HttpResponseNotAllowed(["GET"])
+            return await collection_writes(request)
+
+        viewset = _read_viewset(viewset_class, request, "list")
+        paginator = viewset.paginator
+        page = await sync_to_async(paginator.paginate_queryset)(viewset.get_queryset(), viewset.request, view=viewset)
+        data = viewset.get_serializer(page, many=True).data
+        return JsonResponse(paginator.get_paginated_data(data))
+
+    @csrf_exempt_async
+    async def item(request, pk):
+        if request.method != "GET":
+            if item_writes is None:
+                return HttpResponseNotAllowed(["GET"])
+            return await item_writes(request, pk=pk)
+
+        viewset = _read_viewset(viewset_class, request, "retrieve", pk=pk)
+        try:
+            instance = await viewset.get_queryset().aget(pk=pk)
+        except (viewset_class.queryset.model.DoesNotExist, ValidationError):
+            return JsonResponse({"detail": "Not found."}, status=404)
+        return JsonResponse(viewset.get_serializer(instance).data)
+
+    return collection, item
+
+
+def _pinned_file_response(request, file_name, asynchronous):
+    pin = StoredFilePin(file_name)
+    return serve_file(request, pin.path, file_name, content_type="video/mp4", asynchronous=asynchronous, pin=pin)
+
+
+async def serve_shared_file(request, resolved):
+    # An async body only streams on ASGI; under WSGI Django would buffer the whole file to iterate it,
+    # so there the sync reader (and wsgi.file_wrapper) is used.
+    if not isinstance(request, ASGIRequest):
+        return _pinned_file_response(request, resolved.file_name, asynchronous=False)
+    # Resolving the path may fetch the video back from the object store, and the stat blocks too;
+    # neither runs on the event loop.
+    return await asyncio.to_thread(_pinned_file_response, request, resolved.file_name, True)
+
+
+@csrf_exempt_async
+async def shared_video(request):
+    token = request.GET.get("token")
+
+    if not token:
+        return JsonResponse({"success": False, "message": "Wrong link."}, status=400)
+
+    try:
+        # Popular links are answered from the in-process cache without leaving the event loop.
+        resolved = cached_link(token)
+        if resolved is not None:
+            try:
+                return await serve_shared_file(request, resolved)
+            except FileNotFoundError:
+                # The video may have been replaced or deleted since; resolve it again.
+                link_cache.pop(token)
+        resolved = await sync_to_async(resolve_link)(token)
+        return await serve_shared_file(request, resolved)
+
+    except FileNotFoundError:
+        link_cache.pop(token)
+        return JsonResponse(success_false_response(message="Video file not found"), status=404)
+    except MergedVideo.DoesNotExist:
+        return JsonResponse(success_false_response(message="Not found."), status=404)
+    except ValidationError as e:
+        message = " ".join(e.messages)
+        logger_error.error("Validation error occurred: %s", message)
+        return JsonResponse(success_false_response(message=message), status=400)
+
+
+@csrf_exempt_async
+async def link_share(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    logger_info.info("Received request to share video link.")
+    try:
+        StaticTokenAuthentication().authenticate(request)
+        data = request_data(request)
+        merged_video_id = validate_merged_video_request(data)
+        expiry_minutes = validate_expiry_minutes(data.get("expiry_minutes"))
+        merged_video = await MergedVideo.objects.aget(id=merged_video_id)
+        logger_debug.debug("Merged video validated: %s", merged_video_id)
+
+        # The MP4 and HLS links share one token, so one revocation withdraws both.
+        token = LinkGenerator.generate_token(merged_video_id, expiry_minutes)
+        data = {"link": LinkGenerator.generate_link(merged_video_id, token=token)}
+        if merged_video.hls_playlist:
+            data["hls_link"] = LinkGenerator.generate_hls_link(merged_video_id, token=token)
+        return JsonResponse(success_true_response(message="Link generated successfully.", data=data))
+
+    except AuthenticationFailed as e:
+        return JsonResponse(success_false_response(message=str(e.detail)), status=403)
+    except MergedVideo.DoesNotExist:
+        return JsonResponse({"detail": "Not found."}, status=404)
+    except (ValidationError, ValueError) as e:
+        message = " ".join(e.messages) if isinstance(e, ValidationError) else "Malformed request body."
+        logger_error.error("Validation error occurred: %s", message)
+        return JsonResponse(success_false_response(message=message), status=400)
+
+
+@csrf_exempt_async
+async def link_revoke(request):
+    """Revoke a shared link, given either its "token" or the whole "link"."""
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    try:
+        StaticTokenAuthentication().authenticate(request)
+        data = request_data(request)
+        token = data.get("token") or parse_qs(urlsplit(data.get("link", "")).query).get("token", [None])[0]
+        if not token:
+            raise ValidationError("Please provide the 'token' or 'link' to revoke.")
+        merged_video_id = await sync_to_async(revoke_link)(token)
+        logger_info.info("Shared link of merged video %s revoked", merged_video_id)
+        return JsonResponse(success_true_response(message="Link revoked.", data={"merged_video_id": merged_video_id}))
+
+    except AuthenticationFailed as e:
+        return JsonResponse(success_false_response(message=str(e.detail)), status=403)
+    except MergedVideo.DoesNotExist:
+        return JsonResponse({"detail": "Not found."}, status=404)
+    except (ValidationError, ValueError) as e:
+        message = " ".join(e.messages) if isinstance(e, ValidationError) else "Malformed request body."
+        logger_error.error("Validation error occurred: %s", message)
+        return JsonResponse(success_false_response(message=message), status=400)
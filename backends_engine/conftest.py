@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_media_root(tmp_path, settings, monkeypatch):
+    """Every test writes uploads, trims, merges, previews and HLS packages below its own tmp directory."""
+    media_root = str(tmp_path / "media")
+    settings.MEDIA_ROOT = media_root
+    # The media processor and trim executor read the settings module directly.
+    monkeypatch.setattr("media_management.settings.MEDIA_ROOT", media_root)
@@ -0,0 +1,80 @@
+import hashlib
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from backends_engine.media_probe import METADATA_FIELDS
+from backends_engine.models import MediaBlob, VideoUpload
+
+logger_debug = logging.getLogger("debug")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(media_file):
+    """SHA-256 of a file that was not hashed while it was received."""
+    hasher = hashlib.sha256()
+    media_file.seek(0)
+    for chunk in media_file.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    media_file.seek(0)
+    return hasher.hexdigest()
+
+
+def find_reusable_upload(content_hash):
+    """Return an existing upload with the same content, whose stored size, duration and metadata can be reused."""
+    return VideoUpload.objects.select_related("blob").filter(blob__sha256=content_hash).order_by("uploaded_at").first()
+
+
+def create_upload_from_existing(existing_upload):
+    """Create a new VideoUpload pointing at the blob of ``existing_upload`` without storing the bytes again."""
+    blob = existing_upload.blob
+    with transaction.atomic():
+        MediaBlob.objects.filter(id=blob.id).update(ref_count=F("ref_count") + 1)
+        video_upload = VideoUpload.objects.create(
+            file=blob.file.name,
+            blob=blob,
+            file_size=existing_upload.file_size,
+            duration=existing_upload.duration,
+            **{field: getattr(existing_upload, field) for field in METADATA_FIELDS},
+        )
+    logger_debug.debug("Upload %s deduplicated onto blob %s", video_upload.id, blob.sha256)
+    return video_upload
+
+
+def attach_blob(video_upload, content_hash):
+    """Register the freshly stored file of ``video_upload`` as the blob for ``content_hash``.
+
+    If a concurrent upload of the same content registered the blob first, the new file is dropped
+    and the upload is pointed at the existing blob instead.
+    """
+    try:
+        with transaction.atomic():
+            blob = MediaBlob.objects.create(
+                sha256=content_hash, file=video_upload.file.name, size_bytes=video_upload.file.size
+            )
+    except IntegrityError:
+        blob = MediaBlob.objects.get(sha256=content_hash)
+        MediaBlob.objects.filter(id=blob.id).update(ref_count=F("ref_count") + 1)
+        video_upload.file.storage.delete(video_upload.file.name)
+        video_upload.file = blob.file.name
+
+    video_upload.blob = blob
+    video_upload.save(update_fields=["blob", "file"])
+    return video_upload
+
+
+def release_blob(blob_id):
+    """Drop one reference to a blob; the blob row and its file go away with the last reference."""
+    with transaction.atomic():
+        MediaBlob.objects.filter(id=blob_id).update(ref_count=F("ref_count") - 1)
+        blob = MediaBlob.objects.filter(id=blob_id, ref_count__lte=0).first()
+        if blob is None:
+            return
+        file_name = blob.file.name
+        storage = blob.file.storage
+        blob.delete()
+
+    storage.delete(file_name)
+    logger_debug.debug("Blob %s released and %s deleted", blob.sha256, file_name)
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from backends_engine.models import DerivedArtifact, DerivationCacheStats, TrimmedVideo, MergedVideo, ProcessingJob
+from backends_engine.video_media_processor import encoder_settings, merge_encoder_settings
+
+logger_debug = logging.getLogger("debug")
+
+# Bump when a change to the trim or merge code alters the bytes it produces; every older key then misses.
+DERIVATION_VERSION = 2
+
+
+def derivation_key(operation, source, parameters):
+    payload = json.dumps(
+        {"version": DERIVATION_VERSION, "operation": operation, "source": source, "parameters": parameters},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def source_identity(video_upload):
+    # The content hash lets re-uploads of the same bytes share cached outputs; older uploads fall back to their id.
+    return f"sha256:{video_upload.blob.sha256}" if video_upload.blob_id else f"upload:{video_upload.id}"
+
+
+def trim_key(parent_video, start_time, end_time, mode, profile=None):
+    parameters = {
+        "start_time": float(start_time),
+        "end_time": float(end_time),
+        **encoder_settings(mode or settings.DEFAULT_TRIM_MODE, profile),
+    }
+    return derivation_key(ProcessingJob.TRIM, source_identity(parent_video), parameters)
+
+
+def merge_key(trimmed_videos, profile=None):
+    sources = [video.derivation_key or f"trimmed:{video.id}" for video in trimmed_videos]
+    return derivation_key(ProcessingJob.MERGE, sources, merge_encoder_settings(profile))
+
+
+def _count(operation, **increments):
+    stats, _ = DerivationCacheStats.objects.get_or_create(operation=operation)
+    DerivationCacheStats.objects.filter(id=stats.id).update(
+        **{field: F(field) + amount for field, amount in increments.items()}
+    )
+
+
+def lookup(operation, key):
+    """Return the cached file name for ``key`` and count a hit, or count a miss and return None."""
+    if not settings.DERIVATION_CACHE_ENABLED:
+        return None
+
+    artifact = DerivedArtifact.objects.filter(key=key).first()
+    if artifact is not None and not artifact.file.storage.exists(artifact.file.name):
+        # The file was removed behind the cache's back; forget the entry and produce it again.
+        artifact.delete()
+        artifact = None
+
+    if artifact is None:
+        _count(operation, misses=1)
+        return None
+
+    DerivedArtifact.objects.filter(id=artifact.id).update(hit_count=F("hit_count") + 1, last_used_at=timezone.now())
+    _count(operation, hits=1)
+    logger_debug.debug("Derivation cache hit for %s %s", operation, key)
+    return artifact.file.name
+
+
+def store(operation, key, file_name):
+    """Register a freshly produced output under ``key`` and return the file name callers should keep.
+
+    When a concurrent request stored the same key first, its file wins and ``file_name`` is deleted.
+    """
+    if not settings.DERIVATION_CACHE_ENABLED:
+        return file_name
+
+    size_bytes = default_storage.size(file_name) if default_storage.exists(file_name) else 0
+    try:
+        with transaction.atomic():
+            DerivedArtifact.objects.create(key=key, operation=operation, file=file_name, size_bytes=size_bytes)
+    except IntegrityError:
+        existing_file_name = DerivedArtifact.objects.get(key=key).file.name
+        if existing_file_name != file_name:
+            default_storage.delete(file_name)
+        return existing_file_name
+
+    evict(keep_key=key)
+    return file_name
+
+
+def _is_referenced(file_name):
+    return TrimmedVideo.objects.filter(file=file_name).exists() or MergedVideo.objects.filter(file=file_name).exists()
+
+
+def evict(max_bytes=None, keep_key=None):
+    """Drop least recently used entries until the cached outputs fit in ``max_bytes``; returns the count.
+
+    Files still referenced by a TrimmedVideo or MergedVideo stay on disk, only their cache entry goes.
+    ``keep_key`` protects an entry that was just stored and is not referenced by its rows yet.
+    """
+    if max_bytes is None:
+        max_bytes = settings.DERIVATION_CACHE_MAX_MB * 1024 * 1024
+
+    total_bytes = DerivedArtifact.objects.aggregate(total=Sum("size_bytes"))["total"] or 0
+    evicted = 0
+    while total_bytes > max_bytes:
+        artifact = DerivedArtifact.objects.exclude(key=keep_key).order_by("last_used_at").first()
+        if artifact is None:
+            break
+        artifact.delete()
+        total_bytes -= artifact.size_bytes
+        if not _is_referenced(artifact.file.name):
+            artifact.file.storage.delete(artifact.file.name)
+        _count(artifact.operation, evictions=1)
+        evicted += 1
+
+    if evicted:
+        logger_debug.debug("Derivation cache evicted %s entries", evicted)
+    return evicted
+
+
+def cache_stats():
+    """Hit/miss/eviction counters and current size per operation."""
+    sizes = {
+        row["operation"]: row
+        for row in DerivedArtifact.objects.values("operation").annotate(
+            entries=Count("id"), size_bytes=Sum("size_bytes")
+        )
+    }
+    stats = []
+    for counters in DerivationCacheStats.objects.order_by("operation"):
+        lookups = counters.hits + counters.misses
+        size = sizes.get(counters.operation, {})
+        stats.append(
+            {
+                "operation": counters.operation,
+                "hits": counters.hits,
+                "misses": counters.misses,
+                "evictions": counters.evictions,
+                "hit_rate": counters.hits / lookups if lookups else 0.0,
+                "entries": size.get("entries", 0),
+                "size_bytes": size.get("size_bytes") or 0,
+            }
+        )
+    return stats
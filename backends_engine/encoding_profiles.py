@@ -0,0 +1,54 @@
+from django.core.exceptions import ValidationError
+
+from media_management import settings
+
+
+def encoding_profile_names():
+    return list(settings.ENCODING_PROFILES)
+
+
+def validate_encoding_profile(name):
+    if name not in settings.ENCODING_PROFILES:
+        raise ValidationError(
+            f"Unsupported encoding profile: {name}. Allowed profiles are: {', '.join(encoding_profile_names())}"
+        )
+    return name
+
+
+def get_encoding_profile(name=None):
+    """Return the settings of the named profile (DEFAULT_ENCODING_PROFILE when ``name`` is empty)."""
+    return dict(settings.ENCODING_PROFILES[validate_encoding_profile(name or settings.DEFAULT_ENCODING_PROFILE)])
+
+
+def effective_threads(profile, threads=None):
+    """Encoder threads: the profile's own cap, further limited by the caller's CPU share when given."""
+    limits = [limit for limit in (profile.get("threads"), threads) if limit]
+    return min(limits) if limits else None
+
+
+def moviepy_encode_kwargs(profile, threads=None):
+    """Keyword arguments for ``VideoClip.write_videofile`` that apply ``profile``."""
+    return {
+        "codec": profile["video_codec"],
+        "preset": profile["preset"],
+        "audio_codec": profile["audio_codec"],
+        "audio_bitrate": profile["audio_bitrate"],
+        "threads": effective_threads(profile, threads),
+        "ffmpeg_params": ["-crf", str(profile["crf"]), "-pix_fmt", profile["pix_fmt"]],
+    }
+
+
+def ffmpeg_video_args(profile):
+    """Rate control and speed options of ``profile`` for a direct ffmpeg video encode."""
+    return ["-preset", profile["preset"], "-crf", str(profile["crf"])]
+
+
+def ffmpeg_encode_args(profile, threads=None):
+    """Complete ffmpeg codec options for re-encoding video and audio with ``profile``."""
+    thread_count = effective_threads(profile, threads)
+    return (
+        ["-c:v", profile["video_codec"]]
+        + ffmpeg_video_args(profile)
+        + ["-pix_fmt", profile["pix_fmt"], "-c:a", profile["audio_codec"], "-b:a", profile["audio_bitrate"]]
+        + (["-threads", str(thread_count)] if thread_count else [])
+    )
@@ -0,0 +1,116 @@
+import re
+import subprocess
+
+from moviepy.config import get_setting
+
+from backends_engine.metrics import ffmpeg_processes
+from backends_engine.profiling import span
+
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+BITRATE_PATTERN = re.compile(r"bitrate: (\d+) kb/s")
+VIDEO_STREAM_PATTERN = re.compile(
+    r"Stream #\d+:\d+.*?: Video: (?P<codec>\w+).*?, "
+    r"(?P<pix_fmt>[a-z0-9_]+)(?:\([^)]*\))?, (?P<width>\d+)x(?P<height>\d+)"
+)
+AUDIO_STREAM_PATTERN = re.compile(
+    r"Stream #\d+:\d+.*?: Audio: (?P<codec>\w+).*?, (?P<sample_rate>\d+) Hz, (?P<layout>[^,]+)"
+)
+FPS_PATTERN = re.compile(r"(\d+(?:\.\d+)?) fps")
+TIMEBASE_PATTERN = re.compile(r"(\d+(?:\.\d+)?k?) tbn")
+KEYFRAME_PATTERN = re.compile(r"pts_time:(-?\d+(?:\.\d+)?)")
+
+
+class FFmpegError(Exception):
+    pass
+
+
+def ffmpeg_binary():
+    # Use the same binary moviepy resolved so both code paths behave identically.
+    return get_setting("FFMPEG_BINARY")
+
+
+def run_ffmpeg(args, loglevel="error"):
+    """Run ffmpeg with the given arguments and return its stderr output."""
+    command = [ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", loglevel, "-y", *args]
+    ffmpeg_processes.inc(purpose="ffmpeg")
+    with span("ffmpeg"):
+        process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = process.stderr.decode("utf-8", errors="replace")
+    if process.returncode != 0:
+        raise FFmpegError(stderr.strip().splitlines()[-1] if stderr.strip() else "ffmpeg failed")
+    return stderr
+
+
+def stream_info(path):
+    """Return the container duration and the first video/audio stream parameters reported by ffmpeg."""
+    ffmpeg_processes.inc(purpose="probe")
+    with span("ffmpeg.probe"):
+        process = subprocess.run(
+            [ffmpeg_binary(), "-hide_banner", "-nostdin", "-i", path], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+    stderr = process.stderr.decode("utf-8", errors="replace")
+
+    info = {"duration": None, "bit_rate": None, "video": None, "audio": None}
+
+    duration = DURATION_PATTERN.search(stderr)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    bit_rate = BITRATE_PATTERN.search(stderr)
+    if bit_rate:
+        info["bit_rate"] = int(bit_rate.group(1)) * 1000
+
+    for line in stderr.splitlines():
+        video = VIDEO_STREAM_PATTERN.search(line)
+        if video and info["video"] is None:
+            fps = FPS_PATTERN.search(line)
+            timebase = TIMEBASE_PATTERN.search(line)
+            info["video"] = {
+                "codec": video.group("codec"),
+                "pix_fmt": video.group("pix_fmt"),
+                "width": int(video.group("width")),
+                "height": int(video.group("height")),
+                "fps": float(fps.group(1)) if fps else None,
+                "timebase": timebase.group(1) if timebase else None,
+            }
+            continue
+
+        audio = AUDIO_STREAM_PATTERN.search(line)
+        if audio and info["audio"] is None:
+            info["audio"] = {
+                "codec": audio.group("codec"),
+                "sample_rate": int(audio.group("sample_rate")),
+                "layout": audio.group("layout").strip(),
+            }
+
+    if info["video"] is None:
+        raise FFmpegError(f"No video stream found in {path}")
+
+    return info
+
+
+def keyframe_times(path):
+    """Return the presentation times (in seconds) of the keyframes of the first video stream.
+
+    Only keyframes are decoded (``-skip_frame nokey``), so this is cheap even for long inputs.
+    """
+    stderr = run_ffmpeg(
+        ["-skip_frame", "nokey", "-i", path, "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"], loglevel="info"
+    )
+    return sorted(float(match) for match in KEYFRAME_PATTERN.findall(stderr))
+
+
+def stream_signature(info):
+    """Parameters that must match for two files to be joined by packet-level concatenation."""
+    video, audio = info["video"], info["audio"]
+    video_signature = (
+        video["codec"],
+        video["pix_fmt"],
+        video["width"],
+        video["height"],
+        video["fps"],
+        video["timebase"],
+    )
+    audio_signature = (audio["codec"], audio["sample_rate"], audio["layout"]) if audio else None
+    return video_signature, audio_signature
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+OFFLOAD_X_ACCEL_REDIRECT = "x-accel-redirect"
+OFFLOAD_X_SENDFILE = "x-sendfile"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_etag(stat_result):
+    # Size and modification time change whenever the file is rewritten; no need to hash the content.
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def is_not_modified(request, etag, last_modified):
+    """Evaluate If-None-Match (which takes precedence) or If-Modified-Since against the file."""
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return "*" in etags or etag in etags or f"W/{etag}" in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def parse_byte_range(range_header, file_size):
+    """Return (first, last) for a single ``bytes=`` range, "unsatisfiable", or None to send the whole file.
+
+    Multi-range requests are answered with the full body, which RFC 9110 allows.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes.
+        suffix_length = int(last)
+        if suffix_length == 0:
+            return "unsatisfiable"
+        return max(0, file_size - suffix_length), file_size - 1
+
+    first = int(first)
+    last = min(int(last), file_size - 1) if last else file_size - 1
+    if first >= file_size or first > last:
+        return "unsatisfiable"
+    return first, last
+
+
+def _range_applies(request, etag, last_modified):
+    # If-Range: only honour the range when the client's copy is still current.
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def _read_range(file_path, first, length, chunk_size):
+    with open(file_path, "rb") as media_file:
+        media_file.seek(first)
+        remaining = length
+        while remaining > 0:
+            chunk = media_file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _aread_range(file_path, first, length, chunk_size):
+    """Async counterpart of _read_range: every blocking read runs in a thread, off the event loop."""
+    media_file = await asyncio.to_thread(open, file_path, "rb")
+    try:
+        await asyncio.to_thread(media_file.seek, first)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(media_file.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        media_file.close()
+
+
+def _offload_response(file_path, relative_name):
+    response = HttpResponse()
+    if settings.MEDIA_DELIVERY_OFFLOAD == OFFLOAD_X_ACCEL_REDIRECT:
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative_name
+    else:
+        response["X-Sendfile"] = file_path
+    # The proxy fills in the type from the file; an empty one keeps Django from sending text/html.
+    del response["Content-Type"]
+    return response
+
+
+def serve_file(request, file_path, relative_name, content_type, attachment=True, asynchronous=False, pin=None):
+    """Respond with the file at ``file_path`` without loading it into memory.
+
+    Supports conditional requests (ETag/Last-Modified, 304) and single byte ranges (206/416). With
+    MEDIA_DELIVERY_OFFLOAD set, the body is left to the front proxy via X-Accel-Redirect or X-Sendfile;
+    ``relative_name`` is the path below MEDIA_ROOT used for the internal redirect. ``attachment``
+    asks browsers to download rather than display the file. ``asynchronous`` streams the body from an
+    async iterator, for async views on ASGI where a slow client must not hold a worker thread.
+    ``pin`` (a StoredFilePin of the file) is released when a streamed body is closed, or right away
+    when the response has none.
+    """
+    try:
+        response = _file_response(request, file_path, relative_name, content_type, attachment, asynchronous)
+    except BaseException:
+        if pin is not None:
+            pin.release()
+        raise
+    if pin is not None:
+        if response.streaming:
+            # The body is read after the view returns; keep the copy until the server closes the response.
+            response._resource_closers.append(pin.release)
+        else:
+            pin.release()
+    return response
+
+
+def _file_response(request, file_path, relative_name, content_type, attachment, asynchronous):
+    read_range = _aread_range if asynchronous else _read_range
+    stat_result = os.stat(file_path)
+    file_size = stat_result.st_size
+    etag = file_etag(stat_result)
+    last_modified = stat_result.st_mtime
+
+    if is_not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    elif settings.MEDIA_DELIVERY_OFFLOAD in (OFFLOAD_X_ACCEL_REDIRECT, OFFLOAD_X_SENDFILE):
+        # The proxy handles Range itself when it serves the file.
+        response = _offload_response(file_path, relative_name)
+    else:
+        byte_range = None
+        range_header = request.META.get("HTTP_RANGE")
+        if range_header and _range_applies(request, etag, last_modified):
+            byte_range = parse_byte_range(range_header, file_size)
+
+        if byte_range == "unsatisfiable":
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{file_size}"
+        elif byte_range:
+            first, last = byte_range
+            length = last - first + 1
+            response = StreamingHttpResponse(
+                read_range(file_path, first, length, settings.MEDIA_STREAM_CHUNK_SIZE),
+                status=206,
+                content_type=content_type,
+            )
+            response["Content-Range"] = f"bytes {first}-{last}/{file_size}"
+            response["Content-Length"] = str(length)
+        elif asynchronous:
+            response = StreamingHttpResponse(
+                _aread_range(file_path, 0, file_size, settings.MEDIA_STREAM_CHUNK_SIZE), content_type=content_type
+            )
+            response["Content-Length"] = str(file_size)
+        else:
+            # FileResponse hands the open file to wsgi.file_wrapper, which servers can turn into sendfile().
+            response = FileResponse(open(file_path, "rb"), content_type=content_type)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if attachment and response.status_code != 304:
+        response["Content-Disposition"] = f'attachment; filename="{os.path.basename(file_path)}"'
+    return response
@@ -0,0 +1,153 @@
+import os
+import re
+import shutil
+import tempfile
+from urllib.parse import urlencode
+
+from django.conf import settings
+
+from backends_engine.encoding_profiles import get_encoding_profile
+from backends_engine.ffmpeg_tools import run_ffmpeg, stream_info
+from backends_engine.media_storage import delete_directory, local_media_path, publish_directory, stored_file_path
+
+HLS_DIRECTORY = "hls"
+MASTER_PLAYLIST = "master.m3u8"
+MAP_URI_PATTERN = re.compile(r'URI="([^"]+)"')
+
+
+def select_renditions(renditions, source_height):
+    """Renditions that do not upscale the source; the smallest one is kept when the source is tiny."""
+    selected = [rendition for rendition in renditions if rendition["height"] <= source_height]
+    if selected:
+        return selected
+    smallest = min(renditions, key=lambda rendition: rendition["height"])
+    return [dict(smallest, height=source_height - source_height % 2)]
+
+
+def rendition_args(rendition, segment_seconds, preset):
+    video_bit_rate = rendition["video_kbps"] * 1000
+    return (
+        ["-map", "0:v:0", "-map", "0:a:0?", "-vf", f"scale=-2:{rendition['height']}"]
+        + ["-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p"]
+        + ["-b:v", str(video_bit_rate), "-maxrate", str(video_bit_rate), "-bufsize", str(2 * video_bit_rate)]
+        # Keyframes exactly on segment boundaries, so every segment starts decodable.
+        + ["-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})", "-sc_threshold", "0"]
+        + ["-c:a", "aac", "-b:a", f"{rendition['audio_kbps']}k", "-ac", "2"]
+    )
+
+
+def hls_output_args(rendition_directory, segment_seconds):
+    return [
+        "-f",
+        "hls",
+        "-hls_time",
+        str(segment_seconds),
+        "-hls_playlist_type",
+        "vod",
+        "-hls_segment_type",
+        "fmp4",
+        "-hls_fmp4_init_filename",
+        "init.mp4",
+        "-hls_segment_filename",
+        os.path.join(rendition_directory, "seg_%05d.m4s"),
+        os.path.join(rendition_directory, "index.m3u8"),
+    ]
+
+
+def master_playlist(renditions, source_width, source_height):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for rendition in renditions:
+        width = round(source_width * rendition["height"] / source_height / 2) * 2
+        # Peak bandwidth: the capped video rate plus audio and roughly 10% container overhead.
+        bandwidth = int((rendition["video_kbps"] + rendition["audio_kbps"]) * 1000 * 1.1)
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{rendition['height']}")
+        lines.append(f"{rendition['name']}/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def package_hls(source_path, output_directory, renditions=None, segment_seconds=None, profile=None):
+    """Write ``source_path`` as HLS (fMP4 segments) into ``output_directory`` and return the renditions used.
+
+    Every rendition gets ``<name>/index.m3u8``, ``init.mp4`` and ``seg_NNNNN.m4s`` files next to a
+    ``master.m3u8``. The package is assembled in a scratch directory and moved into place at the end,
+    so a half-written package is never served.
+    """
+    renditions = renditions or settings.HLS_RENDITIONS
+    segment_seconds = segment_seconds or settings.HLS_SEGMENT_SECONDS
+    preset = get_encoding_profile(profile)["preset"]
+
+    video = stream_info(source_path)["video"]
+    renditions = select_renditions(renditions, video["height"])
+
+    parent_directory = os.path.dirname(output_directory)
+    os.makedirs(parent_directory, exist_ok=True)
+    work_directory = tempfile.mkdtemp(prefix=".packaging_", dir=parent_directory)
+    try:
+        for rendition in renditions:
+            rendition_directory = os.path.join(work_directory, rendition["name"])
+            os.makedirs(rendition_directory)
+            run_ffmpeg(
+                ["-i", source_path]
+                + rendition_args(rendition, segment_seconds, preset)
+                + hls_output_args(rendition_directory, segment_seconds)
+            )
+
+        with open(os.path.join(work_directory, MASTER_PLAYLIST), "w") as playlist_file:
+            playlist_file.write(master_playlist(renditions, video["width"], video["height"]))
+
+        shutil.rmtree(output_directory, ignore_errors=True)
+        os.replace(work_directory, output_directory)
+    except Exception:
+        shutil.rmtree(work_directory, ignore_errors=True)
+        raise
+    return renditions
+
+
+def package_merged_video(merged_video, profile=None):
+    """Package a merged video as HLS under MEDIA_ROOT/hls/<id>/, publish it and record its master playlist."""
+    relative_directory = os.path.join(HLS_DIRECTORY, str(merged_video.id))
+    with local_media_path(merged_video.file) as source_path:
+        package_hls(source_path, os.path.join(settings.MEDIA_ROOT, relative_directory), profile=profile)
+    publish_directory(relative_directory)
+
+    merged_video.hls_playlist = os.path.join(relative_directory, MASTER_PLAYLIST)
+    merged_video.save(update_fields=["hls_playlist"])
+    return merged_video
+
+
+def delete_hls_package(merged_video):
+    if merged_video.hls_playlist:
+        delete_directory(os.path.dirname(merged_video.hls_playlist))
+
+
+def resolve_hls_asset(merged_video, asset):
+    """Absolute local path of ``asset`` inside the video's HLS package, or None if it is missing or outside it.
+
+    ``merged_video`` may be a MergedVideo or the ResolvedLink of a shared link; only ``hls_playlist`` is read.
+    An evicted asset is fetched back from the object store.
+    """
+    if not merged_video.hls_playlist:
+        return None
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    package_directory = os.path.realpath(os.path.join(media_root, os.path.dirname(merged_video.hls_playlist)))
+    asset_path = os.path.realpath(os.path.join(package_directory, asset))
+    if os.path.commonpath([package_directory, asset_path]) != package_directory:
+        return None
+    try:
+        asset_path = stored_file_path(os.path.relpath(asset_path, media_root))
+    except OSError:
+        return None
+    return asset_path if os.path.isfile(asset_path) else None
+
+
+def tokenize_playlist(playlist, token):
+    """Append the share token to every URI of a playlist; relative URIs do not inherit the query string."""
+    query = urlencode({"token": token})
+    lines = []
+    for line in playlist.splitlines():
+        if line and not line.startswith("#"):
+            line = f"{line}?{query}"
+        elif line.startswith("#EXT-X-MAP:"):
+            line = MAP_URI_PATTERN.sub(lambda match: f'URI="{match.group(1)}?{query}"', line)
+        lines.append(line)
+    return "\n".join(lines) + "\n"
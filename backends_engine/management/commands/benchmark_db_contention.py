@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from media_management.database import apply_sqlite_pragmas
+
+# (journal mode, busy timeout in ms, synchronous level): the SQLite defaults without and with a busy
+# handler, then the tuned configuration.
+MODES = {
+    "rollback": ("delete", 0, "full"),
+    "rollback+busy": ("delete", 5000, "full"),
+    "wal": ("wal", 5000, "normal"),
+}
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS upload (id TEXT PRIMARY KEY, size REAL, created_at REAL);"
+    "CREATE TABLE IF NOT EXISTS upload_stats (id INTEGER PRIMARY KEY, uploads INTEGER);"
+    "INSERT OR IGNORE INTO upload_stats VALUES (1, 0);"
+)
+
+
+def open_connection(database_path, mode):
+    # timeout=0 disables sqlite3's own busy handler so only the PRAGMA under test applies.
+    connection = sqlite3.connect(database_path, timeout=0, isolation_level=None)
+    apply_sqlite_pragmas(connection.cursor(), *MODES[mode])
+    return connection
+
+
+def write_upload(connection):
+    """Insert an upload and bump a counter in one transaction, like the upload and trim paths do."""
+    try:
+        connection.execute("BEGIN")
+        connection.execute("INSERT INTO upload VALUES (?, ?, ?)", (str(uuid.uuid4()), 10.0, time.time()))
+        connection.execute("UPDATE upload_stats SET uploads = uploads + 1 WHERE id = 1")
+        connection.execute("COMMIT")
+    except sqlite3.OperationalError:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+
+
+def read_uploads(connection):
+    """Page through the newest uploads, as the list endpoints do."""
+    connection.execute("SELECT id, size FROM upload ORDER BY created_at DESC LIMIT 50").fetchall()
+
+
+def run_worker(kind, database_path, mode, operations, results):
+    operation = write_upload if kind == "write" else read_uploads
+    completed = errors = 0
+    try:
+        connection = open_connection(database_path, mode)
+    except sqlite3.OperationalError:
+        # Even configuring the connection can hit the lock without a busy timeout.
+        results.put((kind, 0, operations))
+        return
+    for _ in range(operations):
+        try:
+            operation(connection)
+            completed += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    connection.close()
+    results.put((kind, completed, errors))
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent SQLite writers and readers under each journal/busy-timeout configuration."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4, help="Writer processes.")
+        parser.add_argument("--readers", type=int, default=4, help="Reader processes.")
+        parser.add_argument("--operations", type=int, default=300, help="Operations per process.")
+        parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+
+    def handle(self, *args, **options):
+        work_directory = tempfile.mkdtemp(prefix="db_contention_")
+        try:
+            self.stdout.write(
+                f"{'mode':<14} {'writes/s':>9} {'write errors':>13} {'reads/s':>9} {'read errors':>12} {'wall (s)':>9}"
+            )
+            for mode in options["modes"]:
+                database_path = os.path.join(work_directory, f"{mode}.sqlite3")
+                connection = open_connection(database_path, mode)
+                connection.executescript(SCHEMA)
+                connection.close()
+                self.run_mode(database_path, mode, options)
+        finally:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    def run_mode(self, database_path, mode, options):
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(kind, database_path, mode, options["operations"], results))
+            for kind, count in (("write", options["writers"]), ("read", options["readers"]))
+            for _ in range(count)
+        ]
+
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        totals = {"write": [0, 0], "read": [0, 0]}
+        for _ in processes:
+            kind, completed, errors = results.get()
+            totals[kind][0] += completed
+            totals[kind][1] += errors
+        for process in processes:
+            process.join()
+        wall_time = time.perf_counter() - started
+
+        (writes, write_errors), (reads, read_errors) = totals["write"], totals["read"]
+        self.stdout.write(
+            f"{mode:<14} {writes / wall_time:>9.1f} {write_errors:>13} "
+            f"{reads / wall_time:>9.1f} {read_errors:>12} {wall_time:>9.2f}"
+        )
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from media_management import settings
+from backends_engine.encoding_profiles import encoding_profile_names
+from backends_engine.synthetic_media import generate_test_video
+from backends_engine.video_media_processor import VideoMediaProcessor, TRIM_MODE_REENCODE, TRIM_MODE_ACCURATE
+
+
+class Command(BaseCommand):
+    help = "Benchmark encode speed and output size of every encoding profile on a synthetic input video."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=int, default=20, help="Length of the synthetic source in seconds.")
+        parser.add_argument("--resolution", default="1280x720", help="Resolution of the synthetic source (WxH).")
+        parser.add_argument("--fps", type=int, default=25, help="Frame rate of the synthetic source.")
+        parser.add_argument("--repeat", type=int, default=2, help="Number of runs per profile.")
+        parser.add_argument("--profiles", nargs="+", default=encoding_profile_names(), choices=encoding_profile_names())
+        parser.add_argument("--mode", default=TRIM_MODE_REENCODE, choices=[TRIM_MODE_REENCODE, TRIM_MODE_ACCURATE])
+
+    def handle(self, *args, **options):
+        width, height = (int(value) for value in options["resolution"].split("x"))
+        duration = options["duration"]
+        work_directory = tempfile.mkdtemp(prefix="profile_benchmark_")
+        source_path = os.path.join(work_directory, "source.mp4")
+
+        try:
+            self.stdout.write(f"Generating {duration}s {options['resolution']} source video...")
+            generate_test_video(source_path, duration=duration, width=width, height=height, fps=options["fps"])
+
+            self.stdout.write(
+                f"{'profile':<10} {'wall avg (s)':>14} {'encode fps':>11} {'output (KB)':>12} {'kbit/s':>9}"
+            )
+            for profile in options["profiles"]:
+                wall_times, output_size = [], 0
+                for _ in range(options["repeat"]):
+                    with open(source_path, "rb") as source_file:
+                        processor = VideoMediaProcessor(File(source_file, name="source.mp4"))
+                        started = time.perf_counter()
+                        output = processor.trim_media(0, duration, mode=options["mode"], profile=profile)
+                        wall_times.append(time.perf_counter() - started)
+
+                    output_path = os.path.join(settings.MEDIA_ROOT, output)
+                    output_size = os.path.getsize(output_path)
+                    os.remove(output_path)
+
+                wall_average = sum(wall_times) / len(wall_times)
+                self.stdout.write(
+                    f"{profile:<10} {wall_average:>14.3f} {duration * options['fps'] / wall_average:>11.1f} "
+                    f"{output_size / 1024:>12.1f} {output_size * 8 / duration / 1000:>9.1f}"
+                )
+        finally:
+            shutil.rmtree(work_directory, ignore_errors=True)
@@ -0,0 +1,101 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backends_engine.models import MergedVideo, TrimmedVideo, VideoUpload
+
+ENDPOINTS = ["videos-list", "trimmed-video-list", "merge-video-list"]
+INSERT_BATCH_SIZE = 5000
+
+
+def populate(target_rows, existing_rows):
+    """Grow each table to ``target_rows`` rows; every merged video combines two trimmed videos."""
+    now = timezone.now()
+    for batch_start in range(existing_rows, target_rows, INSERT_BATCH_SIZE):
+        batch_end = min(batch_start + INSERT_BATCH_SIZE, target_rows)
+        # Distinct, increasing timestamps, as if one row of each kind was created per second.
+        moments = [now + timedelta(seconds=row) for row in range(batch_start, batch_end)]
+
+        uploads = VideoUpload.objects.bulk_create(
+            VideoUpload(file=f"videos/{row}.mp4", file_size=10.0, duration=60.0)
+            for row in range(batch_start, batch_end)
+        )
+        trimmed_videos = TrimmedVideo.objects.bulk_create(
+            TrimmedVideo(
+                parent_video=upload, start_time=0, end_time=5, file=f"trimmed_videos/{upload.id}.mp4", duration=5
+            )
+            for upload in uploads
+        )
+        merged_videos = MergedVideo.objects.bulk_create(
+            MergedVideo(id=uuid.uuid4(), file=f"merged_videos/{row}.mp4", duration=10)
+            for row in range(batch_start, batch_end)
+        )
+        MergedVideo.trimmed_videos.through.objects.bulk_create(
+            MergedVideo.trimmed_videos.through(mergedvideo_id=merged_video.id, trimmedvideo_id=trimmed_video.id)
+            for index, merged_video in enumerate(merged_videos)
+            for trimmed_video in (trimmed_videos[index], trimmed_videos[index - 1])
+        )
+
+        # auto_now_add ignores explicit values on insert, so spread the timestamps afterwards.
+        for model, instances, field in (
+            (VideoUpload, uploads, "uploaded_at"),
+            (TrimmedVideo, trimmed_videos, "created_at"),
+            (MergedVideo, merged_videos, "created_at"),
+        ):
+            for instance, moment in zip(instances, moments):
+                setattr(instance, field, moment)
+            model.objects.bulk_update(instances, [field], batch_size=INSERT_BATCH_SIZE)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark query count and latency of the list endpoints as the tables grow. "
+        "Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000], help="Table sizes to test.")
+        parser.add_argument("--pages", type=int, default=20, help="Pages to walk through per endpoint.")
+        parser.add_argument("--page-size", type=int, default=50)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(
+                f"{'rows':>8} {'endpoint':<20} {'queries/page':>13} {'first page (ms)':>16} {'last page (ms)':>15}"
+            )
+            existing_rows = 0
+            for rows in sorted(options["rows"]):
+                populate(rows, existing_rows)
+                existing_rows = rows
+                for endpoint in ENDPOINTS:
+                    self.benchmark_endpoint(endpoint, rows, options["pages"], options["page_size"])
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+
+    def benchmark_endpoint(self, endpoint, rows, pages, page_size):
+        client = APIClient()
+        url = reverse(endpoint) + f"?page_size={page_size}"
+        timings, query_counts = [], []
+        for _ in range(pages):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            query_counts.append(len(queries))
+            url = response.data["next"]
+            if url is None:
+                break
+
+        query_range = f"{min(query_counts)}" if min(query_counts) == max(query_counts) else f"{query_counts}"
+        self.stdout.write(f"{rows:>8} {endpoint:<20} {query_range:>13} {timings[0]:>16.2f} {timings[-1]:>15.2f}")
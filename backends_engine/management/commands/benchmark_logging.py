@@ -0,0 +1,103 @@
+import logging
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from logging.handlers import QueueListener
+
+from django.core.management.base import BaseCommand
+
+from media_management.custom_log_handlers import (
+    DailyFileHandler,
+    DateRotatingFileHandler,
+    JsonLineFormatter,
+    LazyQueueHandler,
+)
+
+# The format the file handlers used before the JSON lines.
+VERBOSE_FORMAT = "{levelname} TIME: {asctime:s} MODULE: {module} LINENO: {lineno:d} MESSAGE: {message}"
+
+
+def log_eagerly(logger, video_id, index):
+    # The views used to build every message up front, whether or not the level was enabled.
+    logger.info(f"Video uploaded successfully with ID: {video_id} ({index})")
+    logger.debug(f"Media validated: file_size={index * 1.5}, duration={index / 10}")
+
+
+def log_lazily(logger, video_id, index):
+    logger.info("Video uploaded successfully with ID: %s (%s)", video_id, index)
+    logger.debug("Media validated: file_size=%s, duration=%s", index * 1.5, index / 10)
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(f"benchmark_logging.{name}")
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what logging costs a request thread per record: the former DateRotatingFileHandler "
+        "against the queue and listener thread writing JSON lines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=20000, help="Records logged per thread.")
+        parser.add_argument("--threads", type=int, default=4, help="Threads logging at the same time.")
+
+    def handle(self, *args, **options):
+        work_directory = tempfile.mkdtemp(prefix="logging_benchmark_")
+        try:
+            self.stdout.write(f"{'pipeline':<10} {'caller (us/record)':>19} {'until written (us/record)':>26}")
+
+            handler = DateRotatingFileHandler(f"{work_directory}/before", when="midnight", encoding="utf-8")
+            handler.setFormatter(logging.Formatter(VERBOSE_FORMAT, style="{"))
+            logger = make_logger("before", handler)
+            caller, total = self.run(logger, log_eagerly, options)
+            handler.close()
+            self.report("before", caller, total)
+
+            handler = DailyFileHandler(f"{work_directory}/after", encoding="utf-8")
+            handler.setFormatter(JsonLineFormatter())
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, handler)
+            logger = make_logger("after", LazyQueueHandler(log_queue))
+            listener.start()
+            # Stopping the listener waits for the queue to drain, so the total includes every write.
+            caller, total = self.run(logger, log_lazily, options, finish=listener.stop)
+            handler.close()
+            self.report("after", caller, total)
+        finally:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    def run(self, logger, log, options, finish=None):
+        """Return the mean time per record seen by the logging threads, and until everything is written."""
+        records, thread_count = options["records"], options["threads"]
+        caller_times = []
+
+        def log_records():
+            video_id = uuid.uuid4()
+            started = time.perf_counter()
+            for index in range(records):
+                log(logger, video_id, index)
+            caller_times.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=log_records) for _ in range(thread_count)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if finish is not None:
+            finish()
+        total = time.perf_counter() - started
+
+        # One enabled INFO record per iteration; the DEBUG call is the price of a disabled level.
+        return sum(caller_times) / (records * thread_count), total / (records * thread_count)
+
+    def report(self, name, caller, total):
+        self.stdout.write(f"{name:<10} {caller * 1e6:>19.2f} {total * 1e6:>26.2f}")
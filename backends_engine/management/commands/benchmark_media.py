@@ -0,0 +1,298 @@
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+import media_management.settings
+from backends_engine.models import VideoUpload
+from backends_engine.synthetic_media import generate_synthetic_video
+from backends_engine.video_media_processor import TRIM_MODES, TRIM_MODE_REENCODE
+
+SCENARIOS = ["upload", "trim", "multi_trim", "merge", "shared_download"]
+
+# Lower is better for latency and memory, higher for throughput.
+LOWER_IS_BETTER = ["p50_s", "p95_s", "peak_rss_mb"]
+HIGHER_IS_BETTER = ["ops_per_s"]
+
+
+def summarize(timings, media_seconds, peak_rss_kb, peak_children_rss_kb):
+    """Latency percentiles, throughput and memory of one scenario; ``media_seconds`` is per iteration."""
+    total = sum(timings)
+    return {
+        "iterations": len(timings),
+        "p50_s": round(float(np.percentile(timings, 50)), 4),
+        "p95_s": round(float(np.percentile(timings, 95)), 4),
+        "mean_s": round(total / len(timings), 4),
+        "ops_per_s": round(len(timings) / total, 3),
+        "media_seconds_per_s": round(media_seconds * len(timings) / total, 2),
+        # ru_maxrss is the high-water mark of the process that ran the scenario, in KB on Linux.
+        "peak_rss_mb": round(peak_rss_kb / 1024, 1),
+        "peak_children_rss_mb": round(peak_children_rss_kb / 1024, 1),
+    }
+
+
+def compare_results(baseline, results, tolerance):
+    """Return (scenario, metric, baseline value, new value, relative change, regressed) rows."""
+    rows = []
+    for scenario, summary in results["scenarios"].items():
+        base_summary = baseline.get("scenarios", {}).get(scenario)
+        if base_summary is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            base_value, value = base_summary.get(metric), summary.get(metric)
+            if not base_value or value is None:
+                continue
+            change = (value - base_value) / base_value
+            regressed = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            rows.append((scenario, metric, base_value, value, change, regressed))
+    return rows
+
+
+def read_body(response):
+    async def collect():
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    return async_to_sync(collect)() if response.is_async else b"".join(response.streaming_content)
+
+
+def expect(response, status_code):
+    if response.status_code != status_code:
+        raise CommandError(f"{response.request['PATH_INFO']} returned {response.status_code}: {response.content[:500]}")
+    return response
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark uploads, trims, merges and shared downloads through the API on a synthetic video, write "
+        "p50/p95 latency, throughput and peak RSS as JSON, and optionally flag regressions against a baseline. "
+        "Runs against a throwaway test database and media directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=int, default=20, help="Length of the synthetic video in seconds.")
+        parser.add_argument("--resolution", default="640x360", help="Resolution of the synthetic video (WxH).")
+        parser.add_argument("--fps", type=int, default=25)
+        parser.add_argument("--codec", default="libx264", help="Encoder of the synthetic video.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic video's noise pattern.")
+        parser.add_argument("--iterations", type=int, default=5, help="Timed runs per scenario.")
+        parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per scenario.")
+        parser.add_argument("--trims", type=int, default=4, help="Ranges in the multi-trim scenario.")
+        parser.add_argument("--trim-mode", default=TRIM_MODE_REENCODE, choices=TRIM_MODES)
+        parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--baseline", help="Compare with results previously written by --output.")
+        parser.add_argument("--tolerance", type=float, default=0.15, help="Relative change counted as regression.")
+        parser.add_argument(
+            "--in-process",
+            action="store_true",
+            help="Run the scenarios in this process instead of one child process each; peak RSS then accumulates.",
+        )
+        parser.add_argument("--fixture", help="Benchmark this video instead of generating one.")
+
+    def handle(self, *args, **options):
+        work_directory = tempfile.mkdtemp(prefix="media_benchmark_")
+        try:
+            fixture_path = options["fixture"] or self.generate_fixture(work_directory, options)
+            self.stdout.write(
+                f"{'scenario':<16} {'p50 (s)':>9} {'p95 (s)':>9} {'ops/s':>8} {'media s/s':>10} {'peak RSS (MB)':>14}"
+            )
+            if options["in_process"]:
+                scenarios = self.run_in_test_environment(fixture_path, work_directory, options)
+            else:
+                scenarios = {}
+                for name in options["scenarios"]:
+                    scenarios[name] = self.run_isolated(name, fixture_path, work_directory, options)
+                    self.write_summary(name, scenarios[name])
+        finally:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+        results = {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "fixture": {
+                key: options[key] for key in ("duration", "resolution", "fps", "codec", "seed", "trims", "trim_mode")
+            },
+            "scenarios": scenarios,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+        if options["baseline"]:
+            self.compare(options["baseline"], results, options["tolerance"])
+
+    def generate_fixture(self, work_directory, options):
+        width, height = (int(value) for value in options["resolution"].split("x"))
+        fixture_path = os.path.join(work_directory, "fixture.mp4")
+        self.stdout.write(f"Generating {options['duration']}s {options['resolution']} {options['codec']} fixture...")
+        generate_synthetic_video(
+            fixture_path,
+            duration=options["duration"],
+            width=width,
+            height=height,
+            fps=options["fps"],
+            codec=options["codec"],
+            seed=options["seed"],
+        )
+        return fixture_path
+
+    def run_isolated(self, name, fixture_path, work_directory, options):
+        """Run one scenario in a fresh child process, so its peak RSS (and its ffmpeg children's) is its own.
+
+        ru_maxrss is a lifetime high-water mark: in a shared process every scenario would report the
+        largest peak of the ones before it.
+        """
+        output_path = os.path.join(work_directory, f"{name}.json")
+        command = [sys.executable, "-m", "django", "benchmark_media", "--in-process", "--scenarios", name]
+        command += ["--fixture", fixture_path, "--output", output_path]
+        for option in ("duration", "iterations", "warmup", "trims", "trim_mode"):
+            command += [f"--{option.replace('_', '-')}", str(options[option])]
+        completed = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise CommandError(f"The {name} scenario failed:\n{completed.stderr[-2000:]}")
+        with open(output_path) as output_file:
+            return json.load(output_file)["scenarios"][name]
+
+    def run_in_test_environment(self, fixture_path, work_directory, options):
+        media_root = os.path.join(work_directory, "media")
+        setup_test_environment()
+        old_database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # The media processor reads the settings module directly, so it is pointed at the scratch directory too.
+        old_media_root = media_management.settings.MEDIA_ROOT
+        media_management.settings.MEDIA_ROOT = media_root
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                PREVIEW_ON_UPLOAD=False,
+                HLS_AUTO_PACKAGE=False,
+                # Every iteration has to do the work instead of hitting the cache.
+                DERIVATION_CACHE_ENABLED=False,
+                MAX_VIDEO_DURATION_SEC=max(float(settings.MAX_VIDEO_DURATION_SEC), options["duration"]),
+                MAX_VIDEO_SIZE_MB=max(float(settings.MAX_VIDEO_SIZE_MB), os.path.getsize(fixture_path) / 2**20 + 1),
+            ):
+                return self.run_scenarios(fixture_path, options)
+        finally:
+            media_management.settings.MEDIA_ROOT = old_media_root
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+
+    def write_summary(self, name, summary):
+        self.stdout.write(
+            f"{name:<16} {summary['p50_s']:>9.3f} {summary['p95_s']:>9.3f} {summary['ops_per_s']:>8.2f} "
+            f"{summary['media_seconds_per_s']:>10.2f} {summary['peak_rss_mb']:>14.1f}"
+        )
+
+    def run_scenarios(self, fixture_path, options):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=settings.API_STATIC_TOKEN)
+        with open(fixture_path, "rb") as fixture_file:
+            fixture = fixture_file.read()
+        duration = options["duration"]
+
+        def upload():
+            video_data = SimpleUploadedFile("fixture.mp4", fixture, content_type="video/mp4")
+            response = expect(client.post(reverse("videos-list"), {"file": video_data}, format="multipart"), 201)
+            return response.data["data"]["id"]
+
+        # Fixed ranges spread over the video, clear of the first second (a zero start is ignored).
+        trim_length = min(4.0, (duration - 1) / max(options["trims"], 2))
+        time_ranges = [(1 + index * trim_length, 1 + (index + 1) * trim_length) for index in range(options["trims"])]
+        parent_video_id = upload()
+
+        def trim(ranges):
+            data = {
+                "parent_video": parent_video_id,
+                "mode": options["trim_mode"],
+                "trims": [{"start_time": start_time, "end_time": end_time} for start_time, end_time in ranges],
+            }
+            return expect(client.post(reverse("trimmed-video-list"), data, format="json"), 201).data["data"]
+
+        # Only set up what the selected scenarios use, so it does not count towards their peak memory.
+        trimmed_video_ids = None
+        if {"merge", "shared_download"} & set(options["scenarios"]):
+            trimmed_video_ids = [trimmed_video["id"] for trimmed_video in trim(time_ranges[:2])]
+
+        def merge():
+            data = {"trimmed_videos": trimmed_video_ids}
+            return expect(client.post(reverse("merge-video-list"), data, format="json"), 201).data["data"]["id"]
+
+        shared_path = None
+        if "shared_download" in options["scenarios"]:
+            link = expect(client.post(reverse("link-share-list"), {"merged_video_id": merge()}, format="json"), 200)
+            link = urlsplit(link.json()["data"]["link"])
+            shared_path = f"{link.path}?{link.query}"
+
+        def shared_download():
+            return read_body(expect(client.get(shared_path), 200))
+
+        runs = {
+            # Each upload is deleted again, otherwise the next one would be deduplicated without validation.
+            "upload": (lambda: VideoUpload.objects.filter(id=upload()).delete(), duration),
+            "trim": (lambda: trim(time_ranges[:1]), time_ranges[0][1] - time_ranges[0][0]),
+            "multi_trim": (
+                lambda: trim(time_ranges),
+                sum(end_time - start_time for start_time, end_time in time_ranges),
+            ),
+            "merge": (merge, 2 * trim_length),
+            "shared_download": (shared_download, 2 * trim_length),
+        }
+
+        scenarios = {}
+        for name in options["scenarios"]:
+            run, media_seconds = runs[name]
+            for _ in range(options["warmup"]):
+                run()
+            timings = []
+            for _ in range(options["iterations"]):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            summary = scenarios[name] = summarize(
+                timings,
+                media_seconds,
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            )
+            self.write_summary(name, summary)
+        return scenarios
+
+    def compare(self, baseline_path, results, tolerance):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("fixture") != results["fixture"]:
+            self.stdout.write(self.style.WARNING("The baseline was measured on a different fixture."))
+
+        rows = compare_results(baseline, results, tolerance)
+        self.stdout.write(f"{'scenario':<16} {'metric':<12} {'baseline':>10} {'current':>10} {'change':>8}")
+        for scenario, metric, base_value, value, change, regressed in rows:
+            line = f"{scenario:<16} {metric:<12} {base_value:>10.3f} {value:>10.3f} {change:>+8.1%}"
+            self.stdout.write(self.style.ERROR(line + "  REGRESSION") if regressed else line)
+
+        regressions = sum(1 for row in rows if row[-1])
+        if regressions:
+            raise CommandError(
+                f"{regressions} metric(s) regressed by more than {tolerance:.0%} against {baseline_path}."
+            )
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {tolerance:.0%}."))
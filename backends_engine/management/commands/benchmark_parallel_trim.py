@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from media_management import settings
+from backends_engine.synthetic_media import generate_test_video
+from backends_engine.trim_executor import ParallelTrimExecutor
+from backends_engine.video_media_processor import TRIM_MODES, TRIM_MODE_REENCODE
+
+
+class Command(BaseCommand):
+    help = "Benchmark trim throughput of ParallelTrimExecutor at several worker counts under one CPU budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8])
+        parser.add_argument("--cpu-budget", type=int, default=settings.MEDIA_CPU_BUDGET)
+        parser.add_argument("--trims", type=int, default=8, help="Number of trims per request.")
+        parser.add_argument("--trim-length", type=float, default=4.0, help="Length of every trim in seconds.")
+        parser.add_argument("--resolution", default="1280x720", help="Resolution of the synthetic source (WxH).")
+        parser.add_argument("--mode", default=TRIM_MODE_REENCODE, choices=TRIM_MODES)
+
+    def handle(self, *args, **options):
+        width, height = (int(value) for value in options["resolution"].split("x"))
+        trim_length = options["trim_length"]
+        time_ranges = [(index * trim_length, (index + 1) * trim_length) for index in range(options["trims"])]
+        work_directory = tempfile.mkdtemp(prefix="parallel_trim_benchmark_")
+        source_path = os.path.join(work_directory, "source.mp4")
+
+        try:
+            duration = int(time_ranges[-1][1]) + 1
+            self.stdout.write(f"Generating {duration}s {options['resolution']} source video...")
+            generate_test_video(source_path, duration=duration, width=width, height=height)
+
+            self.stdout.write(
+                f"{'workers':>8} {'threads':>8} {'wall (s)':>10} {'trims/s':>9} {'media s/s':>10} {'speedup':>8}"
+            )
+            baseline = None
+            for max_workers in options["workers"]:
+                executor = ParallelTrimExecutor(max_workers=max_workers, cpu_budget=options["cpu_budget"])
+                workers, threads = executor.plan(len(time_ranges))
+                try:
+                    with open(source_path, "rb") as source_file:
+                        started = time.perf_counter()
+                        outputs = executor.trim_media(
+                            File(source_file, name="source.mp4"), time_ranges, options["mode"]
+                        )
+                        elapsed = time.perf_counter() - started
+                finally:
+                    executor.shutdown()
+
+                for output in outputs:
+                    os.remove(os.path.join(settings.MEDIA_ROOT, output))
+
+                baseline = baseline or elapsed
+                self.stdout.write(
+                    f"{workers:>8} {threads:>8} {elapsed:>10.2f} {len(time_ranges) / elapsed:>9.2f} "
+                    f"{len(time_ranges) * trim_length / elapsed:>10.2f} {baseline / elapsed:>8.2f}"
+                )
+        finally:
+            shutil.rmtree(work_directory, ignore_errors=True)
@@ -0,0 +1,62 @@
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from media_management import settings
+from backends_engine.synthetic_media import generate_test_video
+from backends_engine.video_media_processor import VideoMediaProcessor, TRIM_MODES
+
+
+def cpu_seconds():
+    """CPU time used by this process and every ffmpeg child it has waited for."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+class Command(BaseCommand):
+    help = "Benchmark wall time and CPU time of every trim mode on a synthetic input video."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=int, default=60, help="Length of the synthetic source in seconds.")
+        parser.add_argument("--resolution", default="1280x720", help="Resolution of the synthetic source (WxH).")
+        parser.add_argument("--start", type=float, default=12.3, help="Trim start time in seconds.")
+        parser.add_argument("--end", type=float, default=17.7, help="Trim end time in seconds.")
+        parser.add_argument("--repeat", type=int, default=3, help="Number of runs per mode.")
+        parser.add_argument("--modes", nargs="+", default=TRIM_MODES, choices=TRIM_MODES)
+
+    def handle(self, *args, **options):
+        width, height = (int(value) for value in options["resolution"].split("x"))
+        work_directory = tempfile.mkdtemp(prefix="trim_benchmark_")
+        source_path = os.path.join(work_directory, "source.mp4")
+
+        try:
+            self.stdout.write(f"Generating {options['duration']}s {options['resolution']} source video...")
+            generate_test_video(source_path, duration=options["duration"], width=width, height=height)
+
+            self.stdout.write(f"{'mode':<10} {'wall avg (s)':>14} {'cpu avg (s)':>14} {'output (KB)':>12}")
+            for mode in options["modes"]:
+                wall_times, cpu_times, output_size = [], [], 0
+                for _ in range(options["repeat"]):
+                    with open(source_path, "rb") as source_file:
+                        processor = VideoMediaProcessor(File(source_file, name="source.mp4"))
+                        cpu_before, wall_before = cpu_seconds(), time.perf_counter()
+                        output = processor.trim_media(options["start"], options["end"], mode=mode)
+                        wall_times.append(time.perf_counter() - wall_before)
+                        cpu_times.append(cpu_seconds() - cpu_before)
+
+                    output_path = os.path.join(settings.MEDIA_ROOT, output)
+                    output_size = os.path.getsize(output_path) / 1024
+                    os.remove(output_path)
+
+                self.stdout.write(
+                    f"{mode:<10} {sum(wall_times) / len(wall_times):>14.3f} "
+                    f"{sum(cpu_times) / len(cpu_times):>14.3f} {output_size:>12.1f}"
+                )
+        finally:
+            shutil.rmtree(work_directory, ignore_errors=True)
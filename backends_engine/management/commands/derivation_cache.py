@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from backends_engine.derivation_cache import cache_stats, evict
+
+
+class Command(BaseCommand):
+    help = "Show derivation cache hit/miss statistics and optionally evict down to a size limit."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--evict",
+            nargs="?",
+            const=-1,
+            type=float,
+            metavar="MAX_MB",
+            help="Evict least recently used outputs down to MAX_MB (default DERIVATION_CACHE_MAX_MB).",
+        )
+
+    def handle(self, *args, **options):
+        if options["evict"] is not None:
+            max_bytes = None if options["evict"] < 0 else options["evict"] * 1024 * 1024
+            self.stdout.write(f"Evicted {evict(max_bytes=max_bytes)} entries.")
+
+        self.stdout.write(
+            f"{'operation':>10} {'hits':>8} {'misses':>8} {'hit rate':>9} "
+            f"{'evictions':>10} {'entries':>8} {'size (MB)':>10}"
+        )
+        for row in cache_stats():
+            self.stdout.write(
+                f"{row['operation']:>10} {row['hits']:>8} {row['misses']:>8} {row['hit_rate']:>9.1%} "
+                f"{row['evictions']:>10} {row['entries']:>8} {row['size_bytes'] / (1024 * 1024):>10.1f}"
+            )
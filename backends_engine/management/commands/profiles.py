@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backends_engine.profiling import format_stats, load_profile, recent_profiles, sign_profile_token
+
+
+class Command(BaseCommand):
+    help = (
+        "List stored request profiles, show one (summary, spans and pstats), or print a signed X-Profile "
+        "header value that makes the API profile a request."
+    )
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="action", required=True)
+        list_parser = subparsers.add_parser("list", help="The most recent profiles.")
+        list_parser.add_argument("--limit", type=int, default=20)
+        show_parser = subparsers.add_parser("show", help="The summary and function statistics of one profile.")
+        show_parser.add_argument("profile_id")
+        show_parser.add_argument("--sort", default="cumulative", help="pstats sort key, e.g. cumulative or tottime.")
+        show_parser.add_argument("--limit", type=int, default=30, help="Functions to print.")
+        subparsers.add_parser("sign", help="Print a value for the X-Profile request header.")
+
+    def handle(self, *args, **options):
+        if options["action"] == "sign":
+            self.stdout.write(sign_profile_token())
+        elif options["action"] == "list":
+            self.list_profiles(options["limit"])
+        else:
+            self.show_profile(options["profile_id"], options["sort"], options["limit"])
+
+    def list_profiles(self, limit):
+        self.stdout.write(
+            f"{'id':<34} {'started at':<30} {'method':<7} {'status':>6} {'duration (s)':>12} {'trigger':<8} path"
+        )
+        for summary in recent_profiles(limit):
+            self.stdout.write(
+                f"{summary['id']:<34} {summary['started_at']:<30} {summary['method']:<7} {summary['status']:>6} "
+                f"{summary['duration_s']:>12.3f} {summary['trigger']:<8} {summary['path']}"
+            )
+
+    def show_profile(self, profile_id, sort, limit):
+        try:
+            summary, stats_path = load_profile(profile_id)
+        except FileNotFoundError:
+            raise CommandError(f"No profile {profile_id}.")
+
+        self.stdout.write(
+            f"{summary['method']} {summary['path']} ({summary['route']}) -> {summary['status']} in "
+            f"{summary['duration_s']:.3f}s, {summary['trigger']} at {summary['started_at']}"
+        )
+        if summary.get("request_id"):
+            self.stdout.write(f"Request id: {summary['request_id']}")
+        self.stdout.write(f"{'span':<24} {'count':>6} {'total (s)':>10}")
+        for name, span in summary["spans"].items():
+            self.stdout.write(f"{name:<24} {span['count']:>6} {span['total_s']:>10.3f}")
+        if stats_path is not None:
+            self.stdout.write(format_stats(stats_path, sort=sort, limit=limit))
@@ -0,0 +1,77 @@
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from backends_engine.media_jobs import (
+    claim_next_job,
+    heartbeat_jobs,
+    mark_job_failed,
+    requeue_stale_jobs,
+    run_job,
+)
+
+logger_info = logging.getLogger("info")
+
+
+def close_inherited_connections():
+    # Forked workers must not reuse the parent's database connection.
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Run queued trim and merge jobs from the database in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=settings.MEDIA_WORKER_PROCESSES)
+        parser.add_argument("--poll-interval", type=float, default=settings.MEDIA_WORKER_POLL_INTERVAL_SEC)
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        logger_info.info("Media worker %s started with %s processes", worker_name, processes)
+        self.stdout.write(f"Media worker {worker_name} started with {processes} processes.")
+
+        running = {}
+        # Jobs left running by a worker that died are picked up again at startup and then once per lease.
+        last_heartbeat = last_reclaim = float("-inf")
+        with ProcessPoolExecutor(max_workers=processes, initializer=close_inherited_connections) as pool:
+            try:
+                while True:
+                    now = time.monotonic()
+                    if running and now - last_heartbeat >= settings.MEDIA_JOB_HEARTBEAT_SEC:
+                        heartbeat_jobs(list(running.values()), worker_name)
+                        last_heartbeat = now
+                    if now - last_reclaim >= settings.MEDIA_JOB_LEASE_SEC:
+                        requeue_stale_jobs()
+                        last_reclaim = now
+
+                    for future, job_id in list(running.items()):
+                        if future.done():
+                            del running[future]
+                            if future.exception() is not None:
+                                # The worker process died before run_job could record the outcome.
+                                mark_job_failed(job_id, f"Worker crashed: {future.exception()}")
+
+                    claimed_any = False
+                    while len(running) < processes:
+                        job_id = claim_next_job(worker_name)
+                        if job_id is None:
+                            break
+                        claimed_any = True
+                        connections.close_all()
+                        running[pool.submit(run_job, job_id)] = job_id
+                        self.stdout.write(f"Started job {job_id}.")
+
+                    if options["once"] and not running and not claimed_any:
+                        break
+                    if not claimed_any:
+                        time.sleep(options["poll_interval"])
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping media worker; waiting for running jobs to finish.")
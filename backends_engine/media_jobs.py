@@ -0,0 +1,240 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from backends_engine.models import VideoUpload, TrimmedVideo, MergedVideo, ProcessingJob
+from backends_engine.video_media_processor import TRIM_MODE_COPY, VideoMediaProcessor, copy_cut_start
+from backends_engine.ffmpeg_tools import FFmpegError, keyframe_times
+from backends_engine.trim_executor import get_trim_executor
+from backends_engine import derivation_cache
+from backends_engine.hls_packaging import package_merged_video
+from backends_engine.preview_assets import generate_previews
+from backends_engine.utils import fetch_in_request_order
+from backends_engine.media_storage import local_media_path, publish
+from backends_engine import metrics
+
+logger_info = logging.getLogger("info")
+logger_error = logging.getLogger("error")
+
+# How many queued jobs a worker looks at per claim attempt; another worker may win any of them.
+CLAIM_BATCH_SIZE = 10
+
+
+def copied_ranges(parent_video, time_ranges):
+    """The (start_time, duration) every copy-mode trim really holds.
+
+    Stream copy cuts on the keyframe at or before the requested start, so the stored range is moved back to it;
+    the requested ranges are kept if the keyframes of the source cannot be read.
+    """
+    try:
+        with local_media_path(parent_video.file) as source_path:
+            keyframes = keyframe_times(source_path)
+    except (FFmpegError, OSError) as e:
+        logger_error.error("Cannot read the keyframes of video %s: %s", parent_video.id, e)
+        return [(start_time, end_time - start_time) for start_time, end_time in time_ranges]
+    cut_starts = [copy_cut_start(keyframes, start_time) for start_time, _ in time_ranges]
+    return [(cut_start, end_time - cut_start) for cut_start, (_, end_time) in zip(cut_starts, time_ranges)]
+
+
+def trim_parent_video(parent_video, time_ranges, mode, profile=None):
+    """Trim every (start_time, end_time) range of ``parent_video`` and store the results.
+
+    Ranges whose output is already in the derivation cache reuse the stored file; only the rest are encoded.
+    """
+    keys = [
+        derivation_cache.trim_key(parent_video, start_time, end_time, mode, profile)
+        for start_time, end_time in time_ranges
+    ]
+    trimmed_file_paths = [derivation_cache.lookup(ProcessingJob.TRIM, key) for key in keys]
+
+    # Encode each missing key once, even when the request repeats a range.
+    pending = {}
+    for index, (key, trimmed_file_path) in enumerate(zip(keys, trimmed_file_paths)):
+        if trimmed_file_path is None:
+            pending.setdefault(key, index)
+
+    if pending:
+        encoded_file_paths = get_trim_executor().trim_media(
+            parent_video.file,
+            [time_ranges[index] for index in pending.values()],
+            mode=mode,
+            metadata=parent_video.stream_metadata(),
+            profile=profile,
+        )
+        stored_file_paths = {
+            key: derivation_cache.store(ProcessingJob.TRIM, key, publish(encoded_file_path))
+            for key, encoded_file_path in zip(pending, encoded_file_paths)
+        }
+        trimmed_file_paths = [path or stored_file_paths[key] for key, path in zip(keys, trimmed_file_paths)]
+
+    if (mode or settings.DEFAULT_TRIM_MODE) == TRIM_MODE_COPY:
+        cuts = copied_ranges(parent_video, time_ranges)
+    else:
+        cuts = [(start_time, end_time - start_time) for start_time, end_time in time_ranges]
+
+    # One INSERT in one transaction: a single hold of the SQLite write lock for the whole batch.
+    with metrics.stage_timer("trim", "db_write"), transaction.atomic():
+        return TrimmedVideo.objects.bulk_create(
+            TrimmedVideo(
+                parent_video=parent_video,
+                start_time=start_time,
+                end_time=end_time,
+                file=trimmed_file_path,
+                duration=duration,
+                derivation_key=key,
+            )
+            for (_, end_time), (start_time, duration), key, trimmed_file_path in zip(
+                time_ranges, cuts, keys, trimmed_file_paths
+            )
+        )
+
+
+def merge_trimmed_videos(trimmed_videos, profile=None):
+    """Merge the trimmed videos in the given order and store the result, reusing a cached merge when possible."""
+    key = derivation_cache.merge_key(trimmed_videos, profile)
+    merged_file_path = derivation_cache.lookup(ProcessingJob.MERGE, key)
+    if merged_file_path is None:
+        processor = VideoMediaProcessor(trimmed_videos[0].file)
+        merged_file_path = derivation_cache.store(
+            ProcessingJob.MERGE, key, publish(processor.merge_media(trimmed_videos, profile=profile))
+        )
+
+    with metrics.stage_timer("merge", "db_write"), transaction.atomic():
+        merged_video = MergedVideo.objects.create(
+            file=merged_file_path, duration=sum([video.duration for video in trimmed_videos]), derivation_key=key
+        )
+        merged_video.trimmed_videos.set(trimmed_videos)
+    return merged_video
+
+
+def enqueue_job(job_type, parameters):
+    job = ProcessingJob.objects.create(job_type=job_type, parameters=parameters)
+    logger_info.info("Queued %s job %s", job_type, job.id)
+    return job
+
+
+def enqueue_hls_packaging(merged_video, profile=None):
+    return enqueue_job(ProcessingJob.PACKAGE, {"merged_video": str(merged_video.id), "profile": profile})
+
+
+def schedule_previews(video_upload, background):
+    """Queue or directly generate the previews of a new upload; a failure never fails the upload itself."""
+    if not settings.PREVIEW_ON_UPLOAD:
+        return None
+    if background:
+        return enqueue_job(ProcessingJob.PREVIEW, {"video_upload": str(video_upload.id)})
+    try:
+        generate_previews(video_upload)
+    except Exception as e:
+        logger_error.error("Preview generation failed for video %s: %s", video_upload.id, e)
+    return None
+
+
+def claim_next_job(worker_name):
+    """Atomically move the oldest queued job to running and return its id, or None when the queue is empty.
+
+    The conditional UPDATE is the lock: only one worker can flip a given row from queued to running.
+    """
+    queued_ids = (
+        ProcessingJob.objects.filter(status=ProcessingJob.QUEUED)
+        .order_by("created_at")
+        .values_list("id", flat=True)[:CLAIM_BATCH_SIZE]
+    )
+    for job_id in queued_ids:
+        now = timezone.now()
+        claimed = ProcessingJob.objects.filter(id=job_id, status=ProcessingJob.QUEUED).update(
+            status=ProcessingJob.RUNNING,
+            worker=worker_name,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return job_id
+    return None
+
+
+def heartbeat_jobs(job_ids, worker_name):
+    """Renew the lease of the running jobs ``worker_name`` still holds; returns how many it renewed."""
+    return ProcessingJob.objects.filter(id__in=job_ids, status=ProcessingJob.RUNNING, worker=worker_name).update(
+        heartbeat_at=timezone.now()
+    )
+
+
+def requeue_stale_jobs():
+    """Requeue running jobs whose worker stopped heartbeating, failing those already claimed too often.
+
+    Returns (requeued, failed). Rows claimed before heartbeats existed fall back to their start time.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.MEDIA_JOB_LEASE_SEC)
+    stale = ProcessingJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=ProcessingJob.RUNNING,
+    )
+    failed = stale.filter(attempts__gte=settings.MEDIA_JOB_MAX_ATTEMPTS).update(
+        status=ProcessingJob.FAILED,
+        error=f"Worker stopped responding {settings.MEDIA_JOB_MAX_ATTEMPTS} times.",
+        finished_at=now,
+    )
+    requeued = stale.update(status=ProcessingJob.QUEUED, worker=None, started_at=None, heartbeat_at=None)
+    if requeued or failed:
+        logger_error.error("Requeued %s and failed %s jobs with an expired lease", requeued, failed)
+    return requeued, failed
+
+
+def mark_job_failed(job_id, message):
+    ProcessingJob.objects.filter(id=job_id).update(
+        status=ProcessingJob.FAILED, error=message, finished_at=timezone.now()
+    )
+    logger_error.error("Job %s failed: %s", job_id, message)
+
+
+def run_job(job_id):
+    """Execute a claimed job and record its result or error. Runs inside a worker process."""
+    job_type, status = None, ProcessingJob.FAILED
+    try:
+        job = ProcessingJob.objects.get(id=job_id)
+        parameters = job.parameters
+        job_type = job.job_type
+        metrics.media_jobs_in_flight.inc(job_type=job_type)
+
+        if job.job_type == ProcessingJob.TRIM:
+            parent_video = VideoUpload.objects.get(id=parameters["parent_video"])
+            time_ranges = [(float(start_time), float(end_time)) for start_time, end_time in parameters["time_ranges"]]
+            job.trimmed_videos.set(
+                trim_parent_video(parent_video, time_ranges, parameters["mode"], parameters.get("profile"))
+            )
+        elif job.job_type == ProcessingJob.PREVIEW:
+            generate_previews(VideoUpload.objects.get(id=parameters["video_upload"]))
+        elif job.job_type == ProcessingJob.PACKAGE:
+            merged_video = MergedVideo.objects.get(id=parameters["merged_video"])
+            job.merged_video = package_merged_video(merged_video, parameters.get("profile"))
+        else:
+            trimmed_videos = fetch_in_request_order(TrimmedVideo, parameters["trimmed_videos"])
+            job.merged_video = merge_trimmed_videos(trimmed_videos, parameters.get("profile"))
+            if parameters.get("hls"):
+                enqueue_hls_packaging(job.merged_video, parameters.get("profile"))
+
+        job.status = ProcessingJob.SUCCEEDED
+        job.finished_at = timezone.now()
+        job.save(update_fields=["merged_video", "status", "finished_at"])
+        status = job.status
+        logger_info.info("Job %s succeeded", job_id)
+
+    except ValidationError as e:
+        mark_job_failed(job_id, " ".join(e.messages))
+    except Exception as e:
+        mark_job_failed(job_id, f"An unexpected error occurred: {str(e)}")
+    finally:
+        if job_type is not None:
+            metrics.media_jobs_in_flight.dec(job_type=job_type)
+            metrics.media_jobs.inc(job_type=job_type, status=status)
+        # Pool processes may exit without another periodic flush.
+        metrics.registry.flush()
+        close_old_connections()
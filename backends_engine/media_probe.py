@@ -0,0 +1,399 @@
+"""Pure-Python container header probe.
+
+Reads only the structural headers of MP4/MOV (``moov``), Matroska/WebM (EBML ``Segment``/``Info``/``Tracks``)
+and AVI (``hdrl``/``avih``/``strl``) files, so duration and stream metadata are available without starting
+an ffmpeg process or decoding a single frame.
+"""
+
+import os
+import struct
+
+METADATA_FIELDS = ["container", "video_codec", "audio_codec", "width", "height", "frame_rate", "bit_rate"]
+
+MP4_CODECS = {
+    "avc1": "h264",
+    "avc3": "h264",
+    "hvc1": "hevc",
+    "hev1": "hevc",
+    "mp4v": "mpeg4",
+    "av01": "av1",
+    "vp09": "vp9",
+    "mp4a": "aac",
+    "ac-3": "ac3",
+    "ec-3": "eac3",
+    ".mp3": "mp3",
+    "Opus": "opus",
+    "alac": "alac",
+}
+
+MATROSKA_CODECS = {
+    "V_MPEG4/ISO/AVC": "h264",
+    "V_MPEGH/ISO/HEVC": "hevc",
+    "V_MPEG4/ISO/ASP": "mpeg4",
+    "V_VP8": "vp8",
+    "V_VP9": "vp9",
+    "V_AV1": "av1",
+    "A_AAC": "aac",
+    "A_OPUS": "opus",
+    "A_VORBIS": "vorbis",
+    "A_MPEG/L3": "mp3",
+    "A_AC3": "ac3",
+    "A_FLAC": "flac",
+}
+
+AVI_VIDEO_CODECS = {
+    "h264": "h264",
+    "x264": "h264",
+    "avc1": "h264",
+    "xvid": "mpeg4",
+    "divx": "mpeg4",
+    "dx50": "mpeg4",
+    "fmp4": "mpeg4",
+    "mjpg": "mjpeg",
+}
+
+AVI_AUDIO_CODECS = {0x0001: "pcm", 0x0055: "mp3", 0x00FF: "aac", 0x2000: "ac3"}
+
+# Matroska element IDs (kept with their length-marker bits, as they appear in the file).
+EBML_HEADER = 0x1A45DFA3
+EBML_DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+SEGMENT_INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+SEGMENT_DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+DEFAULT_DURATION = 0x23E383
+TRACK_VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+MP4_CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+class ProbeError(Exception):
+    pass
+
+
+def sniff_container(head):
+    """Identify the container family from the first 12 bytes of a file, or return None."""
+    if len(head) >= 8 and head[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip"):
+        return "mp4"
+    if head[:4] == struct.pack(">I", EBML_HEADER):
+        return "matroska"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi"
+    return None
+
+
+def probe_media(file_obj):
+    """Return duration and stream metadata read from the container header of a seekable binary file."""
+    file_obj.seek(0, os.SEEK_END)
+    file_size = file_obj.tell()
+    file_obj.seek(0)
+    container = sniff_container(file_obj.read(12))
+
+    try:
+        if container == "mp4":
+            info = _probe_mp4(file_obj, file_size)
+        elif container == "matroska":
+            info = _probe_matroska(file_obj, file_size)
+        elif container == "avi":
+            info = _probe_avi(file_obj)
+        else:
+            raise ProbeError("Unrecognized container format.")
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ProbeError(f"Malformed container header: {str(e)}")
+
+    if info["duration"] and not info["bit_rate"]:
+        info["bit_rate"] = int(file_size * 8 / info["duration"])
+    return info
+
+
+def _empty_info(container):
+    info = dict.fromkeys(METADATA_FIELDS)
+    info["container"] = container
+    info["duration"] = None
+    return info
+
+
+# MP4 / MOV
+
+
+def _iter_boxes(file_obj, start, end):
+    offset = start
+    while offset + 8 <= end:
+        file_obj.seek(offset)
+        header = file_obj.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", file_obj.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, min(offset + size, end)
+        offset += size
+
+
+def _probe_mp4(file_obj, file_size):
+    info = _empty_info("mp4")
+    for box_type, start, end in _iter_boxes(file_obj, 0, file_size):
+        if box_type == b"ftyp":
+            file_obj.seek(start)
+            info["container"] = "mov" if file_obj.read(4) == b"qt  " else "mp4"
+        elif box_type == b"moov":
+            _parse_moov(file_obj, start, end, info)
+            return info
+    raise ProbeError("MP4 file has no 'moov' header.")
+
+
+def _parse_moov(file_obj, start, end, info):
+    for box_type, box_start, box_end in _iter_boxes(file_obj, start, end):
+        if box_type == b"mvhd":
+            timescale, duration = _read_timescale_and_duration(file_obj, box_start)
+            if timescale:
+                info["duration"] = duration / timescale
+        elif box_type == b"trak":
+            track = {}
+            _parse_track(file_obj, box_start, box_end, track)
+            if track.get("handler") == b"vide" and info["video_codec"] is None:
+                info["video_codec"] = MP4_CODECS.get(track.get("format"), track.get("format"))
+                info["width"], info["height"] = track.get("width"), track.get("height")
+                if track.get("timescale") and track.get("sample_delta_total"):
+                    frame_rate = track["sample_count"] * track["timescale"] / track["sample_delta_total"]
+                    info["frame_rate"] = round(frame_rate, 3)
+            elif track.get("handler") == b"soun" and info["audio_codec"] is None:
+                info["audio_codec"] = MP4_CODECS.get(track.get("format"), track.get("format"))
+
+
+def _read_timescale_and_duration(file_obj, start):
+    # mvhd and mdhd share the layout: version/flags, creation, modification, timescale, duration.
+    file_obj.seek(start)
+    version = file_obj.read(1)[0]
+    file_obj.read(3)
+    if version == 1:
+        file_obj.read(16)
+        return struct.unpack(">IQ", file_obj.read(12))
+    file_obj.read(8)
+    return struct.unpack(">II", file_obj.read(8))
+
+
+def _parse_track(file_obj, start, end, track):
+    for box_type, box_start, box_end in _iter_boxes(file_obj, start, end):
+        if box_type in MP4_CONTAINER_BOXES:
+            _parse_track(file_obj, box_start, box_end, track)
+        elif box_type == b"tkhd":
+            # Width and height are the last two 16.16 fixed-point fields of the box.
+            file_obj.seek(box_end - 8)
+            width, height = struct.unpack(">II", file_obj.read(8))
+            if width and height:
+                track["width"], track["height"] = width >> 16, height >> 16
+        elif box_type == b"mdhd":
+            track["timescale"], track["duration"] = _read_timescale_and_duration(file_obj, box_start)
+        elif box_type == b"hdlr" and "handler" not in track:
+            # QuickTime files carry a second, data-reference hdlr inside minf; the mdia one comes first.
+            file_obj.seek(box_start + 8)
+            track["handler"] = file_obj.read(4)
+        elif box_type == b"stsd":
+            file_obj.seek(box_start + 12)
+            track["format"] = file_obj.read(4).decode("latin-1")
+        elif box_type == b"stts":
+            file_obj.seek(box_start + 4)
+            entry_count = struct.unpack(">I", file_obj.read(4))[0]
+            # The count comes from the file; never read past the box for it.
+            entries_size = box_end - box_start - 8
+            if 8 * entry_count > entries_size:
+                raise ProbeError("Malformed container header: stts entry count exceeds its box.")
+            entries = struct.iter_unpack(">II", file_obj.read(min(8 * entry_count, entries_size)))
+            sample_count = delta_total = 0
+            for count, delta in entries:
+                sample_count += count
+                delta_total += count * delta
+            track["sample_count"], track["sample_delta_total"] = sample_count, delta_total
+
+
+# Matroska / WebM
+
+
+def _read_vint_bytes(file_obj):
+    first = file_obj.read(1)
+    if not first:
+        raise EOFError
+    length = 9 - first[0].bit_length()
+    if length > 8:
+        raise ProbeError("Invalid EBML variable-length integer.")
+    return first + file_obj.read(length - 1)
+
+
+def _read_element_id(file_obj):
+    # Element IDs keep their length-marker bits.
+    return int.from_bytes(_read_vint_bytes(file_obj), "big")
+
+
+def _read_element_size(file_obj):
+    data = _read_vint_bytes(file_obj)
+    marker = 0x80 >> (len(data) - 1)
+    value = int.from_bytes(bytes([data[0] & (marker - 1)]) + data[1:], "big")
+    # All value bits set means "unknown size".
+    return None if value == (1 << (7 * len(data))) - 1 else value
+
+
+def _iter_elements(file_obj, start, end):
+    offset = start
+    while offset < end:
+        file_obj.seek(offset)
+        try:
+            element_id = _read_element_id(file_obj)
+            size = _read_element_size(file_obj)
+        except EOFError:
+            return
+        data_start = file_obj.tell()
+        # Unknown-size elements (live streams) run to the end of their parent.
+        data_end = end if size is None else min(data_start + size, end)
+        yield element_id, data_start, data_end
+        offset = data_end
+
+
+def _read_uint(file_obj, start, end):
+    file_obj.seek(start)
+    return int.from_bytes(file_obj.read(end - start), "big")
+
+
+def _read_float(file_obj, start, end):
+    file_obj.seek(start)
+    data = file_obj.read(end - start)
+    return struct.unpack(">f" if len(data) == 4 else ">d", data)[0]
+
+
+def _probe_matroska(file_obj, file_size):
+    info = _empty_info("matroska")
+    for element_id, start, end in _iter_elements(file_obj, 0, file_size):
+        if element_id == EBML_HEADER:
+            for child_id, child_start, child_end in _iter_elements(file_obj, start, end):
+                if child_id == EBML_DOC_TYPE:
+                    file_obj.seek(child_start)
+                    info["container"] = file_obj.read(child_end - child_start).decode("ascii", "ignore").strip("\0")
+        elif element_id == SEGMENT:
+            _parse_segment(file_obj, start, end, info)
+            return info
+    raise ProbeError("Matroska file has no 'Segment' element.")
+
+
+def _parse_segment(file_obj, start, end, info):
+    timecode_scale, duration = 1000000, None
+    for element_id, element_start, element_end in _iter_elements(file_obj, start, end):
+        if element_id == SEGMENT_INFO:
+            for child_id, child_start, child_end in _iter_elements(file_obj, element_start, element_end):
+                if child_id == TIMECODE_SCALE:
+                    timecode_scale = _read_uint(file_obj, child_start, child_end)
+                elif child_id == SEGMENT_DURATION:
+                    duration = _read_float(file_obj, child_start, child_end)
+        elif element_id == TRACKS:
+            for child_id, child_start, child_end in _iter_elements(file_obj, element_start, element_end):
+                if child_id == TRACK_ENTRY:
+                    _parse_track_entry(file_obj, child_start, child_end, info)
+        elif element_id == CLUSTER:
+            # Media data starts here; every header we need comes before it.
+            break
+
+    if duration is not None:
+        info["duration"] = duration * timecode_scale / 1e9
+
+
+def _parse_track_entry(file_obj, start, end, info):
+    track = {}
+    for element_id, element_start, element_end in _iter_elements(file_obj, start, end):
+        if element_id == TRACK_TYPE:
+            track["type"] = _read_uint(file_obj, element_start, element_end)
+        elif element_id == CODEC_ID:
+            file_obj.seek(element_start)
+            track["codec"] = file_obj.read(element_end - element_start).decode("ascii", "ignore").strip("\0")
+        elif element_id == DEFAULT_DURATION:
+            track["frame_duration_ns"] = _read_uint(file_obj, element_start, element_end)
+        elif element_id == TRACK_VIDEO:
+            for child_id, child_start, child_end in _iter_elements(file_obj, element_start, element_end):
+                if child_id == PIXEL_WIDTH:
+                    track["width"] = _read_uint(file_obj, child_start, child_end)
+                elif child_id == PIXEL_HEIGHT:
+                    track["height"] = _read_uint(file_obj, child_start, child_end)
+
+    codec = MATROSKA_CODECS.get(track.get("codec"), track.get("codec"))
+    if track.get("type") == 1 and info["video_codec"] is None:
+        info["video_codec"] = codec
+        info["width"], info["height"] = track.get("width"), track.get("height")
+        if track.get("frame_duration_ns"):
+            info["frame_rate"] = round(1e9 / track["frame_duration_ns"], 3)
+    elif track.get("type") == 2 and info["audio_codec"] is None:
+        info["audio_codec"] = codec
+
+
+# AVI
+
+
+def _iter_riff_chunks(file_obj, start, end):
+    offset = start
+    while offset + 8 <= end:
+        file_obj.seek(offset)
+        header = file_obj.read(8)
+        if len(header) < 8:
+            return
+        chunk_id, size = struct.unpack("<4sI", header)
+        yield chunk_id, offset + 8, min(offset + 8 + size, end)
+        # Chunks are padded to an even size.
+        offset += 8 + size + (size & 1)
+
+
+def _probe_avi(file_obj):
+    info = _empty_info("avi")
+    file_obj.seek(4)
+    riff_end = 8 + struct.unpack("<I", file_obj.read(4))[0]
+
+    for chunk_id, start, end in _iter_riff_chunks(file_obj, 12, riff_end):
+        file_obj.seek(start)
+        if chunk_id == b"LIST" and file_obj.read(4) == b"hdrl":
+            _parse_avi_header_list(file_obj, start + 4, end, info)
+            return info
+    raise ProbeError("AVI file has no 'hdrl' header list.")
+
+
+def _parse_avi_header_list(file_obj, start, end, info):
+    for chunk_id, chunk_start, chunk_end in _iter_riff_chunks(file_obj, start, end):
+        file_obj.seek(chunk_start)
+        if chunk_id == b"avih":
+            # MainAVIHeader: dwMicroSecPerFrame at 0, dwTotalFrames at 16, dwWidth/dwHeight at 32.
+            header = file_obj.read(40)
+            microseconds_per_frame, total_frames = (
+                struct.unpack_from("<I", header)[0],
+                struct.unpack_from("<I", header, 16)[0],
+            )
+            info["width"], info["height"] = struct.unpack_from("<II", header, 32)
+            if microseconds_per_frame:
+                info["frame_rate"] = round(1e6 / microseconds_per_frame, 3)
+                info["duration"] = total_frames * microseconds_per_frame / 1e6
+        elif chunk_id == b"LIST" and file_obj.read(4) == b"strl":
+            _parse_avi_stream_list(file_obj, chunk_start + 4, chunk_end, info)
+
+
+def _parse_avi_stream_list(file_obj, start, end, info):
+    stream_type = handler = None
+    for chunk_id, chunk_start, chunk_end in _iter_riff_chunks(file_obj, start, end):
+        file_obj.seek(chunk_start)
+        if chunk_id == b"strh":
+            stream_type, handler = struct.unpack("<4s4s", file_obj.read(8))
+        elif chunk_id == b"strf" and stream_type == b"vids" and info["video_codec"] is None:
+            # BITMAPINFOHEADER.biCompression is the authoritative codec tag.
+            file_obj.seek(chunk_start + 16)
+            compression = file_obj.read(4) or handler
+            tag = compression.decode("latin-1").strip("\0 ").lower()
+            info["video_codec"] = AVI_VIDEO_CODECS.get(tag, tag or None)
+        elif chunk_id == b"strf" and stream_type == b"auds" and info["audio_codec"] is None:
+            format_tag = struct.unpack("<H", file_obj.read(2))[0]
+            info["audio_codec"] = AVI_AUDIO_CODECS.get(format_tag, f"0x{format_tag:04x}")
@@ -0,0 +1,512 @@
+"""Tiered media storage: an object store holds the media, MEDIA_ROOT keeps a bounded local copy.
+
+TieredStorage is a FileSystemStorage whose files are also published to an object store (the
+MEDIA_OBJECT_STORE class; LocalObjectStore is a filesystem stand-in for it). MEDIA_ROOT becomes a hot
+cache of at most MEDIA_HOT_CACHE_MAX_MB of those files: the least recently used local copies are
+evicted and fetched back on the next read. Transfers are split into MEDIA_TRANSFER_PART_MB parts
+that move in parallel on MEDIA_TRANSFER_THREADS threads, and concurrent reads of a missing file
+share one fetch. Processors get local paths through ``resolve_local_path`` or ``local_media_path``;
+files they write themselves, such as HLS packages and previews, go through ``publish``,
+``publish_directory``, ``stored_file_path`` and ``delete_directory``.
+"""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils._os import safe_join
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from backends_engine import metrics
+
+MULTIPART_DIRECTORY = ".multipart"
+PARTIAL_PREFIX = ".partial-"
+PIN_DIRECTORY = ".pins"
+
+
+class ObjectStore(ABC):
+    """The operations TieredStorage needs from an S3-style object store, addressed by storage name."""
+
+    @abstractmethod
+    def head(self, key):
+        """Size of the object in bytes; raises FileNotFoundError when there is no such object."""
+
+    @abstractmethod
+    def get_range(self, key, offset, length):
+        """Up to ``length`` bytes of the object starting at ``offset``."""
+
+    @abstractmethod
+    def create_multipart_upload(self, key):
+        """Start an upload whose parts become visible under ``key`` at once on completion; returns its id."""
+
+    @abstractmethod
+    def upload_part(self, key, upload_id, part_number, data):
+        """Store part ``part_number`` (from 1); parts may arrive in any order and concurrently."""
+
+    @abstractmethod
+    def complete_multipart_upload(self, key, upload_id, part_count):
+        pass
+
+    @abstractmethod
+    def abort_multipart_upload(self, key, upload_id):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove the object; deleting a missing object is not an error."""
+
+    @abstractmethod
+    def keys(self, prefix=""):
+        """Every stored key that starts with ``prefix``."""
+
+    def exists(self, key):
+        try:
+            self.head(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+
+class LocalObjectStore(ObjectStore):
+    """Object store semantics on a local directory, for development and tests.
+
+    Parts are kept apart until the upload completes and then assembled into a temporary file that
+    replaces the object in one step, so readers never see a partial object.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or settings.MEDIA_OBJECT_STORE_ROOT
+
+    def _object_path(self, key):
+        return safe_join(self.root, key)
+
+    def _upload_directory(self, upload_id):
+        return safe_join(self.root, MULTIPART_DIRECTORY, upload_id)
+
+    def head(self, key):
+        return os.path.getsize(self._object_path(key))
+
+    def get_range(self, key, offset, length):
+        with open(self._object_path(key), "rb") as object_file:
+            return os.pread(object_file.fileno(), length, offset)
+
+    def create_multipart_upload(self, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._upload_directory(upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        with open(os.path.join(self._upload_directory(upload_id), f"{part_number:05d}"), "wb") as part_file:
+            part_file.write(data)
+
+    def complete_multipart_upload(self, key, upload_id, part_count):
+        object_path = self._object_path(key)
+        upload_directory = self._upload_directory(upload_id)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(object_path), prefix=PARTIAL_PREFIX, delete=False
+        ) as object_file:
+            for part_number in range(1, part_count + 1):
+                with open(os.path.join(upload_directory, f"{part_number:05d}"), "rb") as part_file:
+                    shutil.copyfileobj(part_file, object_file)
+        os.replace(object_file.name, object_path)
+        shutil.rmtree(upload_directory, ignore_errors=True)
+
+    def abort_multipart_upload(self, key, upload_id):
+        shutil.rmtree(self._upload_directory(upload_id), ignore_errors=True)
+
+    def delete(self, key):
+        try:
+            os.remove(self._object_path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix=""):
+        for directory, directory_names, file_names in os.walk(self.root):
+            if directory == self.root and MULTIPART_DIRECTORY in directory_names:
+                directory_names.remove(MULTIPART_DIRECTORY)
+            for file_name in file_names:
+                key = os.path.relpath(os.path.join(directory, file_name), self.root)
+                if key.startswith(prefix) and not file_name.startswith(PARTIAL_PREFIX):
+                    yield key
+
+
+class HotCache:
+    """Local copies of stored objects under ``directory``, evicted least recently used first.
+
+    Every use stamps the copy's access time, so processes sharing the directory agree on recency
+    (the modification time, which the download ETags depend on, is left alone). Only copies of
+    objects in the store are evicted, never a pinned one; other files under the directory are not
+    counted. Each process scans the directory once on first use and then keeps a running total of
+    the copies it adds and removes, so adding a copy costs nothing until the limit is crossed.
+
+    A pin is a shared flock on a per-name lock file under PIN_DIRECTORY and eviction needs the
+    exclusive lock, so a copy pinned by any process sharing the directory stays. Lock files are only
+    removed with the object itself, so every process always locks the same file.
+    """
+
+    def __init__(self, directory, max_bytes, object_store):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.object_store = object_store
+        self._lock = threading.Lock()
+        # name -> size of the local copies known to be in the store, and their total, loaded on first use.
+        self._entries = None
+        self._total = 0
+        # name -> Future of the fetch in progress, which concurrent readers of the name wait on.
+        self._fetches = {}
+
+    def path(self, name):
+        return safe_join(self.directory, name)
+
+    def _tracked(self):
+        # Called with the lock held.
+        if self._entries is None:
+            self._entries = {}
+            for name, size in self._scan():
+                self._entries[name] = size
+                self._total += size
+        return self._entries
+
+    def _scan(self):
+        """(name, size) of every local copy of a stored object; hidden and partial files are skipped."""
+        for directory, directory_names, file_names in os.walk(self.directory):
+            directory_names[:] = [name for name in directory_names if not name.startswith(".")]
+            for file_name in file_names:
+                if file_name.startswith("."):
+                    continue
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, self.directory)
+                if self.object_store.exists(name):
+                    yield name, os.path.getsize(path)
+
+    def _forget(self, name):
+        # Called with the lock held.
+        size = self._tracked().pop(name, None)
+        if size is not None:
+            self._total -= size
+
+    def get(self, name, fetch):
+        """Local path of ``name``, running ``fetch(name, path)`` once when there is no local copy."""
+        path = self.path(name)
+        with self._lock:
+            try:
+                # Not tracked here: a local file is only evictable once it is known to be in the store.
+                touch(path)
+            except FileNotFoundError:
+                pass
+            else:
+                metrics.media_cache_requests.inc(result="hit")
+                return path
+            future = self._fetches.get(name)
+            fetching = future is None
+            if fetching:
+                future = self._fetches[name] = Future()
+        if not fetching:
+            metrics.media_cache_requests.inc(result="shared")
+            return future.result()
+
+        metrics.media_cache_requests.inc(result="miss")
+        try:
+            fetch(name, path)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._fetches[name]
+        future.set_result(path)
+        self.add(name)
+        return path
+
+    def _pin_path(self, name):
+        return os.path.join(self.directory, PIN_DIRECTORY, hashlib.sha256(name.encode()).hexdigest())
+
+    def _open_pin(self, name):
+        pin_path = self._pin_path(name)
+        os.makedirs(os.path.dirname(pin_path), exist_ok=True)
+        return open(pin_path, "a")
+
+    @contextmanager
+    def pinned(self, name, fetch):
+        """Yield the local path of ``name`` and keep any process from evicting it until the block ends."""
+        with self._open_pin(name) as pin_file:
+            # Taken before the copy is looked up, so an eviction is either finished or held off.
+            fcntl.flock(pin_file, fcntl.LOCK_SH)
+            yield self.get(name, fetch)
+
+    def _remove_unpinned(self, name):
+        """Remove the local copy of ``name`` unless a process holds a pin on it; returns whether it did."""
+        with self._open_pin(name) as pin_file:
+            try:
+                fcntl.flock(pin_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            return True
+
+    def add(self, name):
+        """Track a local copy that matches the stored object, then evict down to the size limit."""
+        path = self.path(name)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._forget(name)
+            self._tracked()[name] = size
+            self._total += size
+        touch(path)
+        self.evict()
+
+    def discard(self, name):
+        with self._lock:
+            self._forget(name)
+        try:
+            os.remove(self._pin_path(name))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Remove the least recently used local copies until the tracked ones fit in ``max_bytes``.
+
+        The copies are only looked at once the running total is over the limit, and without the lock
+        that reads need.
+        """
+        with self._lock:
+            entries = self._tracked()
+            if self._total <= self.max_bytes:
+                return []
+            names = list(entries)
+
+        copies = []
+        for name in names:
+            try:
+                copies.append((os.stat(self.path(name)).st_atime, name))
+            except FileNotFoundError:
+                # Evicted or deleted by another process.
+                with self._lock:
+                    self._forget(name)
+
+        evicted = []
+        for _, name in sorted(copies):
+            with self._lock:
+                if self._total <= self.max_bytes:
+                    break
+                if name in self._fetches:
+                    continue
+            if self._remove_unpinned(name):
+                with self._lock:
+                    self._forget(name)
+                evicted.append(name)
+        if evicted:
+            metrics.media_cache_evictions.inc(len(evicted))
+        return evicted
+
+
+def touch(path):
+    # Access time only: the modification time is what Last-Modified and the ETags of downloads use.
+    os.utime(path, (time.time(), os.stat(path).st_mtime))
+
+
+class TieredStorage(FileSystemStorage):
+    """FileSystemStorage under MEDIA_ROOT that publishes every file to an object store.
+
+    Local copies may be evicted at any time, so read through ``local_path``/``pinned`` (or ``open``)
+    rather than ``path``. Empty files, such as the placeholder a resumable upload reserves its name
+    with, stay local until ``publish`` is called for them.
+    """
+
+    def __init__(self, object_store=None, cache_max_bytes=None, part_size=None, transfer_threads=None, **kwargs):
+        super().__init__(**kwargs)
+        self._object_store = object_store
+        self._cache_max_bytes = cache_max_bytes
+        self._part_size = part_size
+        self._transfer_threads = transfer_threads
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    @cached_property
+    def object_store(self):
+        return self._object_store or import_string(settings.MEDIA_OBJECT_STORE)()
+
+    @cached_property
+    def cache(self):
+        max_bytes = self._cache_max_bytes
+        if max_bytes is None:
+            max_bytes = float(settings.MEDIA_HOT_CACHE_MAX_MB) * 1024 * 1024
+        return HotCache(self.location, max_bytes, self.object_store)
+
+    @property
+    def part_size(self):
+        return self._part_size or settings.MEDIA_TRANSFER_PART_MB * 1024 * 1024
+
+    def _transfers(self):
+        with self._executor_lock:
+            # A forked child inherits the pool without its threads, so it starts its own.
+            if self._executor is None or self._executor_pid != os.getpid():
+                workers = self._transfer_threads or settings.MEDIA_TRANSFER_THREADS
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media-transfer")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        if os.path.getsize(self.path(name)):
+            self.publish(name)
+        return name
+
+    def publish(self, name):
+        """Upload the local file ``name`` to the object store in parallel parts and cache the local copy."""
+        path = self.path(name)
+        size = os.path.getsize(path)
+        offsets = list(range(0, size, self.part_size)) or [0]
+        with metrics.stage_timer("storage", "publish"), open(path, "rb") as source_file:
+            upload_id = self.object_store.create_multipart_upload(name)
+
+            def upload_part(part):
+                part_number, offset = part
+                data = os.pread(source_file.fileno(), self.part_size, offset)
+                self.object_store.upload_part(name, upload_id, part_number, data)
+
+            try:
+                list(self._transfers().map(upload_part, enumerate(offsets, start=1)))
+                self.object_store.complete_multipart_upload(name, upload_id, len(offsets))
+            except BaseException:
+                self.object_store.abort_multipart_upload(name, upload_id)
+                raise
+        metrics.media_bytes.inc(size, operation="storage", direction="out")
+        self.cache.add(name)
+        return name
+
+    def _fetch(self, name, path):
+        """Download ``name`` into ``path`` in parallel ranged reads; the file appears only once complete."""
+        with metrics.stage_timer("storage", "fetch"):
+            size = self.object_store.head(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=PARTIAL_PREFIX, delete=False) as target:
+                target.truncate(size)
+
+                def fetch_part(offset):
+                    data = self.object_store.get_range(name, offset, min(self.part_size, size - offset))
+                    os.pwrite(target.fileno(), data, offset)
+
+                try:
+                    list(self._transfers().map(fetch_part, range(0, size, self.part_size)))
+                except BaseException:
+                    os.remove(target.name)
+                    raise
+            os.replace(target.name, path)
+        metrics.media_bytes.inc(size, operation="storage", direction="in")
+
+    def local_path(self, name):
+        """Path of a local copy of ``name``, fetched from the object store when it is not cached."""
+        return self.cache.get(name, self._fetch)
+
+    def pinned(self, name):
+        """Context manager yielding the local path of ``name``, which is not evicted while it runs."""
+        return self.cache.pinned(name, self._fetch)
+
+    def _open(self, name, mode="rb"):
+        if "w" not in mode and "a" not in mode:
+            self.local_path(name)
+        return super()._open(name, mode)
+
+    def exists(self, name):
+        return os.path.lexists(self.path(name)) or self.object_store.exists(name)
+
+    def size(self, name):
+        try:
+            return super().size(name)
+        except FileNotFoundError:
+            return self.object_store.head(name)
+
+    def delete(self, name):
+        self.cache.discard(name)
+        super().delete(name)
+        self.object_store.delete(name)
+
+
+def is_tiered(storage):
+    return isinstance(storage, TieredStorage)
+
+
+def publish(file_name):
+    """Publish a file a processor wrote under MEDIA_ROOT when media is tiered; returns the name either way."""
+    if is_tiered(default_storage):
+        default_storage.publish(file_name)
+    return file_name
+
+
+def publish_directory(directory):
+    """Publish every file a processor wrote under MEDIA_ROOT/``directory`` when media is tiered."""
+    if not is_tiered(default_storage):
+        return
+    root = os.path.join(settings.MEDIA_ROOT, directory)
+    for path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            default_storage.publish(os.path.relpath(os.path.join(path, file_name), settings.MEDIA_ROOT))
+
+
+def delete_directory(directory):
+    """Remove MEDIA_ROOT/``directory`` and, when media is tiered, every published file under it."""
+    shutil.rmtree(os.path.join(settings.MEDIA_ROOT, directory), ignore_errors=True)
+    if is_tiered(default_storage):
+        # Listed from the store, since evicted files are no longer under MEDIA_ROOT.
+        for key in list(default_storage.object_store.keys(prefix=directory.rstrip("/") + "/")):
+            default_storage.delete(key)
+
+
+def stored_file_path(file_name):
+    """Local path of a file below MEDIA_ROOT, fetched back first when media is tiered and it was evicted."""
+    if is_tiered(default_storage):
+        return default_storage.local_path(file_name)
+    return os.path.join(settings.MEDIA_ROOT, file_name)
+
+
+class StoredFilePin:
+    """A pin on a file below MEDIA_ROOT that outlives the view taking it, e.g. held by a streamed response.
+
+    ``path`` is the local path, fetched back first when media is tiered; ``release`` lets the copy be
+    evicted again and may be called more than once. Off tiered storage nothing is pinned.
+    """
+
+    def __init__(self, file_name):
+        if is_tiered(default_storage):
+            self._context = default_storage.pinned(file_name)
+        else:
+            self._context = nullcontext(os.path.join(settings.MEDIA_ROOT, file_name))
+        self.path = self._context.__enter__()
+
+    def release(self):
+        context, self._context = self._context, None
+        if context is not None:
+            context.__exit__(None, None, None)
+
+
+def pinned(media_file):
+    """Keep a stored file's local copy from being evicted while the block runs; a no-op off tiered storage."""
+    storage = getattr(media_file, "storage", None)
+    return storage.pinned(media_file.name) if is_tiered(storage) else nullcontext()
+
+
+@contextmanager
+def local_media_path(field_file):
+    """Yield a local path of a stored file; on tiered storage it is fetched and kept until the block ends."""
+    if is_tiered(getattr(field_file, "storage", None)):
+        with field_file.storage.pinned(field_file.name) as path:
+            yield path
+    else:
+        yield field_file.path
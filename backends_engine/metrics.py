@@ -0,0 +1,300 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Every thread updates its own shard, so recording a value takes no lock; shards are only summed
+when /metrics is scraped. With METRICS_DIR set, each process also writes its totals to
+``<METRICS_DIR>/<pid>.json`` every METRICS_FLUSH_INTERVAL_SEC (and after each job), and the process
+answering the scrape adds up the files of all the others, so worker processes are included.
+"""
+
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from backends_engine.profiling import record_span
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MEDIA_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Metric:
+    def __init__(self, registry, name, kind, documentation, labelnames, buckets=None):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets or ())
+
+    def _key(self, labels):
+        return (self.name, tuple(str(labels[label]) for label in self.labelnames))
+
+    def inc(self, amount=1, **labels):
+        shard = self.registry.shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def observe(self, value, **labels):
+        shard = self.registry.shard()
+        key = self._key(labels)
+        # One count per bucket (not cumulative) plus +Inf, then the sum of all observations.
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [0] * (len(self.buckets) + 2)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+def merge_value(totals, key, value):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            current[index] += item
+    else:
+        totals[key] = current + value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._reset()
+
+    def _reset(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (thread, shard) for every thread that recorded something, and the totals of finished threads.
+        self._shards = []
+        self._retired = {}
+        self._flusher = None
+
+    def _register(self, name, kind, documentation, labelnames=(), buckets=None):
+        metric = Metric(self, name, kind, documentation, labelnames, buckets)
+        self.metrics[name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(name, COUNTER, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(name, GAUGE, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        return self._register(name, HISTOGRAM, documentation, labelnames, buckets)
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def snapshot(self):
+        """Totals of this process: {(name, label values): value}."""
+        with self._lock:
+            live_shards = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live_shards.append((thread, shard))
+                else:
+                    for key, value in shard.items():
+                        merge_value(self._retired, key, value)
+            self._shards = live_shards
+
+            totals = {}
+            for key, value in self._retired.items():
+                merge_value(totals, key, value)
+            for _, shard in live_shards:
+                # dict() copies in one step, so a thread recording at the same time cannot break the loop.
+                for key, value in dict(shard).items():
+                    merge_value(totals, key, value)
+        return totals
+
+    def flush(self):
+        """Write this process's totals to METRICS_DIR for the process answering /metrics."""
+        if not settings.METRICS_DIR:
+            return
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        entries = [[name, list(labels), value] for (name, labels), value in self.snapshot().items()]
+        with tempfile.NamedTemporaryFile("w", dir=settings.METRICS_DIR, suffix=".tmp", delete=False) as temp_file:
+            json.dump(entries, temp_file)
+        os.replace(temp_file.name, os.path.join(settings.METRICS_DIR, f"{os.getpid()}.json"))
+
+    def start_flusher(self):
+        if not settings.METRICS_DIR or self._flusher is not None:
+            return
+        stop = threading.Event()
+        self._flusher = (threading.Thread(target=self._flush_periodically, args=(stop,), daemon=True), stop)
+        self._flusher[0].start()
+
+    def _flush_periodically(self, stop):
+        while not stop.wait(settings.METRICS_FLUSH_INTERVAL_SEC):
+            self.flush()
+
+    def after_fork(self):
+        # A forked child starts from zero; the parent keeps reporting what it recorded before the fork.
+        restart = self._flusher is not None
+        self._reset()
+        if restart:
+            self.start_flusher()
+
+    def collect(self):
+        """Totals of this process plus, in multi-process mode, those written by the other processes."""
+        totals = self.snapshot()
+        if not settings.METRICS_DIR:
+            return totals
+
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+            pid = int(os.path.basename(path).split(".")[0])
+            if pid == os.getpid():
+                continue
+            alive = process_alive(pid)
+            try:
+                with open(path) as metrics_file:
+                    entries = json.load(metrics_file)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in entries:
+                metric = self.metrics.get(name)
+                # A gauge of a process that has exited no longer describes anything in progress.
+                if metric is None or (metric.kind == GAUGE and not alive):
+                    continue
+                merge_value(totals, (name, tuple(labels)), value)
+        return totals
+
+    def render(self):
+        """The collected metrics in the Prometheus text exposition format (version 0.0.4)."""
+        totals = self.collect()
+        series = {}
+        for (name, labels), value in totals.items():
+            series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(series.get(name, [])):
+                label_pairs = list(zip(metric.labelnames, labels))
+                if metric.kind != HISTOGRAM:
+                    lines.append(f"{name}{format_labels(label_pairs)} {format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    bucket_labels = label_pairs + [("le", format_value(bound))]
+                    lines.append(f"{name}_bucket{format_labels(bucket_labels)} {format_value(cumulative)}")
+                lines.append(f"{name}_sum{format_labels(label_pairs)} {format_value(value[-1])}")
+                lines.append(f"{name}_count{format_labels(label_pairs)} {format_value(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def format_labels(label_pairs):
+    if not label_pairs:
+        return ""
+    escaped = (
+        (label, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for label, value in label_pairs
+    )
+    return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.after_fork)
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route, method and status.", ["method", "route", "status"]
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to returning its response (streamed bodies not included).",
+    ["method", "route"],
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled.")
+media_stage_duration = registry.histogram(
+    "media_stage_duration_seconds",
+    "Time spent in each stage of uploads, trims and merges.",
+    ["operation", "stage"],
+    buckets=MEDIA_BUCKETS,
+)
+media_bytes = registry.counter(
+    "media_bytes_processed_total", "Bytes of media read or written by each operation.", ["operation", "direction"]
+)
+ffmpeg_processes = registry.counter("ffmpeg_processes_total", "ffmpeg subprocesses started, by purpose.", ["purpose"])
+media_jobs_in_flight = registry.gauge("media_jobs_in_flight", "Background jobs being run.", ["job_type"])
+media_jobs = registry.counter("media_jobs_total", "Background jobs finished, by outcome.", ["job_type", "status"])
+media_cache_requests = registry.counter(
+    "media_hot_cache_requests_total",
+    "Reads of tiered media: hit, miss (fetched from the object store) or shared (waited on another fetch).",
+    ["result"],
+)
+media_cache_evictions = registry.counter("media_hot_cache_evictions_total", "Local copies evicted from the hot cache.")
+
+
+@contextmanager
+def stage_timer(operation, stage):
+    """Time a stage into media_stage_duration_seconds and the profile of the request, if any."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        media_stage_duration.observe(elapsed, operation=operation, stage=stage)
+        record_span(f"{operation}.{stage}", elapsed)
+
+
+def count_bytes(operation, direction, paths):
+    """Add the size of the files at ``paths`` to the bytes processed by ``operation``."""
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            continue
+    media_bytes.inc(total, operation=operation, direction=direction)
@@ -0,0 +1,102 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from backends_engine.metrics import http_request_duration, http_requests, http_requests_in_flight
+from backends_engine.profiling import RequestProfile, profiling_trigger
+
+
+def route_label(request):
+    # The URL pattern rather than the path, so ids do not create a series per object.
+    resolver_match = getattr(request, "resolver_match", None)
+    return resolver_match.route if resolver_match is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    """Count requests and time them by route; works in front of both the sync and the async views."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            http_requests_in_flight.dec()
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            http_requests_in_flight.dec()
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(request, response, duration):
+        route = route_label(request)
+        http_requests.inc(method=request.method, route=route, status=response.status_code)
+        http_request_duration.observe(duration, method=request.method, route=route)
+
+
+class ProfilingMiddleware:
+    """Profile the requests picked by profiling_trigger and store the result; others pass straight through.
+
+    Under ASGI the event loop thread is profiled, so other requests served meanwhile show up in the
+    function statistics too; the spans only ever cover the profiled request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = profiling_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        profile = RequestProfile(request, trigger)
+        profile.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = profile.stop()
+        return self.finish(request, response, profile, duration)
+
+    async def __acall__(self, request):
+        trigger = profiling_trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+
+        profile = RequestProfile(request, trigger)
+        profile.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = profile.stop()
+        return self.finish(request, response, profile, duration)
+
+    @staticmethod
+    def finish(request, response, profile, duration):
+        profile.save(duration, response.status_code, route_label(request))
+        response["X-Profile-Id"] = profile.id
+        return response
@@ -3,6 +3,8 @@ from django.db import models
 from django.core.exceptions import ValidationError
 import os
 
+from backends_engine.media_probe import METADATA_FIELDS
+
 
 def validate_video_file_extension(value):
     ext = os.path.splitext(value.name)[1]
@@ -13,16 +15,85 @@ def validate_video_file_extension(value):
         )
 
 
+class MediaBlob(models.Model):
+    """A stored upload, shared by every VideoUpload whose bytes hash to the same SHA-256."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="videos/")
+    size_bytes = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.sha256} referenced {self.ref_count} times"
+
+
 class VideoUpload(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     file = models.FileField(upload_to="videos/", validators=[validate_video_file_extension])
+    blob = models.ForeignKey(MediaBlob, on_delete=models.PROTECT, related_name="uploads", null=True, blank=True)
     file_size = models.FloatField(null=True, blank=True)
     duration = models.FloatField(null=True, blank=True)
+    container = models.CharField(max_length=16, null=True, blank=True)
+    video_codec = models.CharField(max_length=32, null=True, blank=True)
+    audio_codec = models.CharField(max_length=32, null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    frame_rate = models.FloatField(null=True, blank=True, help_text="Frames per second")
+    bit_rate = models.PositiveBigIntegerField(null=True, blank=True, help_text="Overall bit rate in bits per second")
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["uploaded_at", "id"])]
+
     def __str__(self):
         return f"Video {self.id} uploaded at {self.uploaded_at}"
 
+    def stream_metadata(self):
+        return {field: getattr(self, field) for field in METADATA_FIELDS + ["duration"]}
+
+
+class UploadSession(models.Model):
+    """A resumable upload: chunks are written in place into ``file`` until the session is completed."""
+
+    OPEN = "open"
+    COMPLETING = "completing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    STATUS_CHOICES = [(OPEN, "Open"), (COMPLETING, "Completing"), (COMPLETED, "Completed"), (FAILED, "Failed")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file = models.FileField(upload_to="videos/", validators=[validate_video_file_extension])
+    size_bytes = models.PositiveBigIntegerField(help_text="Total size declared by the client")
+    offset = models.PositiveBigIntegerField(default=0, help_text="Bytes received so far")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=OPEN)
+    video_upload = models.ForeignKey(
+        VideoUpload, on_delete=models.SET_NULL, related_name="upload_sessions", null=True, blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload session {self.id} at {self.offset}/{self.size_bytes} bytes ({self.status})"
+
+
+class VideoPreview(models.Model):
+    """Thumbnail and scrubbing sprite sheet of an upload; paths are relative to MEDIA_ROOT."""
+
+    video = models.OneToOneField(VideoUpload, on_delete=models.CASCADE, related_name="preview")
+    thumbnail = models.CharField(max_length=255)
+    sprite = models.CharField(max_length=255)
+    sprite_index = models.CharField(max_length=255, help_text="WebVTT cues mapping time spans to sprite tiles")
+    interval = models.FloatField(help_text="Seconds between sampled frames")
+    tile_width = models.PositiveIntegerField()
+    tile_height = models.PositiveIntegerField()
+    tile_count = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Preview of video {self.video_id} with {self.tile_count} tiles"
+
 
 def get_trimmed_video_upload_path(instance, filename):
     # Constructs a path under 'MEDIA_ROOT/trimmed_videos/<filename>'
@@ -38,8 +109,12 @@ class TrimmedVideo(models.Model):
         upload_to=get_trimmed_video_upload_path, validators=[validate_video_file_extension], null=True, blank=True
     )
     duration = models.FloatField(null=True, blank=True)
+    derivation_key = models.CharField(max_length=64, null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at", "id"]), models.Index(fields=["parent_video", "created_at"])]
+
     def __str__(self):
         return f"Trimmed video {self.id} from {self.start_time} to {self.end_time} seconds"
 
@@ -51,7 +126,93 @@ class MergedVideo(models.Model):
         upload_to="merged_videos/", validators=[validate_video_file_extension], null=True, blank=True
     )
     duration = models.FloatField(null=True, blank=True)
+    derivation_key = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    hls_playlist = models.CharField(
+        max_length=255, null=True, blank=True, help_text="Master playlist of the HLS package, relative to MEDIA_ROOT"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at", "id"])]
+
     def __str__(self):
         return f"Merged video {self.id} created from trimming clips"
+
+
+class RevokedLink(models.Model):
+    """A shared link withdrawn before its expiry, identified by a digest of its token."""
+
+    digest = models.CharField(max_length=32, unique=True)
+    merged_video = models.ForeignKey(
+        MergedVideo, on_delete=models.CASCADE, related_name="revoked_links", null=True, blank=True
+    )
+    expires_at = models.DateTimeField(help_text="When the link would have expired; the row is useless after that")
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Revoked link {self.digest}"
+
+
+class ProcessingJob(models.Model):
+    TRIM = "trim"
+    MERGE = "merge"
+    PACKAGE = "package"
+    PREVIEW = "preview"
+    JOB_TYPE_CHOICES = [(TRIM, "Trim"), (MERGE, "Merge"), (PACKAGE, "HLS packaging"), (PREVIEW, "Preview")]
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (SUCCEEDED, "Succeeded"), (FAILED, "Failed")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job_type = models.CharField(max_length=16, choices=JOB_TYPE_CHOICES)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    parameters = models.JSONField(default=dict)
+    trimmed_videos = models.ManyToManyField(TrimmedVideo, related_name="processing_jobs", blank=True)
+    merged_video = models.ForeignKey(
+        MergedVideo, on_delete=models.SET_NULL, related_name="processing_jobs", null=True, blank=True
+    )
+    error = models.TextField(null=True, blank=True)
+    worker = models.CharField(max_length=255, null=True, blank=True, help_text="Worker that claimed the job")
+    attempts = models.PositiveIntegerField(default=0, help_text="How many times a worker has claimed the job")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last time the claiming worker checked in")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["status", "heartbeat_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.job_type} job {self.id} ({self.status})"
+
+
+class DerivedArtifact(models.Model):
+    """A trim or merge output registered in the derivation cache under the hash of its inputs."""
+
+    key = models.CharField(max_length=64, unique=True)
+    operation = models.CharField(max_length=16)
+    file = models.FileField()
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.operation} artifact {self.key}"
+
+
+class DerivationCacheStats(models.Model):
+    operation = models.CharField(max_length=16, unique=True)
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    evictions = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.operation}: {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
@@ -0,0 +1,33 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from backends_engine.utils import success_true_response
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """Keyset pagination, newest first: each page is an indexed range scan, however deep the client pages.
+
+    The id tie-breaker keeps the order total when rows share a timestamp. No COUNT(*) is issued.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+    def get_paginated_data(self, data):
+        result = success_true_response(data=data)
+        result["next"] = self.get_next_link()
+        result["previous"] = self.get_previous_link()
+        return result
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class UploadedAtCursorPagination(CreatedAtCursorPagination):
+    ordering = ("-uploaded_at", "-id")
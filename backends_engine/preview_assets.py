@@ -0,0 +1,194 @@
+import logging
+import math
+import os
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from backends_engine.models import VideoPreview
+from backends_engine.video_media_processor import resolve_local_path
+from backends_engine.media_storage import delete_directory, pinned, publish
+
+logger_debug = logging.getLogger("debug")
+
+PREVIEW_DIRECTORY = "previews"
+RESIZE_BATCH_SIZE = 8
+IMAGE_WRITE_PARAMS = {
+    "jpg": lambda quality: [cv2.IMWRITE_JPEG_QUALITY, quality],
+    "webp": lambda quality: [cv2.IMWRITE_WEBP_QUALITY, quality],
+}
+
+
+class PreviewError(Exception):
+    pass
+
+
+def sample_timestamps(duration, interval, max_tiles):
+    """Evenly spaced sample times; the interval widens so long videos stay within ``max_tiles``."""
+    interval = max(interval, duration / max_tiles)
+    count = max(1, math.ceil(duration / interval))
+    return [index * interval for index in range(count)], interval
+
+
+def even_size(width, source_width, source_height):
+    height = round(width * source_height / source_width / 2) * 2
+    return width, max(2, height)
+
+
+def resize_batch(frames, tile_size):
+    """Shrink same-sized frames with one cv2.resize by stacking them along the channel axis.
+
+    Interpolation never mixes channels, so this matches resizing every frame on its own.
+    """
+    tile_width, tile_height = tile_size
+    stacked = cv2.resize(np.concatenate(frames, axis=2), tile_size, interpolation=cv2.INTER_AREA)
+    return stacked.reshape(tile_height, tile_width, len(frames), 3).transpose(2, 0, 1, 3)
+
+
+def sample_frames(capture, timestamps, tile_size):
+    """Seek to every timestamp and decode one frame there, instead of decoding the whole stream.
+
+    Decoded frames are shrunk to ``tile_size`` RESIZE_BATCH_SIZE at a time, so memory stays bounded
+    by the tiles plus one batch; positions past the last decodable frame are left black.
+    """
+    tile_width, tile_height = tile_size
+    tiles = np.zeros((len(timestamps), tile_height, tile_width, 3), dtype=np.uint8)
+    batch, filled = [], 0
+    for timestamp in timestamps:
+        capture.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+        ok, frame = capture.read()
+        if not ok:
+            break
+        batch.append(frame)
+        if len(batch) == RESIZE_BATCH_SIZE:
+            end = filled + len(batch)
+            tiles[filled:end] = resize_batch(batch, tile_size)
+            filled, batch = end, []
+    if batch:
+        end = filled + len(batch)
+        tiles[filled:end] = resize_batch(batch, tile_size)
+    return tiles
+
+
+def tile_sprite_sheet(tiles, columns):
+    """Lay tiles out row by row in one image with a single reshape, padding the last row with black."""
+    count, tile_height, tile_width, channels = tiles.shape
+    columns = min(columns, count)
+    rows = math.ceil(count / columns)
+    padded = np.zeros((rows * columns, tile_height, tile_width, channels), dtype=tiles.dtype)
+    padded[:count] = tiles
+    return (
+        padded.reshape(rows, columns, tile_height, tile_width, channels)
+        .swapaxes(1, 2)
+        .reshape(rows * tile_height, columns * tile_width, channels)
+    )
+
+
+def format_timestamp(seconds):
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+
+def sprite_index(timestamps, duration, tile_size, columns, sprite_uri):
+    """WebVTT cues pointing every time span at its tile with a media fragment (#xywh)."""
+    tile_width, tile_height = tile_size
+    columns = min(columns, len(timestamps))
+    cues = ["WEBVTT", ""]
+    for index, start in enumerate(timestamps):
+        end = timestamps[index + 1] if index + 1 < len(timestamps) else duration
+        x, y = (index % columns) * tile_width, (index // columns) * tile_height
+        cues.append(f"{format_timestamp(start)} --> {format_timestamp(end)}")
+        cues.append(f"{sprite_uri}#xywh={x},{y},{tile_width},{tile_height}")
+        cues.append("")
+    return "\n".join(cues)
+
+
+def write_image(path, image, image_format):
+    if not cv2.imwrite(path, image, IMAGE_WRITE_PARAMS[image_format](settings.PREVIEW_IMAGE_QUALITY)):
+        raise PreviewError(f"Cannot write preview image {path}.")
+
+
+def generate_previews(video_upload):
+    """Write the thumbnail, scrubbing sprite sheet and WebVTT index of an upload, then publish and record them."""
+    # The cached copy of the source has to stay while OpenCV reads it.
+    with pinned(video_upload.file):
+        source_path = resolve_local_path(video_upload.file)
+        if source_path is None:
+            raise PreviewError("Previews need the video on local storage.")
+
+        capture = cv2.VideoCapture(source_path)
+        try:
+            if not capture.isOpened():
+                raise PreviewError("Cannot open the video for preview generation.")
+            source_width = capture.get(cv2.CAP_PROP_FRAME_WIDTH)
+            source_height = capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            duration = video_upload.duration
+            if not duration:
+                frame_rate = capture.get(cv2.CAP_PROP_FPS)
+                duration = capture.get(cv2.CAP_PROP_FRAME_COUNT) / frame_rate if frame_rate else 0
+            if not (source_width and source_height and duration):
+                raise PreviewError("The video has no decodable frames.")
+
+            timestamps, interval = sample_timestamps(
+                duration, settings.PREVIEW_INTERVAL_SEC, settings.PREVIEW_MAX_TILES
+            )
+            tile_size = even_size(settings.PREVIEW_TILE_WIDTH, source_width, source_height)
+            tiles = sample_frames(capture, timestamps, tile_size)
+            # The frame a tenth of the way in skips black intros without sampling a second time.
+            thumbnail = sample_frames(
+                capture, [duration * 0.1], even_size(settings.THUMBNAIL_WIDTH, source_width, source_height)
+            )[0]
+        finally:
+            capture.release()
+
+    image_format = settings.PREVIEW_IMAGE_FORMAT
+    relative_directory = os.path.join(PREVIEW_DIRECTORY, str(video_upload.id))
+    output_directory = os.path.join(settings.MEDIA_ROOT, relative_directory)
+    os.makedirs(output_directory, exist_ok=True)
+
+    names = {
+        "thumbnail": os.path.join(relative_directory, f"thumbnail.{image_format}"),
+        "sprite": os.path.join(relative_directory, f"sprite.{image_format}"),
+        "sprite_index": os.path.join(relative_directory, "sprite.vtt"),
+    }
+    write_image(os.path.join(settings.MEDIA_ROOT, names["thumbnail"]), thumbnail, image_format)
+    write_image(
+        os.path.join(settings.MEDIA_ROOT, names["sprite"]),
+        tile_sprite_sheet(tiles, settings.PREVIEW_SPRITE_COLUMNS),
+        image_format,
+    )
+    with open(os.path.join(settings.MEDIA_ROOT, names["sprite_index"]), "w") as index_file:
+        # Relative to the index itself, which is right when MEDIA_URL serves the directory.
+        index_file.write(
+            sprite_index(
+                timestamps, duration, tile_size, settings.PREVIEW_SPRITE_COLUMNS, os.path.basename(names["sprite"])
+            )
+        )
+    for name in names.values():
+        publish(name)
+
+    preview, _ = VideoPreview.objects.update_or_create(
+        video=video_upload,
+        defaults={
+            **names,
+            "interval": interval,
+            "tile_width": tile_size[0],
+            "tile_height": tile_size[1],
+            "tile_count": len(timestamps),
+        },
+    )
+    logger_debug.debug(
+        "Previews generated for video %s: %s tiles every %ss", video_upload.id, len(timestamps), interval
+    )
+    return preview
+
+
+def point_index_at(index_text, sprite_name, sprite_url):
+    """Rewrite the sprite references of a stored WebVTT index to ``sprite_url``."""
+    return index_text.replace(f"{sprite_name}#xywh=", f"{sprite_url}#xywh=")
+
+
+def delete_preview_files(preview):
+    delete_directory(os.path.dirname(preview.sprite))
@@ -0,0 +1,197 @@
+"""Opt-in profiling of single requests.
+
+A request is profiled when it carries a valid signed ``X-Profile`` header (see ``profiles sign``) or
+is picked by PROFILING_SAMPLE_RATE. The request thread runs under cProfile, and the media stages and
+ffmpeg subprocess waits it goes through are timed as spans, including the parts sync_to_async runs
+on other threads.
+Each profile is saved to PROFILING_DIR as ``<id>.prof`` (pstats) with a ``<id>.json`` summary.
+
+Requests that are not profiled pay for a META lookup and a float comparison, and every span for a
+context variable lookup.
+"""
+
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.signing import BadSignature, SignatureExpired, TimestampSigner
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+REQUEST_ID_HEADER = "HTTP_X_REQUEST_ID"
+# Profile ids name the files in PROFILING_DIR; they are always generated here, never taken from a client.
+PROFILE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+MAX_REQUEST_ID_LENGTH = 128
+TOP_FUNCTIONS = 20
+
+signer = TimestampSigner(salt="backends_engine.profiling")
+
+_active_profile = ContextVar("active_profile", default=None)
+# cProfile hooks a whole thread, so only one request per thread can run under it at a time.
+_thread_state = threading.local()
+
+
+def sign_profile_token():
+    return signer.sign("profile")
+
+
+def profiling_trigger(request):
+    """Why the request should be profiled ("header" or "sample"), or None to leave it alone."""
+    token = request.META.get(PROFILE_HEADER)
+    if token is not None:
+        try:
+            signer.unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE_SEC)
+            return "header"
+        except (BadSignature, SignatureExpired):
+            pass
+    sample_rate = settings.PROFILING_SAMPLE_RATE
+    if sample_rate > 0 and random.random() < sample_rate:
+        return "sample"
+    return None
+
+
+def record_span(name, seconds):
+    """Add ``seconds`` spent in ``name`` to the profile of the current request, if it is profiled."""
+    profile = _active_profile.get()
+    if profile is not None:
+        count, total = profile.spans.get(name, (0, 0.0))
+        profile.spans[name] = (count + 1, total + seconds)
+
+
+@contextmanager
+def span(name):
+    if _active_profile.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+class RequestProfile:
+    def __init__(self, request, trigger):
+        self.id = uuid.uuid4().hex
+        # The client's request id is only recorded, for finding the profile of a given request.
+        self.request_id = request.META.get(REQUEST_ID_HEADER, "")[:MAX_REQUEST_ID_LENGTH] or None
+        self.method = request.method
+        self.path = request.path
+        self.trigger = trigger
+        self.started_at = datetime.now(timezone.utc)
+        self.spans = {}
+        self.profiler = None
+        self._started = None
+        self._token = None
+
+    def start(self):
+        self._token = _active_profile.set(self)
+        if not getattr(_thread_state, "profiling", False):
+            _thread_state.profiling = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        duration = time.perf_counter() - self._started
+        if self.profiler is not None:
+            self.profiler.disable()
+            _thread_state.profiling = False
+        _active_profile.reset(self._token)
+        return duration
+
+    def summary(self, duration, status_code, route):
+        return {
+            "id": self.id,
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "status": status_code,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "duration_s": round(duration, 6),
+            "spans": {
+                name: {"count": count, "total_s": round(total, 6)}
+                for name, (count, total) in sorted(self.spans.items(), key=lambda item: -item[1][1])
+            },
+            "top_functions": self.top_functions(),
+        }
+
+    def top_functions(self):
+        if self.profiler is None:
+            return []
+        stats = pstats.Stats(self.profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:TOP_FUNCTIONS]
+        return [
+            {
+                "function": f"{os.path.basename(file_name)}:{line}({function_name})",
+                "calls": calls,
+                "total_s": round(total_time, 6),
+                "cumulative_s": round(cumulative_time, 6),
+            }
+            for (file_name, line, function_name), (_, calls, total_time, cumulative_time, _) in rows
+        ]
+
+    def save(self, duration, status_code, route):
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        summary = self.summary(duration, status_code, route)
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.join(settings.PROFILING_DIR, f"{self.id}.prof"))
+        with open(os.path.join(settings.PROFILING_DIR, f"{self.id}.json"), "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        prune_profiles()
+        return summary
+
+
+def profile_paths():
+    """Summary files of the stored profiles, newest first."""
+    return sorted(glob.glob(os.path.join(settings.PROFILING_DIR, "*.json")), key=os.path.getmtime, reverse=True)
+
+
+def prune_profiles():
+    keep = settings.PROFILING_MAX_PROFILES
+    for summary_path in profile_paths()[keep:]:
+        for path in (summary_path, summary_path[: -len(".json")] + ".prof"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def recent_profiles(limit=20):
+    summaries = []
+    for path in profile_paths()[:limit]:
+        try:
+            with open(path) as summary_file:
+                summaries.append(json.load(summary_file))
+        except (OSError, ValueError):
+            continue
+    return summaries
+
+
+def load_profile(profile_id):
+    """Return (summary, path of the pstats dump or None); raises FileNotFoundError for unknown ids."""
+    if not PROFILE_ID_PATTERN.fullmatch(profile_id):
+        raise FileNotFoundError(f"No profile {profile_id}")
+    with open(os.path.join(settings.PROFILING_DIR, f"{profile_id}.json")) as summary_file:
+        summary = json.load(summary_file)
+    stats_path = os.path.join(settings.PROFILING_DIR, f"{profile_id}.prof")
+    return summary, stats_path if os.path.exists(stats_path) else None
+
+
+def format_stats(stats_path, sort="cumulative", limit=30):
+    output = io.StringIO()
+    pstats.Stats(stats_path, stream=output).sort_stats(sort).print_stats(limit)
+    return output.getvalue()
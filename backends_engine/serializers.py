@@ -1,12 +1,36 @@
 from rest_framework import serializers
-from backends_engine.models import VideoUpload, TrimmedVideo, MergedVideo
+from backends_engine.models import VideoUpload, TrimmedVideo, MergedVideo, ProcessingJob
 
 
 class UploadedVideoSerializer(serializers.ModelSerializer):
     class Meta:
         model = VideoUpload
-        fields = ["id", "file", "file_size", "duration", "uploaded_at"]
-        read_only_fields = ["file_size", "duration", "uploaded_at"]
+        fields = [
+            "id",
+            "file",
+            "file_size",
+            "duration",
+            "container",
+            "video_codec",
+            "audio_codec",
+            "width",
+            "height",
+            "frame_rate",
+            "bit_rate",
+            "uploaded_at",
+        ]
+        read_only_fields = [
+            "file_size",
+            "duration",
+            "container",
+            "video_codec",
+            "audio_codec",
+            "width",
+            "height",
+            "frame_rate",
+            "bit_rate",
+            "uploaded_at",
+        ]
 
     def validate_file(self, value):
         if not value:
@@ -33,8 +57,8 @@ class MergedVideoSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = MergedVideo
-        fields = ["id", "trimmed_videos", "file", "duration", "created_at"]
-        read_only_fields = ["file", "duration", "created_at"]
+        fields = ["id", "trimmed_videos", "file", "duration", "hls_playlist", "created_at"]
+        read_only_fields = ["file", "duration", "hls_playlist", "created_at"]
 
     def validate_trimmed_videos(self, value):
         """
@@ -43,3 +67,25 @@ class MergedVideoSerializer(serializers.ModelSerializer):
         if len(value) < 2:
             raise serializers.ValidationError("At least two trimmed videos are required to merge.")
         return value
+
+
+class ProcessingJobSerializer(serializers.ModelSerializer):
+    trimmed_videos = TrimmedVideoSerializer(many=True, read_only=True)
+    merged_video = MergedVideoSerializer(read_only=True)
+
+    class Meta:
+        model = ProcessingJob
+        fields = [
+            "id",
+            "job_type",
+            "status",
+            "parameters",
+            "trimmed_videos",
+            "merged_video",
+            "error",
+            "attempts",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+        read_only_fields = fields
@@ -0,0 +1,174 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from backends_engine.models import MergedVideo, RevokedLink
+from backends_engine.utils import LinkGenerator
+
+ResolvedLink = namedtuple("ResolvedLink", ["merged_video_id", "file_name", "hls_playlist", "expires_at"])
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire; safe to share between request threads."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RevocationSet:
+    """Digests of revoked tokens still within their expiry, mirrored from RevokedLink.
+
+    Revocations made in this process apply at once; those made elsewhere are picked up on the next
+    refresh, at most LINK_CACHE_TTL_SEC later.
+    """
+
+    def __init__(self):
+        self._expiries = {}
+        self._synced_at = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, digest):
+        return digest in self._expiries
+
+    def add(self, digest, expires_at):
+        with self._lock:
+            self._expiries[digest] = expires_at
+
+    def is_stale(self):
+        return time.monotonic() - self._checked_at >= settings.LINK_CACHE_TTL_SEC
+
+    def refresh(self):
+        now = datetime.now(timezone.utc)
+        revoked_links = RevokedLink.objects.filter(expires_at__gt=now)
+        if self._synced_at is not None:
+            # A little overlap so rows committed while the last refresh ran are not missed.
+            revoked_links = revoked_links.filter(revoked_at__gte=self._synced_at - timedelta(seconds=5))
+        rows = list(revoked_links.values_list("digest", "expires_at"))
+
+        with self._lock:
+            for digest, expires_at in rows:
+                self._expiries[digest] = expires_at.timestamp()
+            cutoff = now.timestamp()
+            for digest in [digest for digest, expires_at in self._expiries.items() if expires_at <= cutoff]:
+                del self._expiries[digest]
+            self._synced_at = now
+            self._checked_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._expiries.clear()
+            self._synced_at = None
+            self._checked_at = 0.0
+
+
+link_cache = TTLCache(settings.LINK_CACHE_MAX_ENTRIES)
+revocations = RevocationSet()
+
+
+def token_digest(token):
+    # 16 bytes of SHA-256: collisions are out of reach and the set stays small.
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def cached_link(token):
+    """The cached resolution of ``token``, or None when it has to go through resolve_link.
+
+    Touches neither the database nor the filesystem, so async views can call it on the event loop.
+    """
+    if revocations.is_stale():
+        return None
+    if token_digest(token) in revocations:
+        raise ValidationError("The link has been revoked.")
+    return link_cache.get(token)
+
+
+def resolve_link(token):
+    """Validate ``token`` and return the ResolvedLink of its merged video, from the cache when possible.
+
+    Raises ValidationError for invalid, expired or revoked links and MergedVideo.DoesNotExist when the
+    video is gone.
+    """
+    if revocations.is_stale():
+        revocations.refresh()
+    resolved = cached_link(token)
+    if resolved is not None:
+        return resolved
+
+    merged_video_id, expires_at = LinkGenerator.unsign_link(token)
+    merged_video = MergedVideo.objects.only("id", "file", "hls_playlist").get(id=merged_video_id)
+    resolved = ResolvedLink(
+        merged_video_id=str(merged_video.id),
+        file_name=merged_video.file.name,
+        hls_playlist=merged_video.hls_playlist,
+        expires_at=expires_at,
+    )
+    # Never keep an entry past the link's own expiry.
+    link_cache.set(token, resolved, min(settings.LINK_CACHE_TTL_SEC, expires_at - time.time()))
+    return resolved
+
+
+def revoke_link(token):
+    """Withdraw a shared link before it expires; every link to the video stays valid otherwise."""
+    merged_video_id, expires_at = LinkGenerator.unsign_link(token)
+    if not MergedVideo.objects.filter(id=merged_video_id).exists():
+        raise MergedVideo.DoesNotExist(f"Merged video {merged_video_id} does not exist.")
+    digest = token_digest(token)
+    RevokedLink.objects.get_or_create(
+        digest=digest,
+        defaults={
+            "merged_video_id": merged_video_id,
+            "expires_at": datetime.fromtimestamp(expires_at, tz=timezone.utc),
+        },
+    )
+    revocations.add(digest, expires_at)
+    link_cache.pop(token)
+    return merged_video_id
+
+
+def forget_merged_video(merged_video_id):
+    """Drop cached links of a merged video, e.g. once it is deleted."""
+    merged_video_id = str(merged_video_id)
+    link_cache.discard_where(lambda resolved: resolved.merged_video_id == merged_video_id)
@@ -0,0 +1,38 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from backends_engine.content_store import release_blob
+from backends_engine.hls_packaging import delete_hls_package
+from backends_engine.models import MergedVideo, VideoPreview, VideoUpload
+from backends_engine.preview_assets import delete_preview_files
+from backends_engine.shared_links import forget_merged_video
+from media_management.database import configure_connection
+
+
+@receiver(post_delete, sender=VideoUpload)
+def release_video_upload_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+
+@receiver(post_delete, sender=VideoPreview)
+def delete_video_preview_files(sender, instance, **kwargs):
+    delete_preview_files(instance)
+
+
+@receiver(post_delete, sender=MergedVideo)
+def delete_merged_video_hls_package(sender, instance, **kwargs):
+    delete_hls_package(instance)
+
+
+@receiver(post_save, sender=MergedVideo)
+@receiver(post_delete, sender=MergedVideo)
+def forget_shared_links(sender, instance, **kwargs):
+    # Cached links carry the file name and HLS playlist, which a save may change and a delete removes.
+    forget_merged_video(instance.id)
+
+
+@receiver(connection_created)
+def tune_database_connection(sender, connection, **kwargs):
+    configure_connection(connection)
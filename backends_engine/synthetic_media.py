@@ -0,0 +1,63 @@
+import numpy as np
+from moviepy.editor import AudioClip, VideoClip
+
+from backends_engine.ffmpeg_tools import run_ffmpeg
+
+
+def generate_test_video(output_path, duration=30, width=640, height=360, fps=25, gop_seconds=2, codec="libx264"):
+    """Write a deterministic test-pattern video with a sine-tone audio track.
+
+    The GOP length is fixed so keyframe-based trims behave the same on every run.
+    """
+    video_source = ["-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}"]
+    audio_source = ["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100"]
+    video_encode = ["-t", str(duration), "-c:v", codec, "-g", str(int(fps * gop_seconds)), "-pix_fmt", "yuv420p"]
+    run_ffmpeg(video_source + audio_source + video_encode + ["-c:a", "aac", "-shortest", output_path])
+    return output_path
+
+
+def synthetic_frame_maker(width, height, seed=0):
+    """A make_frame(t) drawing a scrolling colour gradient with fixed noise, for moviepy's VideoClip.
+
+    The noise pattern comes from a seeded generator and is drawn once, so every run yields the same
+    frames; it also keeps the encoder from compressing the frames down to nothing.
+    """
+    rows = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    columns = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    noise = np.random.default_rng(seed).integers(0, 48, size=(height, width, 3), dtype=np.uint8)
+
+    def make_frame(t):
+        shift = np.float32(t * 40)
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[..., 0] = (columns + shift) % 256
+        frame[..., 1] = (rows + shift * 0.5) % 256
+        frame[..., 2] = (rows + columns + shift * 2) % 256
+        return frame + noise
+
+    return make_frame
+
+
+def generate_synthetic_video(
+    output_path, duration=10, width=640, height=360, fps=25, gop_seconds=2, codec="libx264", seed=0
+):
+    """Render a deterministic video with NumPy frames and a 440 Hz tone through moviepy.
+
+    Unlike generate_test_video the frames are produced in Python, so the duration, resolution, codec and
+    content can be varied freely; ``codec`` is any encoder moviepy's ffmpeg writer accepts.
+    """
+    clip = VideoClip(synthetic_frame_maker(width, height, seed), duration=duration)
+    clip = clip.set_audio(
+        AudioClip(lambda t: np.sin(2 * np.pi * 440 * np.asarray(t)).reshape(-1, 1) * 0.2, duration=duration, fps=44100)
+    )
+    clip.write_videofile(
+        output_path,
+        fps=fps,
+        codec=codec,
+        audio_codec="aac",
+        threads=1,
+        ffmpeg_params=["-g", str(int(fps * gop_seconds)), "-pix_fmt", "yuv420p"],
+        verbose=False,
+        logger=None,
+    )
+    clip.close()
+    return output_path
@@ -1,14 +1,89 @@
 import pytest
+from django.test import AsyncClient
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from backends_engine.models import VideoUpload, TrimmedVideo, MergedVideo
-from backends_engine.factories import UserFactory, VideoUploadFactory, TrimmedVideoFactory
+from backends_engine.models import (
+    VideoUpload,
+    TrimmedVideo,
+    MergedVideo,
+    ProcessingJob,
+    MediaBlob,
+    DerivedArtifact,
+    DerivationCacheStats,
+    UploadSession,
+    VideoPreview,
+    RevokedLink,
+)
+from backends_engine import derivation_cache
+from backends_engine.utils import LinkGenerator
+from backends_engine.media_jobs import (
+    claim_next_job,
+    enqueue_hls_packaging,
+    requeue_stale_jobs,
+    run_job,
+    trim_parent_video,
+)
+from backends_engine.hls_packaging import delete_hls_package, package_merged_video, resolve_hls_asset
+from backends_engine.preview_assets import generate_previews, resize_batch
+from backends_engine.shared_links import link_cache, resolve_link, revocations
+from backends_engine.trim_executor import ParallelTrimExecutor
+from backends_engine.factories import UserFactory, VideoUploadFactory, TrimmedVideoFactory, MergedVideoFactory
 from backends_engine.video_media_processor import VideoMediaProcessor
+from backends_engine.synthetic_media import generate_synthetic_video, generate_test_video
+from backends_engine.management.commands.benchmark_media import Command as BenchmarkCommand, compare_results, summarize
+from backends_engine.ffmpeg_tools import run_ffmpeg, stream_info
+from backends_engine.media_probe import ProbeError, probe_media
+from io import BytesIO
+from django.core.files import File
+from django.core.files.base import ContentFile
 import tempfile
 from django.core.exceptions import ValidationError
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from datetime import timedelta
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
 from unittest.mock import patch
+from types import SimpleNamespace
+import uuid
+from urllib.parse import urlencode, parse_qs, urlsplit
+import time
+import cv2
+import numpy as np
+from asgiref.sync import async_to_sync
+import sqlite3
+from media_management.database import apply_sqlite_pragmas, database_settings, sqlite_pragmas
+from media_management.custom_log_handlers import (
+    DailyFileHandler, JsonLineFormatter, LazyQueueHandler, start_queue_listener
+)
+import fcntl
+import json
+import shutil
+import subprocess
+import logging
+import os
+import struct
+import threading
+from backends_engine import metrics
+from backends_engine import profiling
+from backends_engine.media_storage import LocalObjectStore, StoredFilePin, TieredStorage, publish_directory
+from backends_engine.file_delivery import serve_file
+from django.core.files.storage import default_storage
+from django.test import RequestFactory
+from backends_engine.upload_sessions import UploadOffsetMismatch, append_chunk, complete_session
+
+
+def read_streaming_body(response):
+    if not response.is_async:
+        return b"".join(response.streaming_content)
+
+    async def collect():
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    return async_to_sync(collect)()
+
+
+# An 'ftyp' box without a 'moov': recognised as MP4 but carries no duration for the early checks.
+FAKE_MP4_HEADER = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
 
 
 @pytest.mark.django_db
@@ -22,7 +97,7 @@ class TestUploadedVideoViewSet:
 
     @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
     def test_upload_video_success(self, mock_validate_media):
-        video_data = SimpleUploadedFile("test_video.mp4", b"fake_video_content", content_type="video/mp4")
+        video_data = SimpleUploadedFile("test_video.mp4", FAKE_MP4_HEADER + b"fake_video_content")
 
         data = {"file": video_data}
 
@@ -32,6 +107,18 @@ class TestUploadedVideoViewSet:
         assert VideoUpload.objects.count() == 1
         assert "id" in response.data["data"]
 
+    def test_upload_video_stores_stream_metadata(self, tmp_path):
+        source_path = generate_test_video(str(tmp_path / "source.mp4"), duration=6, width=320, height=240)
+        with open(source_path, "rb") as source_file:
+            video_data = SimpleUploadedFile("test_video.mp4", source_file.read(), content_type="video/mp4")
+
+        response = self.client.post(self.url, {"file": video_data}, format="multipart")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        video = VideoUpload.objects.get(id=response.data["data"]["id"])
+        assert (video.video_codec, video.width, video.height, video.frame_rate) == ("h264", 320, 240, 25.0)
+        assert video.duration == 6.0
+
     @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
     def test_upload_no_file_provided(self, mock_validate_media):
         data = {}
@@ -55,6 +142,179 @@ class TestUploadedVideoViewSet:
         assert "Unsupported file extension" in response.data["message"]
         assert VideoUpload.objects.count() == 0
 
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
+    def test_upload_without_video_container_is_rejected_while_streaming(self, mock_validate_media):
+        file_data = SimpleUploadedFile("test_video.mp4", b"<html>not a video</html>", content_type="video/mp4")
+
+        response = self.client.post(self.url, {"file": file_data}, format="multipart")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["message"] == "The uploaded file is not a supported video container."
+        mock_validate_media.assert_not_called()
+
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
+    def test_oversized_upload_is_rejected_while_streaming(self, mock_validate_media, settings):
+        settings.MAX_VIDEO_SIZE_MB = 0.1
+        file_data = SimpleUploadedFile("test_video.mp4", FAKE_MP4_HEADER + bytes(200 * 1024), content_type="video/mp4")
+
+        response = self.client.post(self.url, {"file": file_data}, format="multipart")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "File size exceeds the maximum limit of 0.1 MB." in response.data["message"]
+        mock_validate_media.assert_not_called()
+
+    def test_header_duration_out_of_range_is_rejected_without_ffmpeg(self, tmp_path, settings):
+        settings.MAX_VIDEO_DURATION_SEC = 4
+        source_path = generate_test_video(str(tmp_path / "source.mp4"), duration=6, width=160, height=120)
+        with open(source_path, "rb") as source_file:
+            file_data = SimpleUploadedFile("test_video.mp4", source_file.read(), content_type="video/mp4")
+
+        with patch("backends_engine.video_media_processor.VideoFileClip") as mock_clip:
+            response = self.client.post(self.url, {"file": file_data}, format="multipart")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "Media duration must be between" in response.data["message"]
+        mock_clip.assert_not_called()
+
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
+    def test_duplicate_upload_reuses_blob(self, mock_validate_media):
+        for _ in range(2):
+            video_data = SimpleUploadedFile("test_video.mp4", FAKE_MP4_HEADER + b"same_video_content")
+            response = self.client.post(self.url, {"file": video_data}, format="multipart")
+            assert response.status_code == status.HTTP_201_CREATED
+
+        first, second = VideoUpload.objects.order_by("uploaded_at")
+        assert MediaBlob.objects.count() == 1
+        assert first.blob_id == second.blob_id
+        assert first.file.name == second.file.name
+        assert (second.file_size, second.duration) == (5.0, 10.0)
+        assert first.blob.ref_count == 2
+        mock_validate_media.assert_called_once()
+
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
+    def test_deleting_uploads_releases_blob(self, mock_validate_media):
+        for _ in range(2):
+            video_data = SimpleUploadedFile("test_video.mp4", FAKE_MP4_HEADER + b"released_video_content")
+            self.client.post(self.url, {"file": video_data}, format="multipart")
+        first, second = VideoUpload.objects.order_by("uploaded_at")
+        file_name = first.file.name
+
+        first.delete()
+        assert MediaBlob.objects.get().ref_count == 1
+        assert second.file.storage.exists(file_name)
+
+        second.delete()
+        assert MediaBlob.objects.count() == 0
+        assert not second.file.storage.exists(file_name)
+
+
+@pytest.mark.django_db
+class TestUploadSessionViewSet:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path, settings):
+        settings.MEDIA_ROOT = str(tmp_path)
+        self.media_root = tmp_path
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+
+    def open_session(self, content, filename="clip.mp4"):
+        data = {"filename": filename, "size": len(content)}
+        response = self.client.post(reverse("uploads-list"), data, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        return reverse("uploads-detail", args=[response.data["data"]["id"]])
+
+    def send_chunk(self, url, chunk, offset):
+        return self.client.generic(
+            "PATCH", url, chunk, content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunks_resume_from_reported_offset(self):
+        content = b"0123456789" * 10
+        url = self.open_session(content)
+
+        assert self.send_chunk(url, content[:40], 0).data["data"]["offset"] == 40
+        response = self.send_chunk(url, content[40:], 10)
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response["Upload-Offset"] == "40"
+
+        resume_offset = int(self.client.get(url)["Upload-Offset"])
+        assert self.send_chunk(url, content[resume_offset:], resume_offset).data["data"]["offset"] == len(content)
+        session = UploadSession.objects.get()
+        assert (self.media_root / session.file.name).read_bytes() == content
+
+    def test_racing_chunk_is_rejected_without_writing(self):
+        content = b"0123456789" * 10
+        self.open_session(content)
+        session = UploadSession.objects.get()
+        stale_session = UploadSession.objects.get()
+
+        with open(self.media_root / session.file.name, "r+b") as held_file:
+            # Another request is mid-write and holds the session file.
+            fcntl.flock(held_file.fileno(), fcntl.LOCK_EX)
+            with pytest.raises(UploadOffsetMismatch):
+                append_chunk(session, 0, BytesIO(b"x" * 40), 40)
+        assert append_chunk(session, 0, BytesIO(content[:40]), 40) == 40
+
+        # A request that checked the offset before the other one finished loses once it gets the lock.
+        with pytest.raises(UploadOffsetMismatch):
+            append_chunk(stale_session, 0, BytesIO(b"y" * 40), 40)
+        assert (self.media_root / session.file.name).read_bytes()[:40] == content[:40]
+
+    def test_complete_creates_video_from_session_file(self, tmp_path):
+        source_path = generate_test_video(str(tmp_path / "source.mp4"), duration=6, width=160, height=120)
+        with open(source_path, "rb") as source_file:
+            content = source_file.read()
+        url = self.open_session(content)
+        chunk_size = 16 * 1024
+        for offset in range(0, len(content), chunk_size):
+            self.send_chunk(url, content[offset:][:chunk_size], offset)
+
+        response = self.client.post(url + "complete/")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        video = VideoUpload.objects.get(id=response.data["data"]["video_id"])
+        assert video.file.name == UploadSession.objects.get().file.name
+        assert (video.duration, video.width, video.height) == (6.0, 160, 120)
+
+    def test_session_is_completed_only_once(self, tmp_path):
+        source_path = generate_test_video(str(tmp_path / "source.mp4"), duration=6, width=160, height=120)
+        with open(source_path, "rb") as source_file:
+            content = source_file.read()
+        url = self.open_session(content)
+        self.send_chunk(url, content, 0)
+        session = UploadSession.objects.get()
+        # A second request loaded the session while it was still open.
+        stale_session = UploadSession.objects.get()
+
+        with patch("backends_engine.upload_sessions.publish", side_effect=OSError("object store unavailable")):
+            with pytest.raises(OSError):
+                complete_session(session, VideoMediaProcessor)
+        assert UploadSession.objects.get().status == UploadSession.OPEN
+
+        complete_session(session, VideoMediaProcessor)
+        with pytest.raises(ValidationError, match="Upload session is completed."):
+            complete_session(stale_session, VideoMediaProcessor)
+        assert VideoUpload.objects.count() == 1
+        assert (self.media_root / session.file.name).exists()
+
+    def test_incomplete_upload_cannot_be_completed(self):
+        url = self.open_session(b"x" * 100)
+        self.send_chunk(url, b"x" * 50, 0)
+
+        response = self.client.post(url + "complete/")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["message"] == "Upload is incomplete: 50 of 100 bytes received."
+        assert VideoUpload.objects.count() == 0
+
+    def test_session_rejects_oversized_or_unsupported_files(self):
+        response = self.client.post(reverse("uploads-list"), {"filename": "clip.mp4", "size": 100 * 1024 * 1024})
+        assert "File size exceeds the maximum limit" in response.data["message"]
+
+        response = self.client.post(reverse("uploads-list"), {"filename": "notes.txt", "size": 100})
+        assert "Unsupported file extension" in response.data["message"]
+        assert UploadSession.objects.count() == 0
+
 
 @pytest.mark.django_db
 class TestTrimmedVideoViewSet:
@@ -70,7 +330,10 @@ class TestTrimmedVideoViewSet:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert response.data["message"] == "Please provide 'parent_video' and 'trims'."
 
-    @patch("backends_engine.video_media_processor.VideoMediaProcessor.trim_media", return_value="path/to/trimmed_video.mp4")
+    @patch(
+        "backends_engine.video_media_processor.VideoMediaProcessor.trim_media_batch",
+        return_value=["path/to/trimmed_video.mp4"],
+    )
     def test_create_trimmed_video_success(self, mock_trim_media):
         parent_video = VideoUploadFactory()
         trims = [{"start_time": 2, "end_time": 5}]
@@ -84,7 +347,61 @@ class TestTrimmedVideoViewSet:
         assert len(response.data["data"]) == 1
         assert TrimmedVideo.objects.count() == 1
 
-    @patch("backends_engine.video_media_processor.VideoMediaProcessor.trim_media", side_effect=ValidationError("Cannot trim media file"))
+    @patch(
+        "backends_engine.video_media_processor.VideoMediaProcessor.trim_media_batch",
+        return_value=["path/to/trimmed_video.mp4"],
+    )
+    def test_create_trimmed_video_with_mode(self, mock_trim_media):
+        parent_video = VideoUploadFactory()
+        data = {"parent_video": str(parent_video.id), "trims": [{"start_time": 2, "end_time": 5}], "mode": "copy"}
+
+        response = self.client.post(self.url, data, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        mock_trim_media.assert_called_once_with([(2.0, 5.0)], mode="copy", profile="preview")
+
+    @patch(
+        "backends_engine.video_media_processor.VideoMediaProcessor.trim_media_batch",
+        return_value=["path/to/trimmed_video.mp4"],
+    )
+    def test_create_trimmed_video_with_profile(self, mock_trim_media):
+        parent_video = VideoUploadFactory()
+        data = {"parent_video": str(parent_video.id), "trims": [{"start_time": 2, "end_time": 5}], "profile": "high"}
+
+        response = self.client.post(self.url, data, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        mock_trim_media.assert_called_once_with([(2.0, 5.0)], mode="reencode", profile="high")
+
+        data["profile"] = "lossless"
+        response = self.client.post(self.url, data, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "Unsupported encoding profile" in response.data["message"]
+
+    def test_create_trimmed_video_invalid_mode(self):
+        parent_video = VideoUploadFactory()
+        data = {"parent_video": str(parent_video.id), "trims": [{"start_time": 2, "end_time": 5}], "mode": "fast"}
+
+        response = self.client.post(self.url, data, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "Unsupported trim mode" in response.data["message"]
+
+    @patch(
+        "backends_engine.video_media_processor.VideoMediaProcessor.trim_media_batch",
+        return_value=["path/to/first.mp4", "path/to/second.mp4"],
+    )
+    def test_create_multiple_trimmed_videos_single_batch(self, mock_trim_media):
+        parent_video = VideoUploadFactory()
+        trims = [{"start_time": 8, "end_time": 9}, {"start_time": 2, "end_time": 5}]
+        data = {"parent_video": str(parent_video.id), "trims": trims}
+
+        response = self.client.post(self.url, data, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        mock_trim_media.assert_called_once_with([(8.0, 9.0), (2.0, 5.0)], mode="reencode", profile="preview")
+        assert [video["start_time"] for video in response.data["data"]] == [8.0, 2.0]
+
+    @patch(
+        "backends_engine.video_media_processor.VideoMediaProcessor.trim_media_batch",
+        side_effect=ValidationError("Cannot trim media file"),
+    )
     def test_create_trimmed_video_validation_error(self, mock_trim_media):
         parent_video = VideoUploadFactory()
         trims = [{"start_time": 2, "end_time": 5}]
@@ -97,7 +414,10 @@ class TestTrimmedVideoViewSet:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert "Cannot trim media file" in response.data["message"]
 
-    @patch("backends_engine.video_media_processor.VideoMediaProcessor.trim_media", return_value="path/to/trimmed_video.mp4")
+    @patch(
+        "backends_engine.video_media_processor.VideoMediaProcessor.trim_media_batch",
+        return_value=["path/to/trimmed_video.mp4"],
+    )
     def test_create_trimmed_video_unexpected_error(self, mock_trim_media):
         parent_video = VideoUploadFactory()
         trims = [{"start_time": 2, "end_time": 5}]
@@ -106,7 +426,9 @@ class TestTrimmedVideoViewSet:
             "trims": trims,
         }
 
-        with patch("backends_engine.models.TrimmedVideo.objects.create", side_effect=Exception("Unexpected error")):
+        with patch(
+            "backends_engine.models.TrimmedVideo.objects.bulk_create", side_effect=Exception("Unexpected error")
+        ):
             response = self.client.post(self.url, data, format="json")
             assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
             assert "An unexpected error occurred" in response.data["message"]
@@ -144,6 +466,51 @@ class TestMergedVideoViewSet:
         assert len(response.data["data"]["trimmed_videos"]) == 2
         assert MergedVideo.objects.count() == 1
 
+    @patch.object(VideoMediaProcessor, 'merge_media', return_value="path/to/merged_video.mp4")
+    def test_merge_keeps_requested_order(self, mock_merge_media):
+        trimmed_videos = [TrimmedVideoFactory(), TrimmedVideoFactory(), TrimmedVideoFactory()]
+        requested = [trimmed_videos[2], trimmed_videos[0], trimmed_videos[1]]
+        data = {"trimmed_videos": [str(tv.id) for tv in requested]}
+
+        response = self.client.post(self.url, data, format="json")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert mock_merge_media.call_args[0][0] == requested
+
+    def test_merge_reports_every_missing_trimmed_video(self):
+        missing_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+        data = {"trimmed_videos": [missing_ids[0], str(TrimmedVideoFactory().id), missing_ids[1]]}
+
+        response = self.client.post(self.url, data, format="json")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.data["data"]["missing_ids"] == missing_ids
+        assert response.data["message"] == f"Trimmed videos not found: {', '.join(missing_ids)}"
+
+    def test_list_is_cursor_paginated(self):
+        merged_videos = [MergedVideoFactory() for _ in range(3)]
+
+        first_page = self.client.get(self.url, {"page_size": 2})
+        second_page = self.client.get(first_page.json()["next"]).json()
+        first_page = first_page.json()
+
+        listed = [video["id"] for video in first_page["data"] + second_page["data"]]
+        assert listed == [str(video.id) for video in reversed(merged_videos)]
+        assert second_page["next"] is None
+        assert len(first_page["data"][0]["trimmed_videos"]) == 2
+
+    def test_list_query_count_does_not_grow_with_rows(self, django_assert_num_queries):
+        MergedVideoFactory()
+        # The page and one prefetch of the trimmed video ids of every merged video on it.
+        with django_assert_num_queries(2):
+            self.client.get(self.url)
+
+        for _ in range(5):
+            MergedVideoFactory()
+        with django_assert_num_queries(2):
+            response = self.client.get(self.url)
+        assert len(response.json()["data"]) == 6
+
     @patch.object(VideoMediaProcessor, 'merge_media', side_effect=ValidationError("Cannot merge media files"))
     def test_create_merged_video_validation_error(self, mock_merge_media):
         trimmed_videos = [TrimmedVideoFactory(), TrimmedVideoFactory()]
@@ -162,3 +529,1094 @@ class TestMergedVideoViewSet:
             response = self.client.post(self.url, data, format="json")
             assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
             assert "An unexpected error occurred" in response.data["message"]
+
+
+@pytest.mark.django_db
+class TestProcessingJobs:
+    @pytest.fixture(autouse=True)
+    def setup_method(self):
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.trim_media_batch")
+    def test_async_trim_returns_job_and_worker_completes_it(self, mock_trim_media):
+        mock_trim_media.return_value = ["path/to/trimmed_video.mp4"]
+        parent_video = VideoUploadFactory()
+        data = {"parent_video": str(parent_video.id), "trims": [{"start_time": 2, "end_time": 5}], "async": True}
+
+        response = self.client.post(reverse("trimmed-video-list"), data, format="json")
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        mock_trim_media.assert_not_called()
+        job_id = response.data["data"]["job_id"]
+        assert ProcessingJob.objects.get(id=job_id).status == ProcessingJob.QUEUED
+
+        assert str(claim_next_job("test-worker")) == job_id
+        assert claim_next_job("test-worker") is None
+        run_job(job_id)
+
+        response = self.client.get(reverse("jobs-detail", args=[job_id]))
+        assert response.json()["status"] == ProcessingJob.SUCCEEDED
+        assert len(response.json()["trimmed_videos"]) == 1
+
+    @patch.object(VideoMediaProcessor, "merge_media", side_effect=ValidationError("Cannot merge media files"))
+    def test_async_merge_failure_is_recorded_on_job(self, mock_merge_media):
+        trimmed_videos = [TrimmedVideoFactory(), TrimmedVideoFactory()]
+        data = {"trimmed_videos": [str(tv.id) for tv in trimmed_videos], "async": "true"}
+
+        response = self.client.post(reverse("merge-video-list"), data, format="json")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+        job_id = claim_next_job("test-worker")
+        run_job(job_id)
+
+        job = ProcessingJob.objects.get(id=job_id)
+        assert job.status == ProcessingJob.FAILED
+        assert "Cannot merge media files" in job.error
+        assert [str(video.id) for video in mock_merge_media.call_args.args[0]] == data["trimmed_videos"]
+
+    def test_job_with_expired_lease_is_requeued_then_failed(self, settings):
+        settings.MEDIA_JOB_LEASE_SEC = 60
+        settings.MEDIA_JOB_MAX_ATTEMPTS = 2
+        job = ProcessingJob.objects.create(job_type=ProcessingJob.MERGE, parameters={})
+        expired = timezone.now() - timedelta(seconds=61)
+
+        assert claim_next_job("dead-worker") == job.id
+        assert requeue_stale_jobs() == (0, 0)
+        ProcessingJob.objects.filter(id=job.id).update(heartbeat_at=expired)
+        assert requeue_stale_jobs() == (1, 0)
+        job.refresh_from_db()
+        assert (job.status, job.worker, job.attempts) == (ProcessingJob.QUEUED, None, 1)
+
+        assert claim_next_job("other-worker") == job.id
+        ProcessingJob.objects.filter(id=job.id).update(heartbeat_at=expired)
+        assert requeue_stale_jobs() == (0, 1)
+        job.refresh_from_db()
+        assert (job.status, job.attempts) == (ProcessingJob.FAILED, 2)
+
+
+@pytest.mark.django_db
+class TestDerivationCache:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path, settings):
+        settings.MEDIA_ROOT = str(tmp_path)
+        self.media_root = tmp_path
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+
+    def write_output(self, name, size=10):
+        (self.media_root / name).parent.mkdir(parents=True, exist_ok=True)
+        (self.media_root / name).write_bytes(b"x" * size)
+        return name
+
+    def stats(self, operation):
+        return DerivationCacheStats.objects.get(operation=operation)
+
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.trim_media_batch")
+    def test_identical_trim_reuses_cached_output(self, mock_trim_media):
+        mock_trim_media.side_effect = lambda time_ranges, mode, profile: [
+            self.write_output(f"trimmed_videos/{uuid.uuid4().hex}.mp4") for _ in time_ranges
+        ]
+        parent_video = VideoUploadFactory()
+        data = {"parent_video": str(parent_video.id), "trims": [{"start_time": 2, "end_time": 5}]}
+
+        first = self.client.post(reverse("trimmed-video-list"), data, format="json")
+        second = self.client.post(reverse("trimmed-video-list"), data, format="json")
+        self.client.post(reverse("trimmed-video-list"), {**data, "mode": "copy"}, format="json")
+
+        assert second.status_code == status.HTTP_201_CREATED
+        assert mock_trim_media.call_count == 2
+        assert first.data["data"][0]["file"] == second.data["data"][0]["file"]
+        assert (self.stats(ProcessingJob.TRIM).hits, self.stats(ProcessingJob.TRIM).misses) == (1, 2)
+
+    @patch.object(VideoMediaProcessor, "merge_media")
+    def test_identical_merge_reuses_cached_output(self, mock_merge_media):
+        mock_merge_media.side_effect = lambda trimmed_videos, profile: self.write_output(
+            f"merged_videos/{uuid.uuid4().hex}.mp4"
+        )
+        trimmed_videos = [TrimmedVideoFactory(), TrimmedVideoFactory()]
+        data = {"trimmed_videos": [str(tv.id) for tv in trimmed_videos]}
+
+        self.client.post(reverse("merge-video-list"), data, format="json")
+        self.client.post(reverse("merge-video-list"), data, format="json")
+        self.client.post(reverse("merge-video-list"), {"trimmed_videos": data["trimmed_videos"][::-1]}, format="json")
+
+        assert mock_merge_media.call_count == 2
+        assert MergedVideo.objects.values("file").distinct().count() == 2
+        assert self.stats(ProcessingJob.MERGE).hits == 1
+
+    def test_eviction_drops_least_recently_used_unreferenced_outputs(self):
+        for name in ["old", "used", "new"]:
+            derivation_cache.store(ProcessingJob.TRIM, name, self.write_output(f"trimmed_videos/{name}.mp4", size=100))
+        assert derivation_cache.lookup(ProcessingJob.TRIM, "used") == "trimmed_videos/used.mp4"
+
+        assert derivation_cache.evict(max_bytes=150) == 2
+        assert list(DerivedArtifact.objects.values_list("key", flat=True)) == ["used"]
+        assert not (self.media_root / "trimmed_videos/old.mp4").exists()
+        assert self.stats(ProcessingJob.TRIM).evictions == 2
+
+
+@pytest.mark.django_db
+class TestSharedVideoView:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path, settings):
+        settings.MEDIA_ROOT = str(tmp_path)
+        (tmp_path / "merged_videos").mkdir()
+        self.content = bytes(range(256)) * 40
+        (tmp_path / "merged_videos" / "shared.mp4").write_bytes(self.content)
+        self.merged_video = MergedVideo.objects.create(file="merged_videos/shared.mp4", duration=10)
+        self.client = APIClient()
+        self.token = LinkGenerator.generate_token(str(self.merged_video.id))
+        self.url = reverse("access-shared-video") + "?" + urlencode({"token": self.token})
+        link_cache.clear()
+        revocations.clear()
+
+    def test_full_download_is_streamed_with_validators(self):
+        response = self.client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        # Under WSGI the body must not be an async iterator, which Django would read fully into memory.
+        assert not response.is_async
+        assert read_streaming_body(response) == self.content
+        assert response["Accept-Ranges"] == "bytes"
+        assert response["ETag"] and response["Last-Modified"]
+
+    def test_download_over_asgi(self):
+        async def download():
+            response = await AsyncClient().get(self.url, headers={"Range": "bytes=0-99"})
+            return response, b"".join([chunk async for chunk in response.streaming_content])
+
+        response, body = async_to_sync(download)()
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.is_async
+        assert body == self.content[:100]
+
+    def test_asgi_download_stats_the_file_off_the_event_loop(self, monkeypatch):
+        stat_threads = []
+        real_stat = os.stat
+
+        def recording_stat(path, *args, **kwargs):
+            if str(path).endswith("shared.mp4"):
+                stat_threads.append(threading.get_ident())
+            return real_stat(path, *args, **kwargs)
+
+        monkeypatch.setattr("backends_engine.file_delivery.os.stat", recording_stat)
+
+        async def download():
+            loop_thread = threading.get_ident()
+            response = await AsyncClient().get(self.url)
+            body = b"".join([chunk async for chunk in response.streaming_content])
+            return loop_thread, body
+
+        loop_thread, body = async_to_sync(download)()
+        assert body == self.content
+        assert stat_threads and loop_thread not in stat_threads
+
+    def test_byte_range_returns_partial_content(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response["Content-Range"] == f"bytes 100-199/{len(self.content)}"
+        assert read_streaming_body(response) == self.content[100:200]
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        assert read_streaming_body(response) == self.content[-10:]
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.content)}-")
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response["Content-Range"] == f"bytes */{len(self.content)}"
+
+    def test_conditional_request_returns_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        assert self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+
+        # A stale If-Range validator gets the whole file instead of the range.
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_offload_to_front_proxy(self, settings):
+        settings.MEDIA_DELIVERY_OFFLOAD = "x-accel-redirect"
+        response = self.client.get(self.url)
+        assert response["X-Accel-Redirect"] == "/protected-media/merged_videos/shared.mp4"
+        assert response.content == b""
+
+    def test_link_share_requires_api_token(self, settings):
+        data = {"merged_video_id": str(self.merged_video.id), "expiry_minutes": 10}
+
+        assert self.client.post(reverse("link-share-list"), data, format="json").status_code == 403
+
+        response = self.client.post(
+            reverse("link-share-list"), data, format="json", HTTP_AUTHORIZATION=settings.API_STATIC_TOKEN
+        )
+        assert response.status_code == status.HTTP_200_OK
+        link = response.json()["data"]["link"]
+        assert link.startswith(f"{settings.SITE_URL}/access-shared-video/?token=")
+        _, expires_at = LinkGenerator.unsign_link(parse_qs(urlsplit(link).query)["token"][0])
+        assert 9 * 60 < expires_at - time.time() <= 10 * 60
+
+    def test_link_expiry_is_honoured(self, settings):
+        token = LinkGenerator.generate_token(str(self.merged_video.id), expiry_minutes=5)
+        assert LinkGenerator.validate_link(token) == str(self.merged_video.id)
+
+        with patch("backends_engine.utils.time.time", return_value=time.time() + 6 * 60):
+            with pytest.raises(ValidationError, match="expired"):
+                LinkGenerator.validate_link(token)
+
+        # Tokens signed before expiries were embedded still last LINK_MAX_AGE_MINUTES.
+        assert LinkGenerator.validate_link(LinkGenerator.signer.sign(str(self.merged_video.id)))
+
+    def test_resolved_links_are_cached_until_the_video_changes(self, django_assert_num_queries):
+        resolve_link(self.token)
+        with django_assert_num_queries(0):
+            assert resolve_link(self.token).file_name == "merged_videos/shared.mp4"
+
+        self.merged_video.delete()
+        with pytest.raises(MergedVideo.DoesNotExist):
+            resolve_link(self.token)
+
+    def test_revoked_link_stops_working(self, settings):
+        assert self.client.get(self.url).status_code == status.HTTP_200_OK
+
+        response = self.client.post(
+            reverse("link-share-revoke"),
+            {"link": f"{settings.SITE_URL}{self.url}"},
+            format="json",
+            HTTP_AUTHORIZATION=settings.API_STATIC_TOKEN,
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        response = self.client.get(self.url)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["message"] == "The link has been revoked."
+
+        # Other processes learn about the revocation from the database on their next refresh.
+        revocations.clear()
+        with pytest.raises(ValidationError, match="revoked"):
+            resolve_link(self.token)
+        assert RevokedLink.objects.get().merged_video_id == self.merged_video.id
+
+    def test_unknown_video_is_not_found(self):
+        token = LinkGenerator.signer.sign(str(uuid.uuid4()))
+        assert self.client.get(reverse("access-shared-video"), {"token": token}).status_code == 404
+        assert self.client.get(reverse("merge-video-detail", args=[uuid.uuid4()])).status_code == 404
+
+
+@pytest.mark.django_db
+class TestHlsPackaging:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path, settings):
+        settings.MEDIA_ROOT = str(tmp_path)
+        settings.HLS_SEGMENT_SECONDS = 2
+        settings.HLS_RENDITIONS = [
+            {"name": "120p", "height": 120, "video_kbps": 200, "audio_kbps": 64},
+            {"name": "480p", "height": 480, "video_kbps": 1200, "audio_kbps": 96},
+        ]
+        (tmp_path / "merged_videos").mkdir()
+        generate_test_video(str(tmp_path / "merged_videos" / "merged.mp4"), duration=6, width=320, height=240)
+        self.merged_video = MergedVideo.objects.create(file="merged_videos/merged.mp4", duration=6)
+        self.media_root = tmp_path
+        self.client = APIClient()
+
+    def hls_url(self, asset, token):
+        return reverse("access-shared-video-hls", args=[asset]) + "?" + urlencode({"token": token})
+
+    def test_package_job_writes_playlists_and_segments(self):
+        job = enqueue_hls_packaging(self.merged_video)
+        run_job(job.id)
+
+        self.merged_video.refresh_from_db()
+        assert ProcessingJob.objects.get(id=job.id).status == ProcessingJob.SUCCEEDED
+        assert self.merged_video.hls_playlist == f"hls/{self.merged_video.id}/master.m3u8"
+        master = (self.media_root / self.merged_video.hls_playlist).read_text()
+        # The 480p rendition would upscale the 240p source and is skipped.
+        assert "RESOLUTION=160x120" in master and "480p" not in master
+        index = (self.media_root / "hls" / str(self.merged_video.id) / "120p" / "index.m3u8").read_text()
+        assert index.count("#EXTINF") == 3 and '#EXT-X-MAP:URI="init.mp4"' in index
+
+    def test_shared_link_serves_tokenized_playlists_and_segments(self):
+        package_merged_video(self.merged_video)
+        token = LinkGenerator.signer.sign(str(self.merged_video.id))
+
+        master = self.client.get(self.hls_url("master.m3u8", token))
+        assert master["Content-Type"] == "application/vnd.apple.mpegurl"
+        assert f"120p/index.m3u8?{urlencode({'token': token})}" in master.content.decode()
+
+        index = self.client.get(self.hls_url("120p/index.m3u8", token)).content.decode()
+        assert f'URI="init.mp4?{urlencode({"token": token})}"' in index
+
+        segment = self.client.get(self.hls_url("120p/seg_00000.m4s", token))
+        assert segment.status_code == status.HTTP_200_OK
+        assert "immutable" in segment["Cache-Control"]
+        assert not segment.get("Content-Disposition", "").startswith("attachment")
+
+        assert self.client.get(self.hls_url("../../merged_videos/merged.mp4", token)).status_code == 404
+        assert self.client.get(self.hls_url("master.m3u8", "forged")).status_code == 400
+
+    def test_deleting_merged_video_removes_hls_package(self):
+        package_merged_video(self.merged_video)
+        package_directory = self.media_root / "hls" / str(self.merged_video.id)
+        assert (package_directory / "master.m3u8").exists()
+
+        self.merged_video.delete()
+
+        assert not package_directory.exists()
+
+    @patch.object(VideoMediaProcessor, "merge_media", return_value="merged_videos/merged.mp4")
+    def test_merge_with_hls_queues_packaging(self, mock_merge_media):
+        self.client.force_authenticate(user=UserFactory())
+        trimmed_videos = [TrimmedVideoFactory(), TrimmedVideoFactory()]
+        data = {"trimmed_videos": [str(tv.id) for tv in trimmed_videos], "hls": True}
+
+        response = self.client.post(reverse("merge-video-list"), data, format="json")
+
+        job = ProcessingJob.objects.get(id=response.data["data"]["hls_job_id"])
+        assert (job.job_type, job.status) == (ProcessingJob.PACKAGE, ProcessingJob.QUEUED)
+
+
+@pytest.mark.django_db
+class TestVideoPreviews:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path, settings):
+        settings.MEDIA_ROOT = str(tmp_path)
+        settings.PREVIEW_INTERVAL_SEC = 2
+        settings.PREVIEW_TILE_WIDTH = 80
+        settings.PREVIEW_SPRITE_COLUMNS = 2
+        (tmp_path / "videos").mkdir()
+        generate_test_video(str(tmp_path / "videos" / "source.mp4"), duration=7, width=320, height=240)
+        self.video = VideoUpload.objects.create(file="videos/source.mp4", duration=7.0)
+        self.media_root = tmp_path
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+
+    def test_sprite_sheet_tiles_sampled_frames(self):
+        preview = generate_previews(self.video)
+
+        # Frames at 0, 2, 4 and 6 seconds in a 2x2 grid of 80x60 tiles.
+        assert (preview.tile_count, preview.tile_width, preview.tile_height) == (4, 80, 60)
+        assert cv2.imread(str(self.media_root / preview.sprite)).shape == (120, 160, 3)
+        assert cv2.imread(str(self.media_root / preview.thumbnail)).shape == (360, 480, 3)
+        index = (self.media_root / preview.sprite_index).read_text()
+        assert index.startswith("WEBVTT")
+        assert "00:00:06.000 --> 00:00:07.000\nsprite.jpg#xywh=80,60,80,60" in index
+
+    def test_batched_resize_matches_per_frame_resize(self):
+        frames = [np.random.randint(0, 256, (240, 320, 3), dtype=np.uint8) for _ in range(3)]
+
+        tiles = resize_batch(frames, (80, 60))
+
+        for frame, tile in zip(frames, tiles):
+            assert np.array_equal(tile, cv2.resize(frame, (80, 60), interpolation=cv2.INTER_AREA))
+
+    def test_preview_endpoints(self):
+        thumbnail_url = reverse("videos-thumbnail", args=[self.video.id])
+        assert self.client.get(thumbnail_url).status_code == status.HTTP_404_NOT_FOUND
+
+        generate_previews(self.video)
+
+        thumbnail = self.client.get(thumbnail_url)
+        assert (thumbnail.status_code, thumbnail["Content-Type"]) == (200, "image/jpeg")
+        assert self.client.get(reverse("videos-sprite", args=[self.video.id]))["Content-Type"] == "image/jpeg"
+        index = self.client.get(reverse("videos-sprite-index", args=[self.video.id]))
+        assert index["Content-Type"] == "text/vtt"
+        sprite_url = "http://testserver" + reverse("videos-sprite", args=[self.video.id])
+        assert f"{sprite_url}#xywh=0,0,80,60" in index.content.decode()
+
+    def test_deleting_video_removes_preview_files(self):
+        preview = generate_previews(self.video)
+
+        self.video.delete()
+
+        assert not VideoPreview.objects.exists()
+        assert not (self.media_root / preview.sprite).exists()
+
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
+    def test_upload_queues_preview_job_by_default(self, mock_validate_media):
+        video_data = SimpleUploadedFile("test_video.mp4", FAKE_MP4_HEADER + b"fake_video_content")
+
+        response = self.client.post(reverse("videos-list"), {"file": video_data}, format="multipart")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        job = ProcessingJob.objects.get(job_type=ProcessingJob.PREVIEW)
+        assert job.parameters == {"video_upload": response.data["data"]["id"]}
+
+    @patch("backends_engine.media_jobs.generate_previews")
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
+    def test_sync_upload_generates_previews_in_request(self, mock_validate_media, mock_generate_previews):
+        video_data = SimpleUploadedFile("test_video.mp4", FAKE_MP4_HEADER + b"fake_video_content")
+
+        response = self.client.post(reverse("videos-list"), {"file": video_data, "async": "false"}, format="multipart")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert not ProcessingJob.objects.filter(job_type=ProcessingJob.PREVIEW).exists()
+        mock_generate_previews.assert_called_once()
+
+
+class TestDatabaseSettings:
+    def test_sqlite_with_persistent_connections_by_default(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("DB_ENGINE", raising=False)
+        config = database_settings(tmp_path)
+        assert (config["ENGINE"], config["NAME"], config["CONN_MAX_AGE"]) == (
+            "django.db.backends.sqlite3",
+            tmp_path / "db.sqlite3",
+            60,
+        )
+
+    def test_server_database_from_environment(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("DB_ENGINE", "postgresql")
+        monkeypatch.setenv("DB_HOST", "db.internal")
+        config = database_settings(tmp_path)
+        assert (config["ENGINE"], config["HOST"]) == ("django.db.backends.postgresql", "db.internal")
+
+    def test_new_sqlite_connections_are_tuned(self, tmp_path):
+        connection = sqlite3.connect(tmp_path / "tuned.sqlite3")
+        apply_sqlite_pragmas(connection.cursor(), "wal", 2500, "normal")
+        assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        assert connection.execute("PRAGMA busy_timeout").fetchone() == (2500,)
+        assert connection.execute("PRAGMA synchronous").fetchone() == (1,)
+        with pytest.raises(ValueError):
+            sqlite_pragmas("wal; DROP TABLE upload", 2500, "normal")
+
+
+class TestLogging:
+    def make_file_handler(self, tmp_path, name, **kwargs):
+        handler = DailyFileHandler(str(tmp_path / name), encoding="utf-8", **kwargs)
+        handler.setFormatter(JsonLineFormatter())
+        return handler
+
+    def test_application_loggers_only_enqueue(self):
+        for name in ("debug", "info", "error"):
+            assert [type(handler) for handler in logging.getLogger(name).handlers] == [LazyQueueHandler]
+
+    def test_listener_writes_json_lines_to_each_loggers_files(self, tmp_path):
+        loggers = {name: logging.getLogger(f"test_logging.{name}") for name in ("info", "error")}
+        for name, logger in loggers.items():
+            logger.handlers = [self.make_file_handler(tmp_path, f"{name}_log")]
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+        listener, routes = start_queue_listener([logger.name for logger in loggers.values()])
+        try:
+            loggers["info"].info("Job %s succeeded", "job-1", extra={"job_type": "TRIM"})
+            try:
+                raise ValueError("broken input")
+            except ValueError:
+                loggers["error"].exception("Job %s failed", "job-2")
+        finally:
+            listener.stop()
+            for handlers in routes.values():
+                for handler in handlers:
+                    handler.close()
+
+        info_entries = [json.loads(line) for line in open(routes["test_logging.info"][0].baseFilename)]
+        error_entries = [json.loads(line) for line in open(routes["test_logging.error"][0].baseFilename)]
+        assert [(entry["level"], entry["message"], entry["job_type"]) for entry in info_entries] == [
+            ("INFO", "Job job-1 succeeded", "TRIM")
+        ]
+        assert [entry["message"] for entry in error_entries] == ["Job job-2 failed"]
+        assert "ValueError: broken input" in error_entries[0]["exception"]
+
+    def test_daily_file_rolls_over_at_midnight_and_keeps_backups(self, tmp_path):
+        for old_day in ("01012020", "02012020", "03012020"):
+            (tmp_path / f"{old_day}_app_log.log").write_text("")
+        handler = self.make_file_handler(tmp_path, "app_log", backupCount=2)
+        first_file = handler.baseFilename
+
+        tomorrow = handler.rollover_at + 60
+        record = logging.makeLogRecord(
+            {"msg": "after midnight", "levelno": logging.INFO, "levelname": "INFO", "created": tomorrow}
+        )
+        handler.handle(record)
+        handler.close()
+
+        assert handler.baseFilename.endswith(time.strftime("%d%m%Y", time.localtime(tomorrow)) + "_app_log.log")
+        assert handler.rollover_at > tomorrow
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+            [os.path.basename(first_file), os.path.basename(handler.baseFilename)]
+        )
+
+
+@pytest.mark.django_db
+class TestMetrics:
+    def sample(self, exposition, series):
+        for line in exposition.splitlines():
+            if line.startswith(series + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    def test_requests_are_counted_and_timed_by_route(self):
+        client = APIClient()
+        series = 'http_requests_total{method="GET",route="jobs/",status="200"}'
+        before = self.sample(client.get("/metrics").content.decode(), series)
+
+        client.get(reverse("jobs-list"))
+        response = client.get("/metrics")
+
+        exposition = response.content.decode()
+        assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert self.sample(exposition, series) == before + 1
+        assert "# TYPE http_request_duration_seconds histogram" in exposition
+        assert 'http_request_duration_seconds_bucket{method="GET",route="jobs/",le="+Inf"}' in exposition
+
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
+    def test_upload_stages_are_timed(self, mock_validate_media):
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        stages = [
+            'media_stage_duration_seconds_count{operation="upload",stage="receive"}',
+            'media_stage_duration_seconds_count{operation="upload",stage="db_write"}',
+        ]
+        before = [self.sample(metrics.registry.render(), stage) for stage in stages]
+
+        video_data = SimpleUploadedFile("test_video.mp4", FAKE_MP4_HEADER + b"fake_video_content")
+        response = client.post(reverse("videos-list"), {"file": video_data}, format="multipart")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        exposition = metrics.registry.render()
+        assert [self.sample(exposition, stage) for stage in stages] == [count + 1 for count in before]
+
+    def test_threads_record_without_sharing_a_shard(self):
+        registry = metrics.Registry()
+        counter = registry.counter("test_events_total", "Events.", ["kind"])
+        histogram = registry.histogram("test_seconds", "Durations.", buckets=(0.1, 1))
+
+        def record():
+            for _ in range(1000):
+                counter.inc(kind='a "quoted"\nvalue')
+            histogram.observe(0.5)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        histogram.observe(5)
+
+        exposition = registry.render()
+        assert 'test_events_total{kind="a \\"quoted\\"\\nvalue"} 4000.0' in exposition
+        assert 'test_seconds_bucket{le="0.1"} 0.0' in exposition
+        assert 'test_seconds_bucket{le="1.0"} 4.0' in exposition
+        assert 'test_seconds_bucket{le="+Inf"} 5.0' in exposition
+        assert "test_seconds_sum 7.0" in exposition
+
+    def test_scrape_adds_up_other_processes(self, settings, tmp_path):
+        settings.METRICS_DIR = str(tmp_path)
+        registry = metrics.Registry()
+        jobs = registry.counter("test_jobs_total", "Jobs.")
+        running = registry.gauge("test_jobs_running", "Jobs running.")
+        jobs.inc()
+        running.inc()
+        dead_pid = 2**22 + 1
+        for pid in (os.getppid(), dead_pid):
+            entries = [["test_jobs_total", [], 2], ["test_jobs_running", [], 1]]
+            (tmp_path / f"{pid}.json").write_text(json.dumps(entries))
+
+        exposition = registry.render()
+
+        assert "test_jobs_total 5.0" in exposition
+        # The exited process no longer counts towards what is running.
+        assert "test_jobs_running 2.0" in exposition
+
+
+@pytest.mark.django_db
+class TestProfiling:
+    @pytest.fixture(autouse=True)
+    def profiling_dir(self, settings, tmp_path):
+        settings.PROFILING_DIR = str(tmp_path)
+        settings.PROFILING_SAMPLE_RATE = 0
+        return tmp_path
+
+    @patch("backends_engine.video_media_processor.VideoMediaProcessor.validate_media", return_value=(5.0, 10.0))
+    def test_signed_header_profiles_the_request(self, mock_validate_media):
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        video_data = SimpleUploadedFile("test_video.mp4", FAKE_MP4_HEADER + b"fake_video_content")
+
+        response = client.post(
+            reverse("videos-list"),
+            {"file": video_data},
+            format="multipart",
+            HTTP_X_PROFILE=profiling.sign_profile_token(),
+            HTTP_X_REQUEST_ID="upload-1",
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        summary, stats_path = profiling.load_profile(response["X-Profile-Id"])
+        assert (summary["method"], summary["route"], summary["status"], summary["trigger"]) == (
+            "POST", "videos/", 201, "header"
+        )
+        assert summary["request_id"] == "upload-1"
+        assert {"upload.receive", "upload.db_write"} <= set(summary["spans"])
+        assert summary["top_functions"]
+        assert "function calls" in profiling.format_stats(stats_path)
+
+    def test_requests_without_a_valid_header_are_not_profiled(self, profiling_dir):
+        client = APIClient()
+        response = client.get(reverse("jobs-list"), HTTP_X_PROFILE="profile:forged:signature")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert not response.has_header("X-Profile-Id")
+        assert list(profiling_dir.iterdir()) == []
+
+    def test_profile_ids_never_come_from_the_client(self, settings, profiling_dir):
+        settings.PROFILING_SAMPLE_RATE = 1
+        client = APIClient()
+        first = client.get(reverse("jobs-list"), HTTP_X_REQUEST_ID="same-id")
+        second = client.get(reverse("jobs-list"), HTTP_X_REQUEST_ID="same-id")
+
+        # Repeating a request id neither overwrites a profile nor names a file.
+        assert first["X-Profile-Id"] != second["X-Profile-Id"]
+        assert len(list(profiling_dir.glob("*.json"))) == 2
+        assert not (profiling_dir / "same-id.json").exists()
+        summary, _ = profiling.load_profile(second["X-Profile-Id"])
+        assert (summary["trigger"], summary["request_id"]) == ("sample", "same-id")
+        with pytest.raises(FileNotFoundError):
+            profiling.load_profile("../../etc/passwd")
+
+    def test_only_the_newest_profiles_are_kept(self, settings):
+        settings.PROFILING_SAMPLE_RATE = 1
+        settings.PROFILING_MAX_PROFILES = 2
+        client = APIClient()
+        profile_ids = []
+        for _ in range(4):
+            profile_ids.append(client.get(reverse("jobs-list"))["X-Profile-Id"])
+            time.sleep(0.01)
+
+        assert [summary["id"] for summary in profiling.recent_profiles()] == profile_ids[:1:-1]
+        with pytest.raises(FileNotFoundError):
+            profiling.load_profile(profile_ids[0])
+
+
+class TestMediaBenchmark:
+    def test_synthetic_video_is_deterministic(self, tmp_path):
+        first = generate_synthetic_video(str(tmp_path / "first.mp4"), duration=2, width=160, height=120, seed=7)
+        second = generate_synthetic_video(str(tmp_path / "second.mp4"), duration=2, width=160, height=120, seed=7)
+
+        info = stream_info(first)
+        assert (info["video"]["codec"], info["video"]["width"], info["video"]["height"]) == ("h264", 160, 120)
+        assert info["audio"]["codec"] == "aac"
+        assert 1.9 <= info["duration"] <= 2.1
+        assert open(first, "rb").read() == open(second, "rb").read()
+
+    def test_summary_reports_percentiles_and_throughput(self):
+        summary = summarize([0.1] * 19 + [1.1], media_seconds=4, peak_rss_kb=204800, peak_children_rss_kb=102400)
+        assert (summary["iterations"], summary["p50_s"], summary["p95_s"]) == (20, 0.1, 0.15)
+        assert summary["ops_per_s"] == round(20 / 3.0, 3)
+        assert summary["media_seconds_per_s"] == round(80 / 3.0, 2)
+        assert (summary["peak_rss_mb"], summary["peak_children_rss_mb"]) == (200.0, 100.0)
+
+    def test_comparison_flags_regressions_beyond_tolerance(self):
+        baseline = {"scenarios": {"trim": {"p50_s": 1.0, "p95_s": 1.2, "peak_rss_mb": 100, "ops_per_s": 1.0}}}
+        results = {
+            "scenarios": {
+                "trim": {"p50_s": 1.1, "p95_s": 1.5, "peak_rss_mb": 100, "ops_per_s": 0.8},
+                "merge": {"p50_s": 0.5, "p95_s": 0.6, "peak_rss_mb": 100, "ops_per_s": 2.0},
+            }
+        }
+
+        rows = compare_results(baseline, results, tolerance=0.15)
+
+        assert {(metric, regressed) for scenario, metric, _, _, _, regressed in rows} == {
+            ("p50_s", False),
+            ("p95_s", True),
+            ("peak_rss_mb", False),
+            ("ops_per_s", True),
+        }
+
+    def test_each_scenario_runs_in_its_own_process(self, tmp_path):
+        summary = {"p50_s": 0.5}
+
+        def run_child(command, **kwargs):
+            output_path = command[command.index("--output") + 1]
+            with open(output_path, "w") as output_file:
+                json.dump({"scenarios": {"trim": summary}}, output_file)
+            return subprocess.CompletedProcess(command, 0, "", "")
+
+        options = {"duration": 6, "iterations": 2, "warmup": 0, "trims": 2, "trim_mode": "copy"}
+        with patch("backends_engine.management.commands.benchmark_media.subprocess.run", side_effect=run_child) as run:
+            assert BenchmarkCommand().run_isolated("trim", "fixture.mp4", str(tmp_path), options) == summary
+
+        command = run.call_args.args[0]
+        assert command[command.index("--scenarios") + 1] == "trim"
+        assert "--in-process" in command and command[command.index("--trim-mode") + 1] == "copy"
+
+
+class TestTieredStorage:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path):
+        self.media_root = tmp_path / "media"
+        self.object_store = LocalObjectStore(str(tmp_path / "objects"))
+
+    def make_storage(self, cache_max_bytes=10**6):
+        return TieredStorage(
+            location=str(self.media_root),
+            object_store=self.object_store,
+            cache_max_bytes=cache_max_bytes,
+            part_size=1000,
+            transfer_threads=4,
+        )
+
+    def test_files_round_trip_through_the_object_store_in_parts(self):
+        storage = self.make_storage()
+        content = os.urandom(4500)
+
+        name = storage.save("videos/clip.mp4", ContentFile(content))
+        os.remove(self.media_root / name)
+
+        assert self.object_store.get_range(name, 0, 10**6) == content
+        assert storage.exists(name) and storage.size(name) == 4500
+        with storage.open(name) as stored_file:
+            assert stored_file.read() == content
+        storage.delete(name)
+        assert not storage.exists(name)
+
+    def test_least_recently_used_copies_are_evicted(self):
+        storage = self.make_storage(cache_max_bytes=2500)
+        names = [storage.save(f"videos/{index}.mp4", ContentFile(bytes([index]) * 1000)) for index in range(2)]
+        time.sleep(0.01)
+        storage.local_path(names[0])
+        storage.save("videos/2.mp4", ContentFile(b"2" * 1000))
+        assert sorted(os.listdir(self.media_root / "videos")) == ["0.mp4", "2.mp4"]
+
+        with storage.pinned(names[0]):
+            time.sleep(0.01)
+            storage.local_path("videos/2.mp4")
+            storage.save("videos/3.mp4", ContentFile(b"3" * 1000))
+
+        # The least recently used copy was pinned, so the next one went instead.
+        assert sorted(os.listdir(self.media_root / "videos")) == ["0.mp4", "3.mp4"]
+        # An evicted file is fetched back on the next read.
+        assert open(storage.local_path(names[1]), "rb").read() == bytes([1]) * 1000
+
+    def test_cache_counts_local_copies_without_listing_the_store(self):
+        storage = self.make_storage(cache_max_bytes=2500)
+        for index in range(2):
+            storage.save(f"videos/{index}.mp4", ContentFile(bytes([index]) * 1000))
+            time.sleep(0.01)
+        # Not in the object store, so neither counted nor evicted.
+        (self.media_root / "videos/draft.mp4").write_bytes(b"d" * 5000)
+
+        # A new process scans MEDIA_ROOT once and never lists the whole store.
+        with patch.object(self.object_store, "keys", side_effect=AssertionError("listed the store")):
+            self.make_storage(cache_max_bytes=2500).save("videos/2.mp4", ContentFile(b"2" * 1000))
+
+        assert sorted(os.listdir(self.media_root / "videos")) == ["1.mp4", "2.mp4", "draft.mp4"]
+
+    def test_copy_pinned_by_another_process_is_not_evicted(self):
+        # flock locks belong to open files, so a second storage on the same directory stands in for a process.
+        storage, other_process = self.make_storage(cache_max_bytes=1500), self.make_storage(cache_max_bytes=1500)
+        name = storage.save("videos/0.mp4", ContentFile(b"0" * 1000))
+
+        with other_process.pinned(name):
+            storage.save("videos/1.mp4", ContentFile(b"1" * 1000))
+            assert sorted(os.listdir(self.media_root / "videos")) == ["0.mp4"]
+
+        storage.save("videos/2.mp4", ContentFile(b"2" * 1000))
+        assert sorted(os.listdir(self.media_root / "videos")) == ["2.mp4"]
+
+    def test_concurrent_reads_share_one_fetch(self):
+        storage = self.make_storage()
+        name = storage.save("videos/clip.mp4", ContentFile(os.urandom(3000)))
+        os.remove(self.media_root / name)
+        get_range = self.object_store.get_range
+
+        def slow_get_range(key, offset, length):
+            time.sleep(0.05)
+            return get_range(key, offset, length)
+
+        with patch.object(self.object_store, "get_range", side_effect=slow_get_range) as mock_get_range:
+            threads = [threading.Thread(target=storage.local_path, args=(name,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert mock_get_range.call_count == 3
+        assert (self.media_root / name).read_bytes() == get_range(name, 0, 10**6)
+
+    def use_tiered_storage(self, settings):
+        settings.MEDIA_ROOT = str(self.media_root)
+        settings.MEDIA_OBJECT_STORE_ROOT = self.object_store.root
+        settings.STORAGES = {**settings.STORAGES, "default": {"BACKEND": "backends_engine.media_storage.TieredStorage"}}
+
+    @pytest.mark.django_db
+    def test_streamed_response_keeps_its_copy_pinned_until_closed(self, settings):
+        self.use_tiered_storage(settings)
+        settings.MEDIA_HOT_CACHE_MAX_MB = 2500 / 2**20
+        name = default_storage.save("videos/0.mp4", ContentFile(b"0" * 1500))
+        pin = StoredFilePin(name)
+        response = serve_file(RequestFactory().get("/", HTTP_RANGE="bytes=0-9"), pin.path, name, "video/mp4", pin=pin)
+
+        default_storage.save("videos/1.mp4", ContentFile(b"1" * 1500))
+        assert b"".join(response.streaming_content) == b"0" * 10
+        assert sorted(os.listdir(self.media_root / "videos")) == ["0.mp4"]
+
+        response.close()
+        default_storage.save("videos/2.mp4", ContentFile(b"2" * 1500))
+        assert sorted(os.listdir(self.media_root / "videos")) == ["2.mp4"]
+
+    def test_hls_packages_are_published_and_read_back(self, settings):
+        self.use_tiered_storage(settings)
+        package = SimpleNamespace(hls_playlist="hls/1/master.m3u8")
+        (self.media_root / "hls/1/360p").mkdir(parents=True)
+        (self.media_root / "hls/1/master.m3u8").write_text("#EXTM3U\n360p/index.m3u8\n")
+        (self.media_root / "hls/1/360p/seg_00000.m4s").write_bytes(b"segment")
+
+        publish_directory("hls/1")
+        shutil.rmtree(self.media_root / "hls")
+
+        assert open(resolve_hls_asset(package, "360p/seg_00000.m4s"), "rb").read() == b"segment"
+        assert resolve_hls_asset(package, "360p/seg_00001.m4s") is None
+        assert resolve_hls_asset(package, "../../videos/clip.mp4") is None
+        delete_hls_package(package)
+        assert list(self.object_store.keys()) == []
+
+    @pytest.mark.django_db
+    def test_previews_are_published_and_read_back(self, settings):
+        self.use_tiered_storage(settings)
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        (self.media_root / "videos").mkdir(parents=True)
+        generate_test_video(str(self.media_root / "videos/source.mp4"), duration=4, width=160, height=120)
+        video = VideoUpload.objects.create(file="videos/source.mp4", duration=4.0)
+
+        preview = generate_previews(video)
+        shutil.rmtree(self.media_root / "previews")
+
+        assert client.get(reverse("videos-thumbnail", args=[video.id])).status_code == status.HTTP_200_OK
+        assert client.get(reverse("videos-sprite-index", args=[video.id])).status_code == status.HTTP_200_OK
+        preview.delete()
+        assert not any(key.startswith("previews/") for key in self.object_store.keys())
+
+    @pytest.mark.django_db
+    def test_trim_and_merge_read_evicted_media_through_the_cache(self, settings, monkeypatch):
+        self.use_tiered_storage(settings)
+        settings.DERIVATION_CACHE_ENABLED = False
+        settings.PREVIEW_ON_UPLOAD = False
+        monkeypatch.setattr("backends_engine.video_media_processor.settings.MEDIA_ROOT", str(self.media_root))
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        source_path = generate_test_video(str(self.media_root.parent / "source.mp4"), duration=6, width=160, height=120)
+
+        with open(source_path, "rb") as source_file:
+            video_data = SimpleUploadedFile("source.mp4", source_file.read(), content_type="video/mp4")
+        upload = client.post(reverse("videos-list"), {"file": video_data}, format="multipart")
+        video_upload = VideoUpload.objects.get(id=upload.data["data"]["id"])
+        os.remove(self.media_root / video_upload.file.name)
+
+        # On keyframes (every 2 s), so the copy-mode cuts are exact.
+        trims = [{"start_time": 2, "end_time": 4}, {"start_time": 4, "end_time": 5.5}]
+        data = {"parent_video": str(video_upload.id), "mode": "copy", "trims": trims}
+        trimmed = client.post(reverse("trimmed-video-list"), data, format="json")
+        trimmed_videos = TrimmedVideo.objects.filter(id__in=[clip["id"] for clip in trimmed.data["data"]])
+        for trimmed_video in trimmed_videos:
+            assert self.object_store.exists(trimmed_video.file.name)
+            os.remove(self.media_root / trimmed_video.file.name)
+
+        merged = client.post(
+            reverse("merge-video-list"), {"trimmed_videos": [str(clip.id) for clip in trimmed_videos]}, format="json"
+        )
+
+        assert merged.status_code == status.HTTP_201_CREATED
+        merged_video = MergedVideo.objects.get(id=merged.data["data"]["id"])
+        assert self.object_store.exists(merged_video.file.name)
+        assert 3.4 <= stream_info(str(self.media_root / merged_video.file.name))["duration"] <= 4.1
+
+
+class TestVideoMediaProcessorTrimModes:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("backends_engine.video_media_processor.settings.MEDIA_ROOT", str(tmp_path))
+        self.media_root = tmp_path
+        self.source_path = generate_test_video(str(tmp_path / "source.mp4"), duration=10, width=160, height=120)
+
+    def trim(self, start_time, end_time, mode):
+        with open(self.source_path, "rb") as source_file:
+            processor = VideoMediaProcessor(File(source_file, name="source.mp4"))
+            return stream_info(str(self.media_root / processor.trim_media(start_time, end_time, mode=mode)))
+
+    def test_copy_mode_starts_on_previous_keyframe(self):
+        info = self.trim(3.0, 7.0, "copy")
+        assert info["video"]["codec"] == "h264"
+        # Keyframes are every 2 seconds, so the cut starts at 2.0 instead of 3.0.
+        assert 4.8 <= info["duration"] <= 5.3
+
+    @pytest.mark.django_db
+    def test_copy_mode_records_the_actual_cut(self, settings):
+        settings.MEDIA_ROOT = str(self.media_root)
+        settings.DERIVATION_CACHE_ENABLED = False
+        parent_video = VideoUpload.objects.create(file="source.mp4", duration=10.0)
+
+        (trimmed_video,) = trim_parent_video(parent_video, [(3.0, 7.0)], "copy")
+
+        assert trimmed_video.end_time == 7.0
+        assert 1.8 <= trimmed_video.start_time <= 2.2
+        assert 4.8 <= trimmed_video.duration <= 5.3
+
+    def test_accurate_mode_keeps_requested_range(self):
+        info = self.trim(3.0, 7.0, "accurate")
+        assert info["video"]["codec"] == "h264"
+        assert 3.9 <= info["duration"] <= 4.3
+
+    def test_batch_trim_returns_paths_in_request_order(self):
+        with open(self.source_path, "rb") as source_file:
+            processor = VideoMediaProcessor(File(source_file, name="source.mp4"))
+            paths = processor.trim_media_batch([(6.0, 8.0), (0.5, 1.5)], mode="reencode")
+
+        durations = [stream_info(str(self.media_root / path))["duration"] for path in paths]
+        assert 1.9 <= durations[0] <= 2.2
+        assert 0.9 <= durations[1] <= 1.2
+
+    def test_encoding_profile_controls_quality(self):
+        sizes = {}
+        for profile in ["preview", "high"]:
+            with open(self.source_path, "rb") as source_file:
+                processor = VideoMediaProcessor(File(source_file, name="source.mp4"))
+                sizes[profile] = (self.media_root / processor.trim_media(1.0, 5.0, profile=profile)).stat().st_size
+        assert sizes["preview"] < sizes["high"]
+
+    def test_temporary_upload_is_read_in_place(self):
+        upload = TemporaryUploadedFile("clip.mp4", "video/mp4", 0, None)
+        with open(self.source_path, "rb") as source_file:
+            upload.write(source_file.read())
+        upload.flush()
+
+        with patch.object(VideoMediaProcessor, "_write_temp_copy") as mock_write_temp_copy:
+            duration = VideoMediaProcessor(upload).calculate_duration()
+
+        mock_write_temp_copy.assert_not_called()
+        assert 9.9 <= duration <= 10.1
+        upload.close()
+
+    def test_in_memory_upload_uses_scratch_copy(self):
+        with open(self.source_path, "rb") as source_file:
+            upload = SimpleUploadedFile("clip.mp4", source_file.read(), content_type="video/mp4")
+
+        processor = VideoMediaProcessor(upload)
+        with patch.object(processor, "_write_temp_copy", wraps=processor._write_temp_copy) as mock_copy:
+            processor.trim_media(1.0, 3.0, mode="copy")
+
+        mock_copy.assert_called_once()
+
+    @patch("backends_engine.video_media_processor.VideoFileClip")
+    def test_duration_read_from_container_header(self, mock_video_file_clip):
+        with open(self.source_path, "rb") as source_file:
+            upload = SimpleUploadedFile("clip.mp4", source_file.read(), content_type="video/mp4")
+
+        processor = VideoMediaProcessor(upload)
+
+        assert processor.calculate_duration() == 10.0
+        assert processor.stream_metadata()["video_codec"] == "h264"
+        mock_video_file_clip.assert_not_called()
+
+    def test_parallel_executor_returns_paths_in_request_order(self):
+        executor = ParallelTrimExecutor(max_workers=2, cpu_budget=4)
+        assert executor.plan(3) == (2, 2)
+        assert executor.plan(1) == (1, 4)
+
+        time_ranges = [(6.0, 8.0), (0.0, 1.0), (4.0, 7.0)]
+        try:
+            with open(self.source_path, "rb") as source_file:
+                paths = executor.trim_media(File(source_file, name="source.mp4"), time_ranges, mode="accurate")
+        finally:
+            executor.shutdown()
+
+        durations = [stream_info(str(self.media_root / path))["duration"] for path in paths]
+        for (start_time, end_time), duration in zip(time_ranges, durations):
+            assert abs(duration - (end_time - start_time)) < 0.3
+
+    def test_concurrent_in_process_trims_share_the_cpu_budget(self):
+        executor = ParallelTrimExecutor(max_workers=1, cpu_budget=4)
+        lock = threading.Lock()
+        running = {"threads": 0, "peak": 0}
+
+        class RecordingProcessor:
+            def __init__(self, media_file, metadata=None, threads=None):
+                self.threads = threads
+
+            def trim_media_batch(self, time_ranges, mode=None, profile=None):
+                with lock:
+                    running["threads"] += self.threads
+                    running["peak"] = max(running["peak"], running["threads"])
+                time.sleep(0.05)
+                with lock:
+                    running["threads"] -= self.threads
+                return ["trimmed_videos/out.mp4"] * len(time_ranges)
+
+        def trim():
+            with open(self.source_path, "rb") as source_file:
+                executor.trim_media(File(source_file, name="source.mp4"), [(0.0, 1.0)])
+
+        with patch("backends_engine.trim_executor.VideoMediaProcessor", RecordingProcessor):
+            trims = [threading.Thread(target=trim) for _ in range(3)]
+            for thread in trims:
+                thread.start()
+            for thread in trims:
+                thread.join()
+
+        assert running["peak"] == 4
+        assert executor.cpu_tokens.acquire(4) == 4
+
+
+class TestVideoMediaProcessorMerge:
+    @pytest.fixture(autouse=True)
+    def setup_method(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("backends_engine.video_media_processor.settings.MEDIA_ROOT", str(tmp_path))
+        self.media_root = tmp_path
+
+    def make_clip(self, name, width=160, height=120):
+        path = generate_test_video(str(self.media_root / name), duration=2, width=width, height=height)
+        return SimpleNamespace(file=SimpleNamespace(path=path))
+
+    @patch("backends_engine.video_media_processor.concatenate_videoclips")
+    def test_merge_compatible_inputs_without_reencode(self, mock_concatenate):
+        clips = [self.make_clip("first.mp4"), self.make_clip("second.mp4")]
+
+        merged_path = VideoMediaProcessor(None).merge_media(clips)
+
+        mock_concatenate.assert_not_called()
+        assert 3.9 <= stream_info(str(self.media_root / merged_path))["duration"] <= 4.2
+
+    def test_merge_incompatible_inputs_falls_back_to_reencode(self):
+        clips = [self.make_clip("first.mp4"), self.make_clip("second.mp4", width=320, height=240)]
+
+        with patch("backends_engine.video_media_processor.concat_copy") as mock_concat_copy:
+            merged_path = VideoMediaProcessor(None).merge_media(clips)
+
+        mock_concat_copy.assert_not_called()
+        assert (self.media_root / merged_path).exists()
+
+
+class TestMediaProbe:
+    @pytest.mark.parametrize(
+        "container, extension, video_codec, audio_codec",
+        [("mp4", ".mp4", "h264", "aac"), ("matroska", ".mkv", "h264", "aac"), ("avi", ".avi", "mpeg4", "mp3")],
+    )
+    def test_probe_container_headers(self, tmp_path, container, extension, video_codec, audio_codec):
+        source_path = generate_test_video(str(tmp_path / "source.mp4"), duration=6, width=320, height=240, fps=25)
+        output_path = str(tmp_path / f"probe{extension}")
+        codec_args = ["-c:v", "mpeg4", "-c:a", "libmp3lame"] if container == "avi" else ["-c", "copy"]
+        run_ffmpeg(["-i", source_path] + codec_args + [output_path])
+
+        with open(output_path, "rb") as probe_file:
+            info = probe_media(probe_file)
+
+        assert info["container"] == container
+        assert (info["video_codec"], info["audio_codec"]) == (video_codec, audio_codec)
+        assert (info["width"], info["height"], info["frame_rate"]) == (320, 240, 25.0)
+        assert 5.9 <= info["duration"] <= 6.1
+        assert info["bit_rate"] > 0
+
+    def test_probe_rejects_unknown_container(self):
+        with pytest.raises(ProbeError):
+            probe_media(BytesIO(FAKE_MP4_HEADER + b"fake_video_content"))
+
+    def test_probe_rejects_stts_count_larger_than_its_box(self):
+        def box(box_type, payload):
+            return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+        # One real entry, but a count claiming a billion of them.
+        stts = box(b"stts", b"\x00\x00\x00\x00" + struct.pack(">III", 10**9, 25, 1000))
+        moov = box(b"moov", box(b"trak", box(b"mdia", box(b"minf", box(b"stbl", stts)))))
+
+        with pytest.raises(ProbeError, match="stts entry count"):
+            probe_media(BytesIO(FAKE_MP4_HEADER + moov))
@@ -0,0 +1,139 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files import File
+
+from media_management import settings
+from backends_engine.video_media_processor import VideoMediaProcessor, resolve_local_path
+from backends_engine.media_storage import pinned
+from backends_engine.metrics import registry
+
+
+def _trim_chunk(source_path, file_name, time_ranges, mode, profile, metadata, threads, media_root):
+    # Runs in a pool process: every worker opens the source once and trims its share of the ranges.
+    # Pool processes do not inherit the parent's memory, so outputs go where the parent would write them.
+    settings.MEDIA_ROOT = media_root
+    with open(source_path, "rb") as source_file:
+        processor = VideoMediaProcessor(File(source_file, name=file_name), metadata=metadata, threads=threads)
+        trimmed_file_paths = processor.trim_media_batch(time_ranges, mode=mode, profile=profile)
+    registry.flush()
+    return trimmed_file_paths
+
+
+class CpuTokens:
+    """A counting pool of CPU tokens, one per encoder thread allowed to run at a time."""
+
+    def __init__(self, count):
+        self.count = count
+        self._available = count
+        self._condition = threading.Condition()
+
+    def acquire(self, wanted):
+        """Wait until a token is free, then take up to ``wanted`` of them; return how many were taken."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._available > 0)
+            taken = min(wanted, self._available)
+            self._available -= taken
+            return taken
+
+    def release(self, count):
+        with self._condition:
+            self._available += count
+            self._condition.notify_all()
+
+
+class ParallelTrimExecutor:
+    """Runs independent trims of one source in a process pool within a fixed CPU budget.
+
+    Every request takes its share of the budget from one token pool, whether it encodes in-process or
+    in the pool, and splits it between pool processes and the encoder threads each of them may start;
+    concurrent requests wait for tokens instead of oversubscribing the machine.
+    """
+
+    def __init__(self, max_workers=None, cpu_budget=None):
+        self.max_workers = max_workers or settings.MEDIA_TRIM_WORKERS
+        self.cpu_budget = cpu_budget or settings.MEDIA_CPU_BUDGET
+        self.cpu_tokens = CpuTokens(self.cpu_budget)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def plan(self, task_count, cpu_count=None):
+        """Return (worker processes, encoder threads per worker) for ``task_count`` trims on ``cpu_count`` CPUs.
+
+        ``cpu_count`` defaults to the whole budget.
+        """
+        cpu_count = cpu_count or self.cpu_budget
+        workers = max(1, min(self.max_workers, cpu_count, task_count))
+        return workers, max(1, cpu_count // workers)
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Forking the web process would copy the locks of its logging, metrics and transfer threads
+                # into the children; the forkserver starts them from a clean, single-threaded process.
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["backends_engine.trim_executor"])
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            return self._pool
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def trim_media(self, media_file, time_ranges, mode=None, metadata=None, profile=None):
+        """Trim every range and return the output paths in request order."""
+        # The pool processes read the source by path, so its cached copy has to stay until they are done.
+        cpu_count = self.cpu_tokens.acquire(self.cpu_budget)
+        try:
+            with pinned(media_file):
+                return self._trim_media(media_file, time_ranges, mode, metadata, profile, cpu_count)
+        finally:
+            self.cpu_tokens.release(cpu_count)
+
+    def _trim_media(self, media_file, time_ranges, mode, metadata, profile, cpu_count):
+        workers, threads = self.plan(len(time_ranges), cpu_count)
+        source_path = resolve_local_path(media_file)
+
+        if workers == 1 or source_path is None:
+            processor = VideoMediaProcessor(media_file, metadata=metadata, threads=threads)
+            return processor.trim_media_batch(time_ranges, mode=mode, profile=profile)
+
+        # Deal the ranges out in start order so each worker still seeks forward through the source.
+        order = sorted(range(len(time_ranges)), key=lambda index: time_ranges[index][0])
+        chunks = [order[worker::workers] for worker in range(workers)]
+
+        pool = self._get_pool()
+        futures = [
+            pool.submit(
+                _trim_chunk,
+                source_path,
+                media_file.name,
+                [time_ranges[i] for i in chunk],
+                mode,
+                profile,
+                metadata,
+                threads,
+                settings.MEDIA_ROOT,
+            )
+            for chunk in chunks
+        ]
+
+        trimmed_file_paths = [None] * len(time_ranges)
+        for chunk, future in zip(chunks, futures):
+            for index, trimmed_file_path in zip(chunk, future.result()):
+                trimmed_file_paths[index] = trimmed_file_path
+        return trimmed_file_paths
+
+
+_default_executor = None
+
+
+def get_trim_executor():
+    """Process-wide executor, so the pool is started once and shared by all requests."""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = ParallelTrimExecutor()
+    return _default_executor
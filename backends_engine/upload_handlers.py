@@ -0,0 +1,129 @@
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+from backends_engine.abstract_classes import BaseMediaProcessor
+from backends_engine.media_probe import ProbeError, probe_media, sniff_container
+from backends_engine.models import validate_video_file_extension
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Hashes every uploaded file while it streams in and passes the bytes on untouched.
+
+    Install it in front of the default handlers; ``digests`` maps field names to SHA-256 hex digests
+    once the upload has been parsed.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+        self._hasher = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests[self.field_name] = self._hasher.hexdigest()
+        # Let the next handler build the actual uploaded file object.
+        return None
+
+
+def install_upload_handler(request, handler):
+    """Put ``handler`` in front of the request's upload handlers; must run before the body is parsed."""
+    request.upload_handlers.insert(0, handler)
+    return handler
+
+
+class ValidatingUploadHandler(FileUploadHandler):
+    """Rejects a video upload while it is still arriving instead of after it has been stored.
+
+    A request whose Content-Length already exceeds the size limit is refused without reading the body,
+    a file with an unsupported extension is refused before its first byte, and an upload stops as soon
+    as its running byte count passes the limit. The first ``sniff_bytes`` are kept in memory and checked
+    for a known container magic and, when the header carries it, a duration inside the allowed range.
+    Rejections stop the upload without draining the rest of the body; ``rejection`` holds the reason.
+    """
+
+    # Room for the multipart boundaries and part headers around the file itself.
+    MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+    def __init__(self, request=None, max_size_mb=None, min_duration=None, max_duration=None, sniff_bytes=None):
+        super().__init__(request)
+        self.max_size_mb = float(settings.MAX_VIDEO_SIZE_MB if max_size_mb is None else max_size_mb)
+        self.min_duration = float(settings.MIN_VIDEO_DURATION_SEC if min_duration is None else min_duration)
+        self.max_duration = float(settings.MAX_VIDEO_DURATION_SEC if max_duration is None else max_duration)
+        self.sniff_bytes = sniff_bytes or settings.UPLOAD_SNIFF_KB * 1024
+        self.rejection = None
+        self._received = 0
+        self._head = bytearray()
+        self._sniffed = False
+
+    def _reject(self, message):
+        self.rejection = message
+        raise StopUpload(connection_reset=True)
+
+    def _check(self, validate, *args):
+        try:
+            validate(*args)
+        except ValidationError as e:
+            self._reject(" ".join(e.messages))
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > self.max_size_mb * 1024 * 1024 + self.MULTIPART_OVERHEAD_BYTES:
+            try:
+                BaseMediaProcessor.validate_file_size(content_length / (1024 * 1024), self.max_size_mb)
+            except ValidationError as e:
+                self.rejection = " ".join(e.messages)
+            # Claim the request with empty data so the body is never read.
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._check(validate_video_file_extension, File(None, name=self.file_name))
+        self._received = 0
+        self._head = bytearray()
+        self._sniffed = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self._received += len(raw_data)
+        self._check(BaseMediaProcessor.validate_file_size, self._received / (1024 * 1024), self.max_size_mb)
+
+        if not self._sniffed:
+            self._head += raw_data[: self.sniff_bytes - len(self._head)]
+            if len(self._head) >= self.sniff_bytes:
+                self._sniff()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self._sniffed:
+            self._sniff()
+        return None
+
+    def _sniff(self):
+        self._sniffed = True
+        if sniff_container(bytes(self._head[:12])) is None:
+            self._reject("The uploaded file is not a supported video container.")
+
+        try:
+            duration = probe_media(BytesIO(self._head)).get("duration")
+        except ProbeError:
+            # The header is not within the first bytes (e.g. 'moov' after 'mdat'); the full check decides.
+            return
+        if duration:
+            self._check(BaseMediaProcessor.validate_duration, duration, self.min_duration, self.max_duration)
+
+    def raise_for_rejection(self):
+        if self.rejection:
+            raise ValidationError(self.rejection)
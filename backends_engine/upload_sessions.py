@@ -0,0 +1,179 @@
+import fcntl
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from backends_engine import metrics
+from backends_engine.content_store import attach_blob, create_upload_from_existing, find_reusable_upload, hash_file
+from backends_engine.media_storage import publish
+from backends_engine.models import UploadSession, VideoUpload, validate_video_file_extension
+
+logger_debug = logging.getLogger("debug")
+logger_info = logging.getLogger("info")
+
+
+class UploadOffsetMismatch(Exception):
+    """A chunk was sent for an offset other than the number of bytes the session has received."""
+
+    def __init__(self, expected_offset):
+        super().__init__(f"Upload offset mismatch, the session expects offset {expected_offset}.")
+        self.expected_offset = expected_offset
+
+
+def validate_upload_limits(processor_class, file_size, duration):
+    """Check size (MB) and duration against the configured limits without reading the file."""
+    processor_class.validate_file_size(file_size, float(settings.MAX_VIDEO_SIZE_MB))
+    processor_class.validate_duration(
+        duration, float(settings.MIN_VIDEO_DURATION_SEC), float(settings.MAX_VIDEO_DURATION_SEC)
+    )
+
+
+def create_session(file_name, size_bytes, processor_class):
+    """Open a session and reserve the final storage name; the declared size is checked up front."""
+    if not file_name or size_bytes is None:
+        raise ValidationError("Please provide 'filename' and 'size'.")
+    try:
+        size_bytes = int(size_bytes)
+    except (TypeError, ValueError):
+        raise ValidationError("'size' must be a number of bytes.")
+    if size_bytes <= 0:
+        raise ValidationError("'size' must be a positive number of bytes.")
+
+    placeholder = ContentFile(b"", name=file_name)
+    validate_video_file_extension(placeholder)
+    processor_class.validate_file_size(size_bytes / (1024 * 1024), float(settings.MAX_VIDEO_SIZE_MB))
+
+    session = UploadSession(size_bytes=size_bytes)
+    session.file.save(file_name, placeholder, save=False)
+    session.save()
+    logger_debug.debug("Upload session %s opened for %s (%s bytes)", session.id, session.file.name, size_bytes)
+    return session
+
+
+def append_chunk(session, offset, stream, length):
+    """Write ``length`` bytes from ``stream`` at ``offset`` of the session file and return the new offset.
+
+    The bytes go straight into the final file. If the client disconnects midway, whatever arrived is
+    kept and the session resumes from there. Writers take an exclusive lock on the file, so a request
+    racing another one for the same offset is rejected before it writes anything.
+    """
+    if session.status != UploadSession.OPEN:
+        raise ValidationError(f"Upload session is {session.status}.")
+    if offset != session.offset:
+        raise UploadOffsetMismatch(session.offset)
+    if offset + length > session.size_bytes:
+        raise ValidationError(f"Chunk exceeds the declared upload size of {session.size_bytes} bytes.")
+
+    received = 0
+    with metrics.stage_timer("upload", "receive"), open(session.file.path, "r+b") as target:
+        try:
+            fcntl.flock(target.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another request is writing to the session; the client asks for the offset and resumes.
+            raise UploadOffsetMismatch(session.offset)
+        # A request that held the lock before may have moved the offset on or closed the session.
+        session.refresh_from_db(fields=["offset", "status"])
+        if session.status != UploadSession.OPEN:
+            raise ValidationError(f"Upload session is {session.status}.")
+        if offset != session.offset:
+            raise UploadOffsetMismatch(session.offset)
+
+        target.seek(offset)
+        while received < length:
+            chunk = stream.read(min(settings.MEDIA_STREAM_CHUNK_SIZE, length - received))
+            if not chunk:
+                break
+            target.write(chunk)
+            received += len(chunk)
+    metrics.media_bytes.inc(received, operation="upload", direction="in")
+
+    # The conditional update rejects a concurrent chunk that raced for the same offset.
+    advanced = UploadSession.objects.filter(id=session.id, offset=offset, status=UploadSession.OPEN).update(
+        offset=offset + received
+    )
+    if not advanced:
+        session.refresh_from_db(fields=["offset"])
+        raise UploadOffsetMismatch(session.offset)
+
+    session.offset = offset + received
+    return session.offset
+
+
+def _discard(session):
+    session.file.storage.delete(session.file.name)
+    session.status = UploadSession.FAILED
+    session.save(update_fields=["status", "updated_at"])
+
+
+def complete_session(session, processor_class):
+    """Validate the received file and turn it into a VideoUpload in place, without copying the bytes.
+
+    The session is claimed first with a conditional UPDATE from open to completing, so of two requests
+    completing it at once only one does the work; the other sees the session is no longer open.
+    """
+    if session.status != UploadSession.OPEN:
+        raise ValidationError(f"Upload session is {session.status}.")
+    if session.offset != session.size_bytes:
+        raise ValidationError(f"Upload is incomplete: {session.offset} of {session.size_bytes} bytes received.")
+
+    claimed = UploadSession.objects.filter(id=session.id, status=UploadSession.OPEN).update(
+        status=UploadSession.COMPLETING
+    )
+    if not claimed:
+        session.refresh_from_db(fields=["status"])
+        raise ValidationError(f"Upload session is {session.status}.")
+    session.status = UploadSession.COMPLETING
+
+    try:
+        return _complete_claimed_session(session, processor_class)
+    except ValidationError:
+        raise
+    except Exception:
+        # Nothing was created; give the session back so the client can retry the completion.
+        UploadSession.objects.filter(id=session.id, status=UploadSession.COMPLETING).update(status=UploadSession.OPEN)
+        session.status = UploadSession.OPEN
+        raise
+
+
+def _complete_claimed_session(session, processor_class):
+    try:
+        with session.file.open("rb") as media_file:
+            content_hash = hash_file(media_file)
+            existing_upload = find_reusable_upload(content_hash)
+            if existing_upload is not None:
+                validate_upload_limits(processor_class, existing_upload.file_size, existing_upload.duration)
+            else:
+                processor = processor_class(media_file)
+                file_size, duration = processor.validate_media(
+                    max_size_mb=float(settings.MAX_VIDEO_SIZE_MB),
+                    min_duration=float(settings.MIN_VIDEO_DURATION_SEC),
+                    max_duration=float(settings.MAX_VIDEO_DURATION_SEC),
+                )
+                metadata = processor.stream_metadata()
+    except ValidationError:
+        _discard(session)
+        raise
+
+    if existing_upload is None:
+        # The chunks were written to the local file only; tiered storage gets the finished file now.
+        publish(session.file.name)
+
+    with transaction.atomic():
+        if existing_upload is not None:
+            video_upload = create_upload_from_existing(existing_upload)
+            session.file.storage.delete(session.file.name)
+        else:
+            video_upload = VideoUpload.objects.create(
+                file=session.file.name, file_size=file_size, duration=duration, **metadata
+            )
+            attach_blob(video_upload, content_hash)
+
+        session.status = UploadSession.COMPLETED
+        session.video_upload = video_upload
+        session.save(update_fields=["status", "video_upload", "updated_at"])
+
+    logger_info.info("Upload session %s completed as video %s", session.id, video_upload.id)
+    return video_upload
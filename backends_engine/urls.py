@@ -3,12 +3,15 @@ from django.conf.urls.static import static
 from backends_engine.views import (
     Home,
     authentication_check_view,
+    metrics_view,
     UploadedVideoViewSet,
     TrimmedVideoViewSet,
     MergedVideoViewSet,
-    LinkSharingViewSet,
-    SharedVideoView,
+    ProcessingJobViewSet,
+    UploadSessionViewSet,
+    SharedVideoHlsView,
 )
+from backends_engine.async_views import async_model_endpoints, link_revoke, link_share, shared_video
 from media_management import settings
 from rest_framework import routers
 
@@ -17,12 +20,36 @@ router = routers.SimpleRouter()
 router.register("videos", UploadedVideoViewSet, basename="videos")
 router.register("trimmed-video", TrimmedVideoViewSet, basename="trimmed-video")
 router.register("merge-video", MergedVideoViewSet, basename="merge-video")
-router.register("link-share", LinkSharingViewSet, basename="link-share")
+router.register("jobs", ProcessingJobViewSet, basename="jobs")
+router.register("uploads", UploadSessionViewSet, basename="uploads")
 
-urlpatterns = [
-    path("", Home, name="home"),
-    path("auth-check/", authentication_check_view, name="authentication_check_view"),
-    path("access-shared-video/", SharedVideoView.as_view(), name="access-shared-video"),
-] + router.urls
+# Reads are served by async views ahead of the router's list/detail routes; the router still handles
+# the extra actions, and the async views hand writes back to the viewsets.
+async_endpoints = []
+for prefix, viewset in [
+    ("videos", UploadedVideoViewSet),
+    ("trimmed-video", TrimmedVideoViewSet),
+    ("merge-video", MergedVideoViewSet),
+    ("jobs", ProcessingJobViewSet),
+]:
+    collection_view, item_view = async_model_endpoints(viewset)
+    async_endpoints += [
+        path(f"{prefix}/", collection_view, name=f"{prefix}-list"),
+        path(f"{prefix}/<str:pk>/", item_view, name=f"{prefix}-detail"),
+    ]
+
+urlpatterns = (
+    [
+        path("", Home, name="home"),
+        path("auth-check/", authentication_check_view, name="authentication_check_view"),
+        path("metrics", metrics_view, name="metrics"),
+        path("access-shared-video/", shared_video, name="access-shared-video"),
+        path("link-share/", link_share, name="link-share-list"),
+        path("link-share/revoke/", link_revoke, name="link-share-revoke"),
+        path("access-shared-video/hls/<path:asset>", SharedVideoHlsView.as_view(), name="access-shared-video-hls"),
+    ]
+    + async_endpoints
+    + router.urls
+)
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
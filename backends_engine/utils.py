@@ -1,6 +1,6 @@
-import os
+import time
 
-from django.core.signing import TimestampSigner, BadSignature, SignatureExpired
+from django.core.signing import TimestampSigner, BadSignature, b62_decode
 from django.conf import settings
 from urllib.parse import urlencode
 from django.core.exceptions import ValidationError
@@ -33,6 +33,47 @@ def validate_single_file_upload(request, file_key="file"):
     return None
 
 
+def request_flag(data, key, default):
+    value = data.get(key, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def wants_background_processing(data):
+    """Whether a trim/merge should be queued as a job; falls back to MEDIA_JOBS_ASYNC."""
+    return request_flag(data, "async", settings.MEDIA_JOBS_ASYNC)
+
+
+def wants_background_previews(data):
+    """Whether an upload's previews should be queued as a job; falls back to PREVIEW_JOBS_ASYNC."""
+    return request_flag(data, "async", settings.PREVIEW_JOBS_ASYNC)
+
+
+def wants_hls_packaging(data):
+    """Whether a merge should also be packaged as HLS; falls back to HLS_AUTO_PACKAGE."""
+    return request_flag(data, "hls", settings.HLS_AUTO_PACKAGE)
+
+
+class ObjectsNotFound(Exception):
+    def __init__(self, model, missing_ids):
+        super().__init__(f"{model._meta.verbose_name_plural.capitalize()} not found: {', '.join(missing_ids)}")
+        self.missing_ids = missing_ids
+
+
+def fetch_in_request_order(model, ids):
+    """Load the rows with the given primary keys in one query, in the order the client sent them.
+
+    Raises ObjectsNotFound naming every id that does not exist, and ValidationError for malformed ids.
+    """
+    keys = [model._meta.pk.to_python(object_id) for object_id in ids]
+    found = model.objects.in_bulk(set(keys))
+    missing_ids = [str(key) for key in keys if key not in found]
+    if missing_ids:
+        raise ObjectsNotFound(model, missing_ids)
+    return [found[key] for key in keys]
+
+
 def validate_merged_video_request(data):
     merged_video_id = data.get("merged_video_id")
 
@@ -42,22 +83,58 @@ def validate_merged_video_request(data):
     return merged_video_id
 
 
+def validate_expiry_minutes(value):
+    """Expiry requested for a shared link, or None for the default."""
+    if value in (None, ""):
+        return None
+    try:
+        expiry_minutes = float(value)
+    except (TypeError, ValueError):
+        raise ValidationError("'expiry_minutes' must be a number of minutes.")
+    if not 0 < expiry_minutes <= settings.LINK_MAX_EXPIRY_MINUTES:
+        raise ValidationError(f"'expiry_minutes' must be between 0 and {settings.LINK_MAX_EXPIRY_MINUTES:g}.")
+    return expiry_minutes
+
+
 class LinkGenerator:
     signer = TimestampSigner()
 
     @staticmethod
-    def generate_link(merged_video_id, expiry_minutes=30):
-        token = LinkGenerator.signer.sign(merged_video_id)
-        query_params = urlencode({"token": token})
+    def generate_token(merged_video_id, expiry_minutes=None):
+        """Sign the video id together with the moment the link stops working."""
+        expiry_minutes = float(expiry_minutes or settings.LINK_MAX_AGE_MINUTES)
+        expires_at = int(time.time() + expiry_minutes * 60)
+        return LinkGenerator.signer.sign(f"{merged_video_id}:{expires_at}")
+
+    @staticmethod
+    def generate_link(merged_video_id, expiry_minutes=None, token=None):
+        query_params = urlencode({"token": token or LinkGenerator.generate_token(merged_video_id, expiry_minutes)})
         return f"{settings.SITE_URL}/access-shared-video/?{query_params}"
 
     @staticmethod
-    def validate_link(token):
+    def generate_hls_link(merged_video_id, expiry_minutes=None, token=None):
+        query_params = urlencode({"token": token or LinkGenerator.generate_token(merged_video_id, expiry_minutes)})
+        return f"{settings.SITE_URL}/access-shared-video/hls/master.m3u8?{query_params}"
+
+    @staticmethod
+    def unsign_link(token):
+        """Return (merged_video_id, expires_at as a Unix time) of a valid, unexpired token."""
         try:
-            max_age_minutes = float(os.getenv('link_max_age_minutes', 30))
-            merged_video_id = LinkGenerator.signer.unsign(token, max_age=max_age_minutes * 60)
-            return merged_video_id
-        except SignatureExpired:
-            raise ValidationError("The link has expired.")
+            value = LinkGenerator.signer.unsign(token)
+            if ":" in value:
+                merged_video_id, expires_at = value.rsplit(":", 1)
+                expires_at = int(expires_at)
+            else:
+                # Links signed before expiries were embedded last LINK_MAX_AGE_MINUTES from signing.
+                merged_video_id = value
+                signed_at = b62_decode(token.rsplit(LinkGenerator.signer.sep, 2)[1])
+                expires_at = int(signed_at + settings.LINK_MAX_AGE_MINUTES * 60)
         except BadSignature:
             raise ValidationError("Invalid link.")
+        if expires_at <= time.time():
+            raise ValidationError("The link has expired.")
+        return merged_video_id, expires_at
+
+    @staticmethod
+    def validate_link(token):
+        return LinkGenerator.unsign_link(token)[0]
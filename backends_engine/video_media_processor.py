@@ -1,60 +1,311 @@
+import bisect
+import logging
 import os
 import tempfile
+import uuid
+from contextlib import ExitStack, contextmanager
 from moviepy.editor import VideoFileClip, concatenate_videoclips
 from datetime import datetime
 
 from media_management import settings
 from backends_engine.abstract_classes import BaseMediaProcessor
+from backends_engine.media_probe import METADATA_FIELDS, ProbeError, probe_media
+from backends_engine.encoding_profiles import (
+    effective_threads,
+    ffmpeg_encode_args,
+    ffmpeg_video_args,
+    get_encoding_profile,
+    moviepy_encode_kwargs,
+)
+from backends_engine.ffmpeg_tools import FFmpegError, run_ffmpeg, stream_info, stream_signature, keyframe_times
+from backends_engine.metrics import count_bytes, ffmpeg_processes, stage_timer
+from backends_engine.media_storage import is_tiered, local_media_path, pinned
 from django.core.exceptions import ValidationError
 
+logger_debug = logging.getLogger("debug")
+
+TRIM_MODE_REENCODE = "reencode"
+TRIM_MODE_COPY = "copy"
+TRIM_MODE_ACCURATE = "accurate"
+TRIM_MODES = [TRIM_MODE_REENCODE, TRIM_MODE_COPY, TRIM_MODE_ACCURATE]
+
+# Codecs we can re-encode the partial GOPs into while keeping the copied middle section decodable.
+SMART_CUT_CODECS = {"h264": "libx264"}
+
+# Intermediate container for smart-cut parts; it keeps the in-band SPS/PPS the splice relies on.
+SPLICE_FORMAT = "matroska"
+
+# First video stream plus the first audio stream when the source has one.
+STREAM_MAP_ARGS = ["-map", "0:v:0", "-map", "0:a:0?"]
+
+
+def validate_trim_mode(mode):
+    if mode not in TRIM_MODES:
+        raise ValidationError(f"Unsupported trim mode: {mode}. Allowed modes are: {', '.join(TRIM_MODES)}")
+    return mode
+
+
+def encoder_settings(mode, profile=None):
+    """Everything besides the input and the time range that decides the bytes a trim in ``mode`` produces."""
+    if mode == TRIM_MODE_COPY:
+        return {"mode": mode}
+    return {"mode": mode, "profile": get_encoding_profile(profile)}
+
+
+def merge_encoder_settings(profile=None):
+    # Merges fall back to a full encode with the profile when the inputs cannot be concatenated as-is.
+    return {"profile": get_encoding_profile(profile)}
+
+
+def resolve_local_path(media_file):
+    """Return a filesystem path holding the media bytes, or None when the file only lives in memory."""
+    # Large uploads are already spooled to disk by TemporaryFileUploadHandler.
+    if hasattr(media_file, "temporary_file_path"):
+        return media_file.temporary_file_path()
+
+    # Stored FieldFiles on tiered storage are read through the hot cache, fetching them when evicted.
+    if hasattr(media_file, "storage") and is_tiered(media_file.storage):
+        try:
+            return media_file.storage.local_path(media_file.name)
+        except FileNotFoundError:
+            return None
+
+    # Stored FieldFiles on a local storage backend (e.g. FileSystemStorage under MEDIA_ROOT).
+    if hasattr(media_file, "storage"):
+        try:
+            path = media_file.path
+        except (NotImplementedError, ValueError):
+            path = None
+        return path if path and os.path.isfile(path) else None
+
+    # Plain django File objects wrapping an open file on disk.
+    file_name = getattr(getattr(media_file, "file", None), "name", None)
+    if isinstance(file_name, str) and os.path.isfile(file_name):
+        return file_name
+
+    return None
+
 
 class VideoMediaProcessor(BaseMediaProcessor):
-    def calculate_duration(self):
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_file:
+    def __init__(self, media_file, metadata=None, threads=None):
+        super().__init__(media_file)
+        # Stream metadata already stored for this file (e.g. on VideoUpload) spares a second probe.
+        self._metadata = metadata
+        # Encoder thread count; set by ParallelTrimExecutor so parallel encodes share the CPU budget.
+        self.threads = threads
+
+    def probe_metadata(self):
+        """Read duration and stream metadata from the container header without starting ffmpeg."""
+        if self._metadata is None:
+            try:
+                with stage_timer("upload", "probe"):
+                    self._metadata = self._probe()
+            except ProbeError:
+                self._metadata = {}
+        return self._metadata
+
+    def _probe(self):
+        local_path = resolve_local_path(self.media_file)
+        if local_path:
+            with open(local_path, "rb") as source_file:
+                return probe_media(source_file)
+        self.media_file.seek(0)
+        try:
+            return probe_media(self.media_file)
+        finally:
+            self.media_file.seek(0)
+
+    def stream_metadata(self):
+        """Metadata fields stored alongside the upload (everything except the duration)."""
+        metadata = self.probe_metadata()
+        return {field: metadata.get(field) for field in METADATA_FIELDS}
+
+    def _write_temp_copy(self, operation):
+        with stage_timer(operation, "temp_copy"), tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_file:
             for chunk in self.media_file.chunks():
                 temp_file.write(chunk)
-            temp_file_path = temp_file.name
+            return temp_file.name
+
+    @contextmanager
+    def _source_path(self, operation):
+        """Yield a readable path for the media file, copying to a scratch file only for in-memory uploads."""
+        with pinned(self.media_file):
+            local_path = resolve_local_path(self.media_file)
+            if local_path:
+                yield local_path
+                return
 
+        temp_file_path = self._write_temp_copy(operation)
         try:
-            with VideoFileClip(temp_file_path) as clip:
-                duration = clip.duration
-        except Exception as e:
-            raise ValidationError(f"Cannot calculate duration of the media file: {str(e)}")
+            yield temp_file_path
         finally:
             if os.path.exists(temp_file_path):
                 os.remove(temp_file_path)
 
+    def calculate_duration(self):
+        duration = self.probe_metadata().get("duration")
+        if duration:
+            return duration
+
+        # Fall back to a full ffmpeg probe for containers the header parser does not understand.
+        try:
+            with self._source_path("upload") as source_path, stage_timer("upload", "probe"):
+                ffmpeg_processes.inc(purpose="moviepy")
+                with VideoFileClip(source_path) as clip:
+                    duration = clip.duration
+        except Exception as e:
+            raise ValidationError(f"Cannot calculate duration of the media file: {str(e)}")
+
         return duration
 
-    def trim_media(self, start_time, end_time):
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_file:
-            for chunk in self.media_file.chunks():
-                temp_file.write(chunk)
-            temp_file_path = temp_file.name
+    def trim_media(self, start_time, end_time, mode=None, profile=None):
+        return self.trim_media_batch([(start_time, end_time)], mode=mode, profile=profile)[0]
+
+    def trim_media_batch(self, time_ranges, mode=None, profile=None):
+        """Trim every (start_time, end_time) range from one opened source.
+
+        The source is resolved and probed once, and in re-encode mode a single ``VideoFileClip`` reader
+        serves all ranges, visited in start order so the reader only ever seeks forward. Paths are
+        returned in the order the ranges were given. Re-encoded output uses the named encoding profile.
+        """
+        mode = validate_trim_mode(mode or settings.DEFAULT_TRIM_MODE)
+        encoding = get_encoding_profile(profile)
 
         # Ensure the directory exists
         output_directory = os.path.join(settings.MEDIA_ROOT, "trimmed_videos/")
         os.makedirs(output_directory, exist_ok=True)
 
-        # Construct the output file path with a timestamp
+        # Construct the output file paths with a timestamp; the suffix keeps trims created within
+        # the same second from overwriting each other.
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         file_name = os.path.splitext(os.path.basename(self.media_file.name))[0]
-        output_file = os.path.join(output_directory, f"{file_name}_trimmed_{timestamp}.mp4")
+        output_files = [
+            os.path.join(output_directory, f"{file_name}_trimmed_{timestamp}_{uuid.uuid4().hex[:8]}.mp4")
+            for _ in time_ranges
+        ]
+        jobs = sorted(zip(time_ranges, output_files), key=lambda job: job[0][0])
 
         try:
-            with VideoFileClip(temp_file_path) as clip:
-                trimmed_clip = clip.subclip(start_time, end_time)
-                trimmed_clip.write_videofile(output_file, codec="libx264")
+            with self._source_path("trim") as source_path, stage_timer("trim", "encode"):
+                self._run_trim_jobs(source_path, jobs, mode, encoding)
         except Exception as e:
             raise ValidationError(f"Cannot trim media file: {str(e)}")
-        finally:
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+        count_bytes("trim", "out", output_files)
 
-        # Return the path relative to MEDIA_URL
-        return os.path.relpath(output_file, settings.MEDIA_ROOT)
+        # Return the paths relative to MEDIA_URL
+        return [os.path.relpath(output_file, settings.MEDIA_ROOT) for output_file in output_files]
+
+    def _run_trim_jobs(self, source_path, jobs, mode, encoding):
+        if mode == TRIM_MODE_REENCODE:
+            # One reader for the source plus one writer per range.
+            ffmpeg_processes.inc(1 + len(jobs), purpose="moviepy")
+            with VideoFileClip(source_path) as clip:
+                for (start_time, end_time), output_file in jobs:
+                    clip.subclip(start_time, end_time).write_videofile(
+                        output_file, **moviepy_encode_kwargs(encoding, self.threads)
+                    )
+            return
+
+        keyframes = keyframe_times(source_path)
+        video_codec, frame_rate = None, None
+        if mode == TRIM_MODE_ACCURATE:
+            video_codec, frame_rate = self._video_codec_and_frame_rate(source_path)
+
+        for (start_time, end_time), output_file in jobs:
+            if mode == TRIM_MODE_COPY:
+                self._trim_stream_copy(source_path, start_time, end_time, output_file, keyframes)
+            else:
+                self._trim_smart_cut(
+                    source_path, start_time, end_time, output_file, keyframes, video_codec, frame_rate, encoding
+                )
+
+    def _video_codec_and_frame_rate(self, source_path):
+        metadata = self.probe_metadata()
+        if metadata.get("video_codec") and metadata.get("frame_rate"):
+            return metadata["video_codec"], metadata["frame_rate"]
+
+        video = stream_info(source_path)["video"]
+        return video["codec"], video["fps"]
+
+    def _trim_stream_copy(self, source_path, start_time, end_time, output_file, keyframes):
+        """Cut on the keyframe at or before ``start_time`` and copy packets without re-encoding."""
+        self._copy_segment(source_path, copy_cut_start(keyframes, start_time), end_time, output_file, "mp4")
+
+    def _trim_smart_cut(
+        self, source_path, start_time, end_time, output_file, keyframes, video_codec, frame_rate, encoding
+    ):
+        """Frame-accurate trim that only re-encodes the partial GOPs at both ends of the range.
+
+        Everything between the first keyframe after ``start_time`` and the last keyframe before
+        ``end_time`` is copied as-is. The parts are written with in-band parameter sets so the
+        re-encoded edges stay decodable next to the copied packets, then joined with the concat demuxer.
+        The edges keep the source codec, 4:2:0 and AAC so they splice cleanly; only the speed and quality
+        options come from the encoding profile.
+        """
+        encoder = SMART_CUT_CODECS.get(video_codec)
+
+        first_index = bisect.bisect_left(keyframes, start_time)
+        last_index = bisect.bisect_right(keyframes, end_time) - 1
+        if encoder is None or first_index >= len(keyframes) or last_index <= first_index:
+            # No complete GOP inside the range (or a codec we cannot splice): re-encode it all.
+            self._encode_segment(
+                source_path, start_time, end_time, output_file, "mp4", ffmpeg_encode_args(encoding, self.threads)
+            )
+            return
+
+        thread_count = effective_threads(encoding, self.threads)
+        edge_args = (
+            ["-c:v", encoder]
+            + ffmpeg_video_args(encoding)
+            + ["-pix_fmt", "yuv420p", "-c:a", "aac"]
+            + (["-threads", str(thread_count)] if thread_count else [])
+        )
 
-    def merge_media(self, trimmed_videos):
+        copy_start, copy_end = keyframes[first_index], keyframes[last_index]
+        # Stop the copied section on the frame before ``copy_end``; a plain ``-t`` cut is applied in
+        # decode order and would leak the frames the tail segment re-encodes.
+        copy_frames = round((copy_end - copy_start) * frame_rate) if frame_rate else None
+
+        with tempfile.TemporaryDirectory() as work_directory:
+            segments = []
+            if copy_start > start_time:
+                segments.append(os.path.join(work_directory, "head.mkv"))
+                self._encode_segment(source_path, start_time, copy_start, segments[-1], SPLICE_FORMAT, edge_args)
+
+            segments.append(os.path.join(work_directory, "middle.mkv"))
+            self._copy_segment(source_path, copy_start, copy_end, segments[-1], SPLICE_FORMAT, max_frames=copy_frames)
+
+            if end_time > copy_end:
+                segments.append(os.path.join(work_directory, "tail.mkv"))
+                self._encode_segment(source_path, copy_end, end_time, segments[-1], SPLICE_FORMAT, edge_args)
+
+            concat_copy(segments, output_file, work_directory)
+
+    @staticmethod
+    def _copy_segment(source_path, start_time, end_time, output_file, output_format, max_frames=None):
+        frame_args = ["-frames:v", str(max_frames)] if max_frames else []
+        run_ffmpeg(
+            range_input_args(source_path, start_time, end_time)
+            + STREAM_MAP_ARGS
+            + ["-c", "copy"]
+            + frame_args
+            + splice_args(output_format)
+            + ["-avoid_negative_ts", "make_zero", "-f", output_format, output_file]
+        )
+
+    @staticmethod
+    def _encode_segment(source_path, start_time, end_time, output_file, output_format, codec_args):
+        run_ffmpeg(
+            range_input_args(source_path, start_time, end_time)
+            + STREAM_MAP_ARGS
+            + codec_args
+            + splice_args(output_format)
+            + ["-f", output_format, output_file]
+        )
+
+    def merge_media(self, trimmed_videos, profile=None):
+        encoding = get_encoding_profile(profile)
+        clips = []
         try:
             # Ensure the directory exists
             output_directory = os.path.join(settings.MEDIA_ROOT, "merged_videos/")
@@ -62,16 +313,66 @@ class VideoMediaProcessor(BaseMediaProcessor):
 
             # Construct the output file path with a timestamp
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            output_file = os.path.join(output_directory, f"merged_video_{timestamp}.mp4")
+            output_file = os.path.join(output_directory, f"merged_video_{timestamp}_{uuid.uuid4().hex[:8]}.mp4")
 
-            clips = [VideoFileClip(video.file.path) for video in trimmed_videos]
-            final_clip = concatenate_videoclips(clips)
-            final_clip.write_videofile(output_file, codec="libx264")
+            with ExitStack() as sources:
+                source_paths = [sources.enter_context(local_media_path(video.file)) for video in trimmed_videos]
+                count_bytes("merge", "in", source_paths)
+                with stage_timer("merge", "probe"):
+                    can_concat = self._can_concat_without_reencode(source_paths)
+                with stage_timer("merge", "encode"):
+                    if can_concat:
+                        logger_debug.debug("Merging %d inputs with packet-level concatenation.", len(source_paths))
+                        with tempfile.TemporaryDirectory() as work_directory:
+                            concat_copy(source_paths, output_file, work_directory)
+                    else:
+                        logger_debug.debug("Merging %d inputs with a full re-encode.", len(source_paths))
+                        ffmpeg_processes.inc(len(source_paths) + 1, purpose="moviepy")
+                        clips = [VideoFileClip(source_path) for source_path in source_paths]
+                        final_clip = concatenate_videoclips(clips)
+                        final_clip.write_videofile(output_file, **moviepy_encode_kwargs(encoding, self.threads))
         except Exception as e:
             raise ValidationError(f"Cannot merge media files: {str(e)}")
         finally:
             for clip in clips:
                 clip.close()
+        count_bytes("merge", "out", [output_file])
 
         # Return the path relative to MEDIA_URL
         return os.path.relpath(output_file, settings.MEDIA_ROOT)
+
+    @staticmethod
+    def _can_concat_without_reencode(source_paths):
+        """True when every input shares codec, pixel format, resolution, frame rate and timebase."""
+        try:
+            signatures = {stream_signature(stream_info(source_path)) for source_path in source_paths}
+        except FFmpegError:
+            return False
+        return len(signatures) == 1
+
+
+def copy_cut_start(keyframes, start_time):
+    """Where a stream-copy trim asked to start at ``start_time`` really starts: the keyframe at or before it."""
+    index = bisect.bisect_right(keyframes, start_time) - 1
+    return keyframes[index] if index >= 0 else 0.0
+
+
+def range_input_args(source_path, start_time, end_time):
+    # Input-side seeking: ffmpeg jumps straight to the nearest keyframe instead of decoding from the start.
+    return ["-ss", f"{start_time:.6f}", "-i", source_path, "-t", f"{end_time - start_time:.6f}"]
+
+
+def splice_args(output_format):
+    # Repeat the H.264 parameter sets in-band so every spliced part can be decoded on its own.
+    return ["-bsf:v", "h264_mp4toannexb"] if output_format == SPLICE_FORMAT else []
+
+
+def concat_copy(segment_paths, output_file, work_directory):
+    """Join segments that share codec parameters with the concat demuxer, without re-encoding."""
+    list_path = os.path.join(work_directory, "segments.txt")
+    with open(list_path, "w") as list_file:
+        for segment_path in segment_paths:
+            escaped_path = segment_path.replace("'", "'\\''")
+            list_file.write(f"file '{escaped_path}'\n")
+
+    run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-movflags", "+faststart", output_file])
@@ -1,26 +1,59 @@
+from django.db.models import Prefetch
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework.decorators import api_view, authentication_classes
+from rest_framework.decorators import action, api_view, authentication_classes
 from backends_engine.authentication import StaticTokenAuthentication
 
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from backends_engine.models import VideoUpload, TrimmedVideo, MergedVideo
-from backends_engine.serializers import UploadedVideoSerializer, TrimmedVideoSerializer, MergedVideoSerializer
+from backends_engine.models import VideoUpload, VideoPreview, TrimmedVideo, MergedVideo, ProcessingJob, UploadSession
+from backends_engine.serializers import (
+    UploadedVideoSerializer,
+    TrimmedVideoSerializer,
+    MergedVideoSerializer,
+    ProcessingJobSerializer,
+)
+from backends_engine.pagination import CreatedAtCursorPagination, UploadedAtCursorPagination
 from backends_engine.utils import (
     success_true_response,
     success_false_response,
     validate_single_file_upload,
-    validate_merged_video_request,
-    LinkGenerator,
+    wants_background_processing,
+    wants_background_previews,
+    wants_hls_packaging,
+    fetch_in_request_order,
+    ObjectsNotFound,
 )
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from backends_engine.video_media_processor import VideoMediaProcessor
+from backends_engine.video_media_processor import VideoMediaProcessor, validate_trim_mode
+from backends_engine.encoding_profiles import validate_encoding_profile
+from backends_engine.media_jobs import (
+    enqueue_job,
+    enqueue_hls_packaging,
+    schedule_previews,
+    trim_parent_video,
+    merge_trimmed_videos,
+)
+from backends_engine.preview_assets import point_index_at
+from backends_engine.hls_packaging import resolve_hls_asset, tokenize_playlist
+from backends_engine.upload_handlers import HashingUploadHandler, ValidatingUploadHandler, install_upload_handler
+from backends_engine.file_delivery import serve_file
+from backends_engine.media_storage import StoredFilePin, stored_file_path
+from backends_engine.shared_links import resolve_link
+from backends_engine.upload_sessions import (
+    UploadOffsetMismatch,
+    append_chunk,
+    complete_session,
+    create_session,
+    validate_upload_limits,
+)
+from backends_engine.content_store import hash_file, find_reusable_upload, create_upload_from_existing, attach_blob
+from backends_engine import metrics
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 import logging
 import os
 from rest_framework.permissions import AllowAny
-from rest_framework.decorators import permission_classes
 from django.http import HttpResponse, Http404
 from rest_framework.views import APIView
 
@@ -44,27 +77,64 @@ def authentication_check_view(request):
     return Response({"message": "This is a response from the static token authenticated view"})
 
 
+def metrics_view(request):
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @authentication_classes([StaticTokenAuthentication])
 class UploadedVideoViewSet(viewsets.ModelViewSet):
     queryset = VideoUpload.objects.all()
     serializer_class = UploadedVideoSerializer
+    pagination_class = UploadedAtCursorPagination
     media_processor_class = VideoMediaProcessor
 
+    def get_queryset(self):
+        if self.action == "list":
+            # Only the serialized columns; deletes and updates still load the whole row for signals.
+            return self.queryset.only(*UploadedVideoSerializer.Meta.fields)
+        return self.queryset
+
     def create(self, request, *args, **kwargs):
         logger_info.info("Received request to upload a video.")
         try:
-            # Validate single file upload
-            validate_single_file_upload(request)
+            # Hash the file while the body is parsed so duplicate content can be recognised
+            hashing_handler = install_upload_handler(request, HashingUploadHandler(request))
+            # Reject oversized and non-video uploads while they stream in, before the hasher sees them
+            validating_handler = install_upload_handler(request, ValidatingUploadHandler(request))
+
+            # Validate single file upload; this is where the body is received and parsed
+            try:
+                with metrics.stage_timer("upload", "receive"):
+                    validate_single_file_upload(request)
+            except ValidationError:
+                # A rejected upload leaves no file behind; report why instead of "no file provided".
+                validating_handler.raise_for_rejection()
+                raise
             logger_debug.debug("File upload validated.")
 
             # Validate serializer
             serializer = self.get_serializer(data=request.data)
             if not serializer.is_valid():
                 error_message = next(iter(serializer.errors.values()))[0]
-                logger_error.error(f"Serializer validation failed: {error_message}")
+                logger_error.error("Serializer validation failed: %s", error_message)
                 return Response(success_false_response(message=error_message), status=status.HTTP_400_BAD_REQUEST)
 
             media_file = serializer.validated_data["file"]
+            metrics.media_bytes.inc(media_file.size, operation="upload", direction="in")
+            content_hash = hashing_handler.digests.get("file") or hash_file(media_file)
+
+            # Identical content was uploaded before: reuse its blob and stored metadata instead of probing again
+            existing_upload = find_reusable_upload(content_hash)
+            if existing_upload is not None:
+                validate_upload_limits(self.media_processor_class, existing_upload.file_size, existing_upload.duration)
+                video_instance = create_upload_from_existing(existing_upload)
+                schedule_previews(video_instance, wants_background_previews(request.data))
+                logger_info.info("Video uploaded successfully with ID: %s (deduplicated)", video_instance.id)
+                return Response(
+                    success_true_response(message="Video uploaded successfully", data={"id": str(video_instance.id)}),
+                    status=status.HTTP_201_CREATED,
+                )
+
             processor = self.media_processor_class(media_file)
 
             # Validate media file
@@ -73,11 +143,15 @@ class UploadedVideoViewSet(viewsets.ModelViewSet):
                 min_duration=float(settings.MIN_VIDEO_DURATION_SEC),
                 max_duration=float(settings.MAX_VIDEO_DURATION_SEC),
             )
-            logger_debug.debug(f"Media validated: file_size={file_size}, duration={duration}")
+            logger_debug.debug("Media validated: file_size=%s, duration=%s", file_size, duration)
 
-            # Save the video instance
-            video_instance = serializer.save(file_size=file_size, duration=duration)
-            logger_info.info(f"Video uploaded successfully with ID: {video_instance.id}")
+            # Save the video instance along with the stream metadata read during validation
+            stream_metadata = processor.stream_metadata()
+            with metrics.stage_timer("upload", "db_write"):
+                video_instance = serializer.save(file_size=file_size, duration=duration, **stream_metadata)
+                attach_blob(video_instance, content_hash)
+            schedule_previews(video_instance, wants_background_previews(request.data))
+            logger_info.info("Video uploaded successfully with ID: %s", video_instance.id)
 
             return Response(
                 success_true_response(message="Video uploaded successfully", data={"id": str(video_instance.id)}),
@@ -86,7 +160,7 @@ class UploadedVideoViewSet(viewsets.ModelViewSet):
 
         except ValidationError as e:
             message = " ".join(e.messages)
-            logger_error.error(f"Validation error occurred: {message}")
+            logger_error.error("Validation error occurred: %s", message)
             return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             message = f"An unexpected error occurred: {str(e)}"
@@ -96,11 +170,52 @@ class UploadedVideoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    def _preview_or_404(self, pk):
+        try:
+            return VideoPreview.objects.get(video_id=get_object_or_404(VideoUpload, pk=pk).id)
+        except VideoPreview.DoesNotExist:
+            raise Http404("Preview is not ready.")
+
+    def _serve_preview_image(self, request, relative_name):
+        content_type = "image/webp" if relative_name.endswith(".webp") else "image/jpeg"
+        pin = StoredFilePin(relative_name)
+        response = serve_file(request, pin.path, relative_name, content_type, attachment=False, pin=pin)
+        response["Cache-Control"] = "private, max-age=3600"
+        return response
+
+    @action(detail=True, methods=["get"])
+    def thumbnail(self, request, pk=None):
+        return self._serve_preview_image(request, self._preview_or_404(pk).thumbnail)
+
+    @action(detail=True, methods=["get"])
+    def sprite(self, request, pk=None):
+        return self._serve_preview_image(request, self._preview_or_404(pk).sprite)
+
+    @action(detail=True, methods=["get"], url_path="sprite.vtt")
+    def sprite_index(self, request, pk=None):
+        """WebVTT thumbnail track whose cues point at tiles of this video's sprite endpoint."""
+        preview = self._preview_or_404(pk)
+        with open(stored_file_path(preview.sprite_index)) as index_file:
+            index_text = point_index_at(
+                index_file.read(),
+                os.path.basename(preview.sprite),
+                request.build_absolute_uri(reverse("videos-sprite", args=[pk])),
+            )
+        response = HttpResponse(index_text, content_type="text/vtt")
+        response["Cache-Control"] = "private, max-age=3600"
+        return response
+
 
 @authentication_classes([StaticTokenAuthentication])
 class TrimmedVideoViewSet(viewsets.ModelViewSet):
     queryset = TrimmedVideo.objects.all()
     serializer_class = TrimmedVideoSerializer
+    pagination_class = CreatedAtCursorPagination
+
+    def get_queryset(self):
+        if self.action == "list":
+            return self.queryset.only(*TrimmedVideoSerializer.Meta.fields)
+        return self.queryset
 
     def create(self, request, *args, **kwargs):
         logger_info.info("Received request to trim video.")
@@ -114,12 +229,14 @@ class TrimmedVideoViewSet(viewsets.ModelViewSet):
             return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
 
         parent_video = get_object_or_404(VideoUpload, id=parent_video_id)
-        logger_debug.debug(f"Parent video retrieved: {parent_video_id}")
-
-        processor = VideoMediaProcessor(parent_video.file)
-        trimmed_videos = []
+        logger_debug.debug("Parent video retrieved: %s", parent_video_id)
 
         try:
+            mode = validate_trim_mode(request.data.get("mode") or settings.DEFAULT_TRIM_MODE)
+            profile = validate_encoding_profile(request.data.get("profile") or settings.DEFAULT_ENCODING_PROFILE)
+            logger_debug.debug("Trim mode selected: %s, encoding profile: %s", mode, profile)
+
+            time_ranges = []
             for trim in trims:
                 start_time = trim.get("start_time")
                 end_time = trim.get("end_time")
@@ -127,18 +244,25 @@ class TrimmedVideoViewSet(viewsets.ModelViewSet):
                 if not start_time or not end_time:
                     continue
 
-                trimmed_file_path = processor.trim_media(float(start_time), float(end_time))
-                trimmed_video = TrimmedVideo.objects.create(
-                    parent_video=parent_video,
-                    start_time=float(start_time),
-                    end_time=float(end_time),
-                    file=trimmed_file_path,
-                    duration=float(end_time) - float(start_time),
+                time_ranges.append((float(start_time), float(end_time)))
+
+            if wants_background_processing(request.data):
+                job = enqueue_job(
+                    ProcessingJob.TRIM,
+                    {
+                        "parent_video": str(parent_video.id),
+                        "time_ranges": time_ranges,
+                        "mode": mode,
+                        "profile": profile,
+                    },
                 )
-                trimmed_videos.append(trimmed_video)
+                return job_accepted_response(request, job, message="Trim job accepted.")
+
+            # Open the parent video once for every requested trim
+            trimmed_videos = trim_parent_video(parent_video, time_ranges, mode, profile)
 
             serializer = self.get_serializer(trimmed_videos, many=True)
-            logger_info.info(f"Videos trimmed successfully: {[video.id for video in trimmed_videos]}")
+            logger_info.info("Videos trimmed successfully: %s", [video.id for video in trimmed_videos])
             return Response(
                 {"success": True, "message": "Videos trimmed successfully.", "data": serializer.data},
                 status=status.HTTP_201_CREATED,
@@ -146,7 +270,7 @@ class TrimmedVideoViewSet(viewsets.ModelViewSet):
 
         except ValidationError as e:
             message = " ".join(e.messages)
-            logger_error.error(f"Validation error occurred: {message}")
+            logger_error.error("Validation error occurred: %s", message)
             return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             message = f"An unexpected error occurred: {str(e)}"
@@ -156,8 +280,15 @@ class TrimmedVideoViewSet(viewsets.ModelViewSet):
 
 @authentication_classes([StaticTokenAuthentication])
 class MergedVideoViewSet(viewsets.ModelViewSet):
-    queryset = MergedVideo.objects.all()
+    # One query for the trimmed video ids of a whole page instead of one per merged video.
+    queryset = MergedVideo.objects.prefetch_related(Prefetch("trimmed_videos", TrimmedVideo.objects.only("id")))
     serializer_class = MergedVideoSerializer
+    pagination_class = CreatedAtCursorPagination
+
+    def get_queryset(self):
+        if self.action == "list":
+            return self.queryset.only("id", "file", "duration", "hls_playlist", "created_at")
+        return self.queryset
 
     def create(self, request, *args, **kwargs):
         logger_info.info("Received request to merge videos.")
@@ -166,76 +297,137 @@ class MergedVideoViewSet(viewsets.ModelViewSet):
             trimmed_video_ids = request.data.get("trimmed_videos")
             if not trimmed_video_ids:
                 message = "Please provide 'trimmed_videos'."
-                logger_error.error(f"Missing 'trimmed_videos': {message}")
+                logger_error.error("Missing 'trimmed_videos': %s", message)
                 return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
 
-            # Fetch and validate the trimmed videos
-            trimmed_videos = []
-            for trimmed_video_id in trimmed_video_ids:
-                trimmed_video = get_object_or_404(TrimmedVideo, id=trimmed_video_id)
-                trimmed_videos.append(trimmed_video)
-                logger_debug.debug(f"Trimmed video {trimmed_video_id} retrieved for merging.")
+            # Fetch all trimmed videos in one query, keeping the requested merge order
+            trimmed_videos = fetch_in_request_order(TrimmedVideo, trimmed_video_ids)
+            logger_debug.debug("Trimmed videos %s retrieved for merging.", trimmed_video_ids)
 
             if len(trimmed_videos) < 2:
                 message = "At least two trimmed videos are required to merge."
-                logger_error.error(f"Insufficient trimmed videos: {message}")
+                logger_error.error("Insufficient trimmed videos: %s", message)
                 return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
 
-            # Merge the videos
-            processor = VideoMediaProcessor(trimmed_videos[0].file)
-            merged_file_path = processor.merge_media(trimmed_videos)
-            logger_debug.debug(f"Merged file path: {merged_file_path}")
+            profile = validate_encoding_profile(request.data.get("profile") or settings.DEFAULT_ENCODING_PROFILE)
 
-            # Create the merged video instance
-            merged_video = MergedVideo.objects.create(
-                file=merged_file_path, duration=sum([video.duration for video in trimmed_videos])
-            )
-            merged_video.trimmed_videos.set(trimmed_videos)
-            logger_info.info(f"Merged video created successfully with ID: {merged_video.id}")
+            hls = wants_hls_packaging(request.data)
+
+            if wants_background_processing(request.data):
+                job = enqueue_job(
+                    ProcessingJob.MERGE,
+                    {"trimmed_videos": [str(video.id) for video in trimmed_videos], "profile": profile, "hls": hls},
+                )
+                return job_accepted_response(request, job, message="Merge job accepted.")
+
+            # Merge the videos and create the merged video instance
+            merged_video = merge_trimmed_videos(trimmed_videos, profile)
+            logger_info.info("Merged video created successfully with ID: %s", merged_video.id)
 
-            serializer = self.get_serializer(merged_video)
+            data = self.get_serializer(merged_video).data
+            if hls:
+                # Packaging encodes every rendition, so it always runs in the background
+                data["hls_job_id"] = str(enqueue_hls_packaging(merged_video, profile).id)
             return Response(
-                success_true_response(message="Videos merged successfully", data=serializer.data),
+                success_true_response(message="Videos merged successfully", data=data),
                 status=status.HTTP_201_CREATED,
             )
 
+        except ObjectsNotFound as e:
+            logger_error.error(str(e))
+            return Response(
+                success_false_response(message=str(e), data={"missing_ids": e.missing_ids}),
+                status=status.HTTP_404_NOT_FOUND,
+            )
         except ValidationError as e:
             message = " ".join(e.messages)
-            logger_error.error(f"Validation error occurred: {message}")
+            logger_error.error("Validation error occurred: %s", message)
             return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             message = f"An unexpected error occurred: {str(e)}"
-            logger_error.error(f"Exception: {message}")
+            logger_error.error("Exception: %s", message)
             return Response(success_false_response(message=message), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@permission_classes([AllowAny])
-class LinkSharingViewSet(viewsets.ViewSet):
+def job_accepted_response(request, job, message):
+    status_url = request.build_absolute_uri(reverse("jobs-detail", args=[job.id]))
+    return Response(
+        success_true_response(message=message, data={"job_id": str(job.id), "status_url": status_url}),
+        status=status.HTTP_202_ACCEPTED,
+    )
 
-    def create(self, request, *args, **kwargs):
-        logger_info.info("Received request to share video link.")
+
+@authentication_classes([StaticTokenAuthentication])
+class ProcessingJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ProcessingJob.objects.select_related("merged_video").prefetch_related(
+        "trimmed_videos", Prefetch("merged_video__trimmed_videos", TrimmedVideo.objects.only("id"))
+    )
+    serializer_class = ProcessingJobSerializer
+    pagination_class = CreatedAtCursorPagination
+
+
+def upload_session_response(session, status_code=status.HTTP_200_OK, message=""):
+    data = {"id": str(session.id), "offset": session.offset, "size": session.size_bytes, "status": session.status}
+    if session.video_upload_id:
+        data["video_id"] = str(session.video_upload_id)
+    response = Response(success_true_response(message=message, data=data), status=status_code)
+    response["Upload-Offset"] = str(session.offset)
+    return response
+
+
+@authentication_classes([StaticTokenAuthentication])
+class UploadSessionViewSet(viewsets.ViewSet):
+    """Resumable uploads: open a session, PATCH raw chunks at ``Upload-Offset``, then complete it.
+
+    Chunks are read from the request stream and written directly into the final file, so nothing is
+    spooled and an interrupted upload resumes from the offset returned by GET.
+    """
+
+    media_processor_class = VideoMediaProcessor
+
+    def create(self, request):
         try:
-            # Validate request data
-            merged_video_id = validate_merged_video_request(request.data)
-            logger_debug.debug(f"Request data validated: merged_video_id={merged_video_id}")
+            session = create_session(request.data.get("filename"), request.data.get("size"), self.media_processor_class)
+            return upload_session_response(session, status.HTTP_201_CREATED, message="Upload session created")
+        except ValidationError as e:
+            message = " ".join(e.messages)
+            logger_error.error("Validation error occurred: %s", message)
+            return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
 
-            # Validate merged video existence
-            get_object_or_404(MergedVideo, id=merged_video_id)
-            logger_debug.debug(f"Merged video validated: {merged_video_id}")
+    def retrieve(self, request, pk=None):
+        return upload_session_response(get_object_or_404(UploadSession, pk=pk))
 
-            # Generate time-based expiry link including the static token
-            expiry_link = LinkGenerator.generate_link(merged_video_id)
-            full_link = f"{expiry_link}"
-            logger_debug.debug(f"Generated link with token: {full_link}")
+    def partial_update(self, request, pk=None):
+        session = get_object_or_404(UploadSession, pk=pk)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            message = "Please provide numeric 'Upload-Offset' and 'Content-Length' headers."
+            return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
 
-            return Response(
-                success_true_response(message="Link generated successfully.", data={"link": full_link}),
-                status=status.HTTP_200_OK,
-            )
+        try:
+            append_chunk(session, offset, request.stream, length)
+            return upload_session_response(session)
+        except UploadOffsetMismatch as e:
+            response = Response(success_false_response(message=str(e)), status=status.HTTP_409_CONFLICT)
+            response["Upload-Offset"] = str(e.expected_offset)
+            return response
+        except ValidationError as e:
+            message = " ".join(e.messages)
+            logger_error.error("Validation error occurred: %s", message)
+            return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=["post"])
+    def complete(self, request, pk=None):
+        session = get_object_or_404(UploadSession, pk=pk)
+        try:
+            video_upload = complete_session(session, self.media_processor_class)
+            schedule_previews(video_upload, wants_background_previews(request.data))
+            return upload_session_response(session, status.HTTP_201_CREATED, message="Video uploaded successfully")
         except ValidationError as e:
             message = " ".join(e.messages)
-            logger_error.error(f"Validation error occurred: {message}")
+            logger_error.error("Validation error occurred: %s", message)
             return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             message = f"An unexpected error occurred: {str(e)}"
@@ -243,33 +435,39 @@ class LinkSharingViewSet(viewsets.ViewSet):
             return Response(success_false_response(message=message), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class SharedVideoView(APIView):
+class SharedVideoHlsView(APIView):
+    """Serves the HLS package of a shared merged video under the same signed token as the MP4 link."""
+
     permission_classes = [AllowAny]
 
-    def get(self, request, *args, **kwargs):
+    def get(self, request, asset, *args, **kwargs):
         token = request.query_params.get("token")
 
         if not token:
             return Response({"success": False, "message": "Wrong link."}, status=400)
 
         try:
-            merged_video_id = LinkGenerator.validate_link(token)
-            merged_video = MergedVideo.objects.get(id=merged_video_id)
-
-            file_path = os.path.join(settings.MEDIA_ROOT, merged_video.file.name)
-            if os.path.exists(file_path):
-                with open(file_path, "rb") as video_file:
-                    response = HttpResponse(video_file.read(), content_type="video/mp4")
-                    response["Content-Disposition"] = f'attachment; filename="{os.path.basename(file_path)}"'
-                    return response
-            else:
-                raise Http404("Video file not found")
-
+            asset_path = resolve_hls_asset(resolve_link(token), asset)
+            if asset_path is None:
+                return Response(success_false_response(message="Not found."), status=status.HTTP_404_NOT_FOUND)
+
+            if asset_path.endswith(".m3u8"):
+                with open(asset_path) as playlist_file:
+                    playlist = tokenize_playlist(playlist_file.read(), token)
+                response = HttpResponse(playlist, content_type="application/vnd.apple.mpegurl")
+                response["Cache-Control"] = "private, max-age=60"
+                return response
+
+            # Segments never change once packaged, so clients and caches may keep them.
+            relative_name = os.path.relpath(asset_path, settings.MEDIA_ROOT)
+            pin = StoredFilePin(relative_name)
+            response = serve_file(request, pin.path, relative_name, content_type="video/mp4", attachment=False, pin=pin)
+            response["Cache-Control"] = f"private, max-age={settings.HLS_SEGMENT_MAX_AGE_SEC}, immutable"
+            return response
+
+        except MergedVideo.DoesNotExist:
+            return Response(success_false_response(message="Not found."), status=status.HTTP_404_NOT_FOUND)
         except ValidationError as e:
             message = " ".join(e.messages)
-            logger_error.error(f"Validation error occurred: {message}")
+            logger_error.error("Validation error occurred: %s", message)
             return Response(success_false_response(message=message), status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            message = f"Validation error occurred: {str(e)}"
-            logger_error.error(message)
-            return Response(success_false_response(message=message), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
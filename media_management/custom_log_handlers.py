@@ -1,9 +1,35 @@
-from logging.handlers import TimedRotatingFileHandler
-from datetime import datetime
+"""Log handlers and the queue that keeps file I/O off the request threads.
+
+``configure_logging`` (Django's LOGGING_CONFIG) applies LOGGING as usual, then swaps the handlers of
+every logger it names for a single QueueHandler. Request threads only put records on the queue; one
+listener thread formats them as JSON lines, rolls the files over at midnight and writes them.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import logging.config
 import os
+import queue
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+# Attributes every LogRecord has; anything else was passed through ``extra`` and is logged as a field.
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", logging.INFO, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+# Logger name -> the handlers the listener writes its records to.
+_routes = {}
 
 
 class DateRotatingFileHandler(TimedRotatingFileHandler):
+    """The former handler, which formats a date and switches files on every record.
+
+    No longer configured; benchmark_logging measures the queue pipeline against it.
+    """
+
     def __init__(self, base_filename, **kwargs):
         self.base_filename = base_filename
         super().__init__(self.get_current_filename(), **kwargs)
@@ -21,3 +47,169 @@ class DateRotatingFileHandler(TimedRotatingFileHandler):
     def emit(self, record):
         self.baseFilename = self.get_current_filename()
         super().emit(record)
+
+
+def next_midnight(timestamp):
+    """The local midnight following ``timestamp``, as a timestamp."""
+    day = time.localtime(timestamp)
+    return time.mktime((day.tm_year, day.tm_mon, day.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+class DailyFileHandler(logging.FileHandler):
+    """Write to ``<ddmmyyyy>_<name>.log`` next to ``base_filename``, starting a new file each day.
+
+    The date is only worked out again once a record is stamped past the next midnight, so the check
+    per record is a float comparison. Files beyond the newest ``backupCount`` are deleted on rollover.
+    """
+
+    def __init__(self, base_filename, backupCount=0, encoding=None, delay=False):
+        self.base_filename = os.path.abspath(base_filename)
+        self.backup_count = backupCount
+        now = time.time()
+        self.rollover_at = next_midnight(now)
+        super().__init__(self.filename_for(now), encoding=encoding, delay=delay)
+
+    def filename_for(self, timestamp):
+        directory, name = os.path.split(self.base_filename)
+        return os.path.join(directory, f"{time.strftime('%d%m%Y', time.localtime(timestamp))}_{name}.log")
+
+    def emit(self, record):
+        if record.created >= self.rollover_at:
+            self.rollover(record.created)
+        super().emit(record)
+
+    def rollover(self, timestamp):
+        self.acquire()
+        try:
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = self.filename_for(timestamp)
+            self.rollover_at = next_midnight(timestamp)
+            # Opened now so that it counts as one of the kept days.
+            self.stream = self._open()
+        finally:
+            self.release()
+        self.delete_old_files()
+
+    def delete_old_files(self):
+        if self.backup_count <= 0:
+            return
+        directory, name = os.path.split(self.base_filename)
+        dated_files = []
+        for path in glob.glob(os.path.join(directory, f"*_{name}.log")):
+            try:
+                dated_files.append((datetime.strptime(os.path.basename(path).split("_", 1)[0], "%d%m%Y"), path))
+            except ValueError:
+                continue
+        kept_days = self.backup_count
+        for _, path in sorted(dated_files, reverse=True)[kept_days:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, module, lineno, message and any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "lineno": record.lineno,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue records as they are, leaving message formatting to the listener thread.
+
+    QueueHandler merges the arguments into the message before enqueueing so records can be pickled;
+    the queue here is in-process, so that work can wait. Arguments must not be mutated after logging.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class LoggerNameFilter(logging.Filter):
+    """Pass records from the named loggers only, so the listener writes each to its own handlers."""
+
+    def __init__(self, names):
+        super().__init__()
+        self.names = set(names)
+
+    def filter(self, record):
+        return record.name in self.names
+
+
+def start_queue_listener(loggers):
+    """Route ``loggers`` through one queue; return the started listener and each logger's former handlers.
+
+    The handlers move to the listener, filtered to the loggers they were configured for.
+    """
+    routes = {name: logging.getLogger(name).handlers for name in loggers if logging.getLogger(name).handlers}
+    if not routes:
+        return None, routes
+
+    handler_loggers = {}
+    for name, handlers in routes.items():
+        for handler in handlers:
+            handler_loggers.setdefault(handler, []).append(name)
+    for handler, names in handler_loggers.items():
+        handler.addFilter(LoggerNameFilter(names))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    for name in routes:
+        logging.getLogger(name).handlers = [queue_handler]
+
+    listener = QueueListener(log_queue, *handler_loggers, respect_handler_level=True)
+    listener.start()
+    return listener, routes
+
+
+def stop_queue_listener():
+    """Write out what is still queued and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    _routes.clear()
+
+
+def log_directly_after_fork():
+    """Forked workers inherit the queue but not the listener thread, so they write to the files themselves."""
+    global _listener
+    for name, handlers in _routes.items():
+        logging.getLogger(name).handlers = handlers
+    _routes.clear()
+    _listener = None
+
+
+def configure_logging(logging_settings):
+    global _listener
+    if not logging_settings:
+        return
+    stop_queue_listener()
+    logging.config.dictConfig(logging_settings)
+    if logging_settings.get("queue", True):
+        _listener, routes = start_queue_listener(logging_settings.get("loggers", {}))
+        _routes.update(routes)
+
+
+atexit.register(stop_queue_listener)
+os.register_at_fork(after_in_child=log_directly_after_fork)
@@ -0,0 +1,75 @@
+"""Database settings and per-connection tuning.
+
+``database_settings`` builds ``DATABASES["default"]`` from the environment: SQLite under BASE_DIR by
+default, or a server database when DB_ENGINE names one (postgresql, mysql). SQLite connections are
+switched to WAL with a busy timeout as they are opened, so concurrent writers wait for the lock
+instead of failing with "database is locked" and readers never block them.
+"""
+
+import os
+
+from django.conf import settings
+
+SERVER_ENGINES = {
+    "postgresql": "django.db.backends.postgresql",
+    "mysql": "django.db.backends.mysql",
+}
+SQLITE_ENGINE = "django.db.backends.sqlite3"
+SQLITE_JOURNAL_MODES = ["delete", "truncate", "persist", "memory", "wal", "off"]
+SQLITE_SYNCHRONOUS_LEVELS = ["off", "normal", "full", "extra"]
+
+
+def database_settings(base_dir):
+    engine = os.getenv("DB_ENGINE", "sqlite").lower()
+    # Reusing connections saves a connect (and, for SQLite, the PRAGMAs) per request.
+    conn_max_age = int(os.getenv("DB_CONN_MAX_AGE", 60))
+
+    if engine in SERVER_ENGINES:
+        return {
+            "ENGINE": SERVER_ENGINES[engine],
+            "NAME": os.getenv("DB_NAME", "media_management"),
+            "USER": os.getenv("DB_USER", ""),
+            "PASSWORD": os.getenv("DB_PASSWORD", ""),
+            "HOST": os.getenv("DB_HOST", "localhost"),
+            "PORT": os.getenv("DB_PORT", ""),
+            "CONN_MAX_AGE": conn_max_age,
+            "CONN_HEALTH_CHECKS": conn_max_age > 0,
+        }
+
+    return {
+        "ENGINE": SQLITE_ENGINE,
+        "NAME": os.getenv("DB_NAME", base_dir / "db.sqlite3"),
+        "CONN_MAX_AGE": conn_max_age,
+        "CONN_HEALTH_CHECKS": conn_max_age > 0,
+        # sqlite3's own busy handler, used until the PRAGMA below takes over.
+        "OPTIONS": {"timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)) / 1000},
+    }
+
+
+def sqlite_pragmas(journal_mode, busy_timeout_ms, synchronous):
+    if journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"Unsupported SQLite journal mode: {journal_mode}")
+    if synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Unsupported SQLite synchronous level: {synchronous}")
+    return [
+        # First, so that switching the journal mode already waits for a busy database.
+        f"PRAGMA busy_timeout={int(busy_timeout_ms)}",
+        f"PRAGMA journal_mode={journal_mode}",
+        # NORMAL is durable in WAL mode except for the last commits before a power loss.
+        f"PRAGMA synchronous={synchronous}",
+    ]
+
+
+def apply_sqlite_pragmas(cursor, journal_mode, busy_timeout_ms, synchronous):
+    for pragma in sqlite_pragmas(journal_mode, busy_timeout_ms, synchronous):
+        cursor.execute(pragma)
+
+
+def configure_connection(connection):
+    """Apply the SQLITE_* settings to a newly opened SQLite connection; other vendors are left alone."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(
+            cursor, settings.SQLITE_JOURNAL_MODE, settings.SQLITE_BUSY_TIMEOUT_MS, settings.SQLITE_SYNCHRONOUS
+        )
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from media_management.database import database_settings
 load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,6 +39,11 @@ REST_FRAMEWORK = {
     "EXCEPTION_HANDLER": "media_management.exception_handler.custom_exception_handler",
 }
 
+# List endpoints page with a cursor on the creation time; clients may ask for up to API_MAX_PAGE_SIZE
+# rows with ?page_size=.
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 500))
+
 
 # Application definition
 
@@ -52,6 +58,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the request timings include every other middleware.
+    "backends_engine.middleware.MetricsMiddleware",
+    "backends_engine.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -85,13 +94,18 @@ WSGI_APPLICATION = "media_management.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite by default; DB_ENGINE=postgresql or mysql (with DB_NAME, DB_USER, DB_PASSWORD, DB_HOST,
+# DB_PORT) switches to a server database. See media_management/database.py.
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": database_settings(BASE_DIR),
 }
 
+# Applied to every new SQLite connection. WAL lets readers run alongside the single writer, and
+# writers wait up to SQLITE_BUSY_TIMEOUT_MS for the lock instead of failing with "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'wal')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'normal')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -152,40 +166,32 @@ for log_dir in log_dirs:
 
 # Formatters
 FORMATTERS = {
-    "verbose": {
-        "format": "{levelname} TIME: {asctime:s} MODULE: {module} LINENO: {lineno:d} MESSAGE: {message}",
-        "style": "{",
-    },
-    "simple": {
-        "format": "{levelname} TIME: {asctime:s} MODULE: {module} LINENO: {lineno:d} MESSAGE: {message}",
-        "style": "{",
+    "json": {
+        "()": "media_management.custom_log_handlers.JsonLineFormatter",
     },
 }
 
 # Handlers
 HANDLERS = {
     "debug_handler": {
-        "class": "media_management.custom_log_handlers.DateRotatingFileHandler",
+        "class": "media_management.custom_log_handlers.DailyFileHandler",
         "base_filename": os.path.join(BASE_DIR, "logs/debug/", "debug_log"),
-        "when": "midnight",
         "backupCount": 30,
-        "formatter": "verbose",
+        "formatter": "json",
         "encoding": "utf-8",
     },
     "info_handler": {
-        "class": "media_management.custom_log_handlers.DateRotatingFileHandler",
+        "class": "media_management.custom_log_handlers.DailyFileHandler",
         "base_filename": os.path.join(BASE_DIR, "logs/info/", "info_log"),
-        "when": "midnight",
         "backupCount": 30,
-        "formatter": "verbose",
+        "formatter": "json",
         "encoding": "utf-8",
     },
     "error_handler": {
-        "class": "media_management.custom_log_handlers.DateRotatingFileHandler",
+        "class": "media_management.custom_log_handlers.DailyFileHandler",
         "base_filename": os.path.join(BASE_DIR, "logs/error/", "error_log"),
-        "when": "midnight",
         "backupCount": 30,
-        "formatter": "simple",
+        "formatter": "json",
         "encoding": "utf-8",
     },
 }
@@ -209,25 +215,148 @@ LOGGERS = {
     },
 }
 
-# Logging configuration
+# Logging configuration: the loggers above only enqueue records, a listener thread writes them.
+LOGGING_CONFIG = "media_management.custom_log_handlers.configure_logging"
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": FORMATTERS,
     "handlers": HANDLERS,
     "loggers": LOGGERS,
+    "queue": os.getenv('LOG_QUEUE', 'True') == 'True',
 }
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR + "/" + "media"
 
+# MEDIA_STORAGE=tiered publishes uploads, trims and merges to an object store (MEDIA_OBJECT_STORE; the
+# bundled LocalObjectStore keeps objects under MEDIA_OBJECT_STORE_ROOT) and keeps MEDIA_ROOT as a local
+# cache of at most MEDIA_HOT_CACHE_MAX_MB of them. Transfers move in MEDIA_TRANSFER_PART_MB parts on
+# MEDIA_TRANSFER_THREADS threads. The default keeps media on the local filesystem only.
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'filesystem')
+MEDIA_OBJECT_STORE = os.getenv('MEDIA_OBJECT_STORE', 'backends_engine.media_storage.LocalObjectStore')
+MEDIA_OBJECT_STORE_ROOT = os.getenv('MEDIA_OBJECT_STORE_ROOT', os.path.join(BASE_DIR, 'object_store'))
+MEDIA_HOT_CACHE_MAX_MB = float(os.getenv('MEDIA_HOT_CACHE_MAX_MB', 2048))
+MEDIA_TRANSFER_PART_MB = int(os.getenv('MEDIA_TRANSFER_PART_MB', 8))
+MEDIA_TRANSFER_THREADS = int(os.getenv('MEDIA_TRANSFER_THREADS', 4))
+STORAGES = {
+    "default": {
+        "BACKEND": (
+            "backends_engine.media_storage.TieredStorage"
+            if MEDIA_STORAGE == 'tiered'
+            else "django.core.files.storage.FileSystemStorage"
+        ),
+    },
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 # Settings for video upload limits
 MAX_VIDEO_SIZE_MB = os.getenv('MAX_VIDEO_SIZE_MB', 25)
 MIN_VIDEO_DURATION_SEC = os.getenv('MIN_VIDEO_DURATION_SEC', 5)
 MAX_VIDEO_DURATION_SEC = os.getenv('MAX_VIDEO_DURATION_SEC', 300)
 
+# Uploads to /videos/ are checked while they arrive: the byte count against MAX_VIDEO_SIZE_MB and the
+# first UPLOAD_SNIFF_KB for a video container header (and its duration, when the header is there).
+UPLOAD_SNIFF_KB = int(os.getenv('UPLOAD_SNIFF_KB', 256))
+
+# Default trim engine: "reencode" (full decode/encode), "copy" (keyframe cut, no re-encode)
+# or "accurate" (re-encode only the partial GOPs at both ends). Can be overridden per request.
+DEFAULT_TRIM_MODE = os.getenv('DEFAULT_TRIM_MODE', 'reencode')
+
+# Encoding profiles for re-encoded trims and merges, selectable per request with "profile". "threads"
+# caps encoder threads (None lets the encoder decide; the trim CPU budget may lower it further).
+ENCODING_PROFILES = {
+    'preview': {
+        'video_codec': 'libx264', 'preset': 'veryfast', 'crf': 28, 'threads': None,
+        'audio_codec': 'aac', 'audio_bitrate': '96k', 'pix_fmt': 'yuv420p',
+    },
+    'standard': {
+        'video_codec': 'libx264', 'preset': 'medium', 'crf': 23, 'threads': None,
+        'audio_codec': 'aac', 'audio_bitrate': '128k', 'pix_fmt': 'yuv420p',
+    },
+    'high': {
+        'video_codec': 'libx264', 'preset': 'slow', 'crf': 18, 'threads': None,
+        'audio_codec': 'aac', 'audio_bitrate': '192k', 'pix_fmt': 'yuv420p',
+    },
+}
+DEFAULT_ENCODING_PROFILE = os.getenv('DEFAULT_ENCODING_PROFILE', 'preview')
+
+# CPU budget for trim encodes in one process: ParallelTrimExecutor splits it between the number of
+# trim worker processes (at most MEDIA_TRIM_WORKERS; 1 keeps trims in-process) and encoder threads.
+MEDIA_CPU_BUDGET = int(os.getenv('MEDIA_CPU_BUDGET', os.cpu_count() or 1))
+MEDIA_TRIM_WORKERS = int(os.getenv('MEDIA_TRIM_WORKERS', 1))
+
+# Background processing: when enabled (or when a request sends "async": true) trims and merges are
+# queued as ProcessingJob rows and answered with 202; `manage.py run_media_worker` executes them.
+MEDIA_JOBS_ASYNC = os.getenv('MEDIA_JOBS_ASYNC', 'False') == 'True'
+MEDIA_WORKER_PROCESSES = int(os.getenv('MEDIA_WORKER_PROCESSES', 2))
+MEDIA_WORKER_POLL_INTERVAL_SEC = float(os.getenv('MEDIA_WORKER_POLL_INTERVAL_SEC', 1))
+# A worker renews the lease of its running jobs every MEDIA_JOB_HEARTBEAT_SEC. Jobs whose lease is older
+# than MEDIA_JOB_LEASE_SEC (their worker died) are requeued, or failed once claimed MEDIA_JOB_MAX_ATTEMPTS times.
+MEDIA_JOB_HEARTBEAT_SEC = float(os.getenv('MEDIA_JOB_HEARTBEAT_SEC', 30))
+MEDIA_JOB_LEASE_SEC = float(os.getenv('MEDIA_JOB_LEASE_SEC', 300))
+MEDIA_JOB_MAX_ATTEMPTS = int(os.getenv('MEDIA_JOB_MAX_ATTEMPTS', 3))
+
+# Derivation cache: identical trims/merges of the same content reuse the stored output. Least recently
+# used outputs are evicted once the cached files exceed DERIVATION_CACHE_MAX_MB.
+DERIVATION_CACHE_ENABLED = os.getenv('DERIVATION_CACHE_ENABLED', 'True') == 'True'
+DERIVATION_CACHE_MAX_MB = float(os.getenv('DERIVATION_CACHE_MAX_MB', 2048))
+
+# Shared video delivery. Set MEDIA_DELIVERY_OFFLOAD to "x-accel-redirect" (nginx, internal location at
+# MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or "x-sendfile" (Apache/lighttpd) to let the front
+# proxy send the bytes; otherwise Django streams the file in MEDIA_STREAM_CHUNK_SIZE chunks.
+MEDIA_DELIVERY_OFFLOAD = os.getenv('MEDIA_DELIVERY_OFFLOAD', '')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+MEDIA_STREAM_CHUNK_SIZE = int(os.getenv('MEDIA_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# HLS packaging of merged videos (fMP4 segments). Merges sent with "hls": true, or every merge when
+# HLS_AUTO_PACKAGE is on, queue a packaging job; renditions above the source height are skipped.
+HLS_AUTO_PACKAGE = os.getenv('HLS_AUTO_PACKAGE', 'False') == 'True'
+HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', 4))
+HLS_SEGMENT_MAX_AGE_SEC = int(os.getenv('HLS_SEGMENT_MAX_AGE_SEC', 24 * 60 * 60))
+HLS_RENDITIONS = [
+    {'name': '360p', 'height': 360, 'video_kbps': 800, 'audio_kbps': 96},
+    {'name': '720p', 'height': 720, 'video_kbps': 2800, 'audio_kbps': 128},
+]
+
+# Previews generated for every upload: a thumbnail and a sprite sheet of frames sampled every
+# PREVIEW_INTERVAL_SEC (widened so no sheet exceeds PREVIEW_MAX_TILES tiles) with a WebVTT index for
+# scrubbing. They are queued as a PREVIEW job unless the upload is sent with "async": false or
+# PREVIEW_JOBS_ASYNC is off, in which case they are generated inside the upload request.
+PREVIEW_ON_UPLOAD = os.getenv('PREVIEW_ON_UPLOAD', 'True') == 'True'
+PREVIEW_JOBS_ASYNC = os.getenv('PREVIEW_JOBS_ASYNC', 'True') == 'True'
+PREVIEW_INTERVAL_SEC = float(os.getenv('PREVIEW_INTERVAL_SEC', 5))
+PREVIEW_MAX_TILES = int(os.getenv('PREVIEW_MAX_TILES', 100))
+PREVIEW_TILE_WIDTH = int(os.getenv('PREVIEW_TILE_WIDTH', 160))
+PREVIEW_SPRITE_COLUMNS = int(os.getenv('PREVIEW_SPRITE_COLUMNS', 10))
+PREVIEW_IMAGE_FORMAT = os.getenv('PREVIEW_IMAGE_FORMAT', 'jpg')  # "jpg" or "webp"
+PREVIEW_IMAGE_QUALITY = int(os.getenv('PREVIEW_IMAGE_QUALITY', 80))
+THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', 480))
+
 SITE_URL = os.getenv('SITE_URL', 'http://127.0.0.1:8000')
 
+# Shared links expire LINK_MAX_AGE_MINUTES after they are generated unless the request asks for
+# another expiry (up to LINK_MAX_EXPIRY_MINUTES). Resolved links are cached per process for up to
+# LINK_CACHE_TTL_SEC, which also bounds how long a revocation made by another process takes to apply.
+LINK_MAX_AGE_MINUTES = float(os.getenv('link_max_age_minutes', 30))
+LINK_MAX_EXPIRY_MINUTES = float(os.getenv('LINK_MAX_EXPIRY_MINUTES', 7 * 24 * 60))
+LINK_CACHE_MAX_ENTRIES = int(os.getenv('LINK_CACHE_MAX_ENTRIES', 10000))
+LINK_CACHE_TTL_SEC = float(os.getenv('LINK_CACHE_TTL_SEC', 60))
+
+# Metrics served on /metrics. Set METRICS_DIR (emptied before the processes start) when the app runs
+# as several processes or alongside run_media_worker: each process writes its totals there every
+# METRICS_FLUSH_INTERVAL_SEC and a scrape adds them all up.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL_SEC = float(os.getenv('METRICS_FLUSH_INTERVAL_SEC', 5))
+
+# Requests are profiled when they carry an X-Profile header from `manage.py profiles sign` (valid for
+# PROFILING_TOKEN_MAX_AGE_SEC) or, at random, at PROFILING_SAMPLE_RATE (0 turns sampling off). The
+# newest PROFILING_MAX_PROFILES profiles are kept in PROFILING_DIR.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN_MAX_AGE_SEC = int(os.getenv('PROFILING_TOKEN_MAX_AGE_SEC', 60 * 60))
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', 100))
+
 # SMTP email backend
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"